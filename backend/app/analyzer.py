@@ -1,273 +1,343 @@
-from typing import Dict, List, Optional
-import pandas as pd
-import os
-from pathlib import Path
-
-
-def _find_column(df: pd.DataFrame, candidates: List[str]) -> Optional[str]:
-    """Try to find a column in df whose name matches any candidate (case-insensitive, substring).
-    Returns the matching column name or None."""
-    if df is None:
-        return None
-    cols = list(df.columns)
-    low_cols = [c.lower() for c in cols]
-    for cand in candidates:
-        lc = cand.lower()
-        # exact match
-        for i, c in enumerate(low_cols):
-            if c == lc:
-                return cols[i]
-        # contains
-        for i, c in enumerate(low_cols):
-            if lc in c:
-                return cols[i]
-    return None
-
-
-def _to_number(v: any) -> float:
-    try:
-        if pd.isna(v):
-            return 0.0
-        s = str(v).strip()
-        # remove commas and whitespace
-        s = s.replace(',', '').replace('\xa0', '').strip()
-        # handle parentheses for negative numbers
-        if s.startswith('(') and s.endswith(')'):
-            s = '-' + s[1:-1]
-        return float(s)
-    except Exception:
-        return 0.0
-
-
-class StockAnalyzer:
-    def __init__(self, data_path: str = None):
-        # Ưu tiên DATA_DIR từ env; nếu không có thì fallback
-        env_dir = os.getenv("DATA_DIR", "").strip()
-        if data_path:
-            self.data_path = data_path
-        elif env_dir:
-            self.data_path = os.path.abspath(env_dir) + os.sep
-        else:
-            repo_root = Path(__file__).resolve().parents[2]
-            public_dir = repo_root / "frontend" / "public"
-            if public_dir.exists():
-                self.data_path = str(public_dir.resolve()) + os.sep
-            else:
-                # Fallback 2: .../data/data_cleaned (giữ tương thích cũ)
-                self.data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'data_cleaned')) + os.sep
-
-        self.balance_sheet: Optional[pd.DataFrame] = None
-        self.income_statement: Optional[pd.DataFrame] = None
-        self.cash_flow: Optional[pd.DataFrame] = None
-        self.indicators: Optional[pd.DataFrame] = None
-        self.average_indicators: Optional[pd.DataFrame] = None
-        self.load_data()
-
-    def load_data(self):
-        """Load all necessary CSV files. Keeps DataFrames or raises a descriptive exception."""
-        try:
-            self.balance_sheet = pd.read_csv(os.path.join(self.data_path, 'Balance_sheet.csv'), encoding='utf-8-sig')
-            self.income_statement = pd.read_csv(os.path.join(self.data_path, 'Income_statement.csv'), encoding='utf-8-sig')
-            self.cash_flow = pd.read_csv(os.path.join(self.data_path, 'Cash_flow.csv'), encoding='utf-8-sig')
-            self.indicators = pd.read_csv(os.path.join(self.data_path, 'Indicators.csv'), encoding='utf-8-sig')
-            # Average_indicators là OPTIONAL
-            avg_path = os.path.join(self.data_path, 'Average_indicators.csv')
-            if os.path.exists(avg_path):
-                self.average_indicators = pd.read_csv(avg_path, encoding='utf-8-sig')
-            else:
-                self.average_indicators = None
-        except FileNotFoundError as e:
-            raise Exception(f"Data file not found: {e.filename}")
-        except Exception as e:
-            raise Exception(f"Error loading data: {str(e)}")
-
-    def _select_rows_by_symbol(self, df: pd.DataFrame, symbol: str) -> pd.DataFrame:
-        """Return rows matching symbol using a fuzzy column detection for the 'symbol' column."""
-        if df is None:
-            raise Exception("Dataframe is not loaded")
-        sym_col = _find_column(df, ['symbol', 'ma', 'mã', 'ticker', 'code'])
-        if not sym_col:
-            raise Exception("Không tìm thấy cột mã cổ phiếu (symbol) trong dữ liệu.")
-        mask = df[sym_col].astype(str).str.upper().str.strip() == symbol.upper().strip()
-        result = df[mask]
-        return result
-
-    def get_stock_metrics(self, symbol: str) -> Dict:
-        """Return a dict of metrics or raise a descriptive exception."""
-        if not symbol:
-            raise Exception("Symbol is empty")
-        try:
-            valuation = self._get_valuation_metrics(symbol)
-            growth = self._get_growth_metrics(symbol)
-            performance = self._get_performance_metrics(symbol)
-            financial_health = self._get_financial_health_metrics(symbol)
-            dividend = self._get_dividend_metrics(symbol)
-
-            return {
-                'valuation': valuation,
-                'growth': growth,
-                'performance': performance,
-                'financial_health': financial_health,
-                'dividend': dividend,
-            }
-        except Exception as e:
-            # bubble up with symbol context
-            raise Exception(f"Error analyzing stock {symbol}: {str(e)}")
-
-    def _get_valuation_metrics(self, symbol: str) -> Dict:
-        if self.indicators is None or self.average_indicators is None:
-            raise Exception('Indicators data not loaded')
-
-        rows = self._select_rows_by_symbol(self.indicators, symbol)
-        if rows.empty:
-            raise Exception(f'No indicators data found for symbol {symbol}')
-        stock_indicators = rows.iloc[-1]
-
-        # try to find sector column
-        sector_col = _find_column(self.indicators, ['sector', 'industry', 'nganh'])
-        sector_val = stock_indicators[sector_col] if sector_col and sector_col in stock_indicators else None
-
-        # find pe/pb columns
-        pe_col = _find_column(self.indicators, ['p/e', 'pe', 'price to earnings', 'pe_ratio'])
-        pb_col = _find_column(self.indicators, ['p/b', 'pb', 'price to book', 'pb_ratio'])
-
-        industry_rows = None
-        if sector_val is not None and not pd.isna(sector_val):
-            sector_col_avg = _find_column(self.average_indicators, ['sector', 'industry', 'nganh'])
-            if sector_col_avg:
-                industry_rows = self.average_indicators[self.average_indicators[sector_col_avg].astype(str).str.strip().str.lower() == str(sector_val).strip().lower()]
-
-        industry_avg = industry_rows.iloc[-1] if industry_rows is not None and not industry_rows.empty else None
-
-        return {
-            'pe_ratio': float(_to_number(stock_indicators.get(pe_col, 0))) if pe_col else 0.0,
-            'pb_ratio': float(_to_number(stock_indicators.get(pb_col, 0))) if pb_col else 0.0,
-            'industry_pe': float(_to_number(industry_avg.get('Average P/E', 0))) if industry_avg is not None and 'Average P/E' in industry_avg else 0.0,
-            'industry_pb': float(_to_number(industry_avg.get('Average P/B', 0))) if industry_avg is not None and 'Average P/B' in industry_avg else 0.0,
-        }
-
-    def _get_growth_metrics(self, symbol: str) -> Dict:
-        if self.income_statement is None:
-            raise Exception('Income statement data not loaded')
-        rows = self._select_rows_by_symbol(self.income_statement, symbol)
-        if rows.empty:
-            return {'revenue_growth': 0.0, 'eps_growth': 0.0}
-
-        revenue_col = _find_column(self.income_statement, ['revenue', 'doanh thu', 'doanh thu thuần', 'net revenue'])
-        eps_col = _find_column(self.income_statement, ['eps', 'earnings per share', 'lãi cơ bản trên cổ phiếu'])
-
-        revenue_growth = self._calculate_growth_rate(rows, revenue_col) if revenue_col else 0.0
-        eps_growth = self._calculate_growth_rate(rows, eps_col) if eps_col else 0.0
-
-        return {'revenue_growth': revenue_growth, 'eps_growth': eps_growth}
-
-    def _get_performance_metrics(self, symbol: str) -> Dict:
-        if self.indicators is None:
-            raise Exception('Indicators data not loaded')
-        rows = self._select_rows_by_symbol(self.indicators, symbol)
-        if rows.empty:
-            return {'roe': 0.0, 'roa': 0.0, 'profit_margin': 0.0}
-
-        recent = rows.iloc[-1]
-        roe_col = _find_column(self.indicators, ['roe', 'return on equity'])
-        roa_col = _find_column(self.indicators, ['roa', 'return on assets'])
-        pm_col = _find_column(self.indicators, ['profit margin', 'margin'])
-
-        return {
-            'roe': float(_to_number(recent.get(roe_col, 0))),
-            'roa': float(_to_number(recent.get(roa_col, 0))),
-            'profit_margin': float(_to_number(recent.get(pm_col, 0)))
-        }
-
-    def _get_financial_health_metrics(self, symbol: str) -> Dict:
-        # Ưu tiên lấy từ Indicators (thường có sẵn tỉ số)
-        if self.indicators is not None:
-            rows = self._select_rows_by_symbol(self.indicators, symbol)
-            if not rows.empty:
-                recent = rows.iloc[-1]
-                dte_col_ind = _find_column(self.indicators, ['debt to equity', 'debt/equity', 'debt_equity', 'nợ/vốn', 'd/e'])
-                cr_col_ind  = _find_column(self.indicators, ['current ratio', 'liquidity', 'current_ratio', 'khả năng thanh toán', 'thanh khoản hiện hành'])
-                dte = float(_to_number(recent.get(dte_col_ind, 0))) if dte_col_ind else 0.0
-                cr  = float(_to_number(recent.get(cr_col_ind, 0))) if cr_col_ind else 0.0
-                if dte or cr:
-                    return {'debt_to_equity': dte, 'current_ratio': cr}
-
-            # Fallback Balance_sheet (nếu Indicators không có)
-            if self.balance_sheet is None:
-                return {'debt_to_equity': 0.0, 'current_ratio': 0.0}
-            rows_bs = self._select_rows_by_symbol(self.balance_sheet, symbol)
-            if rows_bs.empty:
-                return {'debt_to_equity': 0.0, 'current_ratio': 0.0}
-
-            recent_bs = rows_bs.iloc[-1]
-            dte_col_bs = _find_column(self.balance_sheet, ['debt to equity', 'debt/equity', 'debt_equity', 'nợ/vốn', 'd/e'])
-            cr_col_bs  = _find_column(self.balance_sheet, ['current ratio', 'liquidity', 'current_ratio', 'khả năng thanh toán', 'thanh khoản hiện hành'])
-
-            return {
-                'debt_to_equity': float(_to_number(recent_bs.get(dte_col_bs, 0))) if dte_col_bs else 0.0,
-                'current_ratio': float(_to_number(recent_bs.get(cr_col_bs, 0))) if cr_col_bs else 0.0
-            }
-
-
-    def _get_dividend_metrics(self, symbol: str) -> Dict:
-        if self.indicators is None:
-            raise Exception('Indicators data not loaded')
-        rows = self._select_rows_by_symbol(self.indicators, symbol)
-        if rows.empty:
-            return {'dividend_yield': 0.0, 'payout_ratio': 0.0}
-
-        recent = rows.iloc[-1]
-        dy_col = _find_column(self.indicators, ['dividend yield', 'yield', 'dividend'])
-        pr_col = _find_column(self.indicators, ['payout ratio', 'payout', 'payout_ratio'])
-
-        return {
-            'dividend_yield': float(_to_number(recent.get(dy_col, 0))) if dy_col else 0.0,
-            'payout_ratio': float(_to_number(recent.get(pr_col, 0))) if pr_col else 0.0
-        }
-
-    def _calculate_growth_rate(self, data: pd.DataFrame, column: Optional[str]) -> float:
-        """Calculate year-over-year growth between last two rows for the given column."""
-        try:
-            if column is None:
-                return 0.0
-            series = data[column].dropna().map(_to_number)
-            series = series[series.map(lambda v: isinstance(v, (int, float)))]
-            series = series.astype(float)
-            if len(series) < 2:
-                return 0.0
-            latest = series.iloc[-1]
-            previous = series.iloc[-2]
-            if previous == 0:
-                return 0.0
-            return ((latest - previous) / abs(previous)) * 100.0
-        except Exception:
-            return 0.0
-
-    def generate_analysis_prompt(self, metrics: Dict) -> str:
-        """Tạo prompt để gửi cho Gemini"""
-        prompt = f"""Hãy phân tích cổ phiếu này dựa trên các chỉ số sau và đưa ra đánh giá tổng quan:
-
-1. Định giá:
-- P/E: {metrics['valuation'].get('pe_ratio', 0):.2f} (Trung bình ngành: {metrics['valuation'].get('industry_pe', 0):.2f})
-- P/B: {metrics['valuation'].get('pb_ratio', 0):.2f} (Trung bình ngành: {metrics['valuation'].get('industry_pb', 0):.2f})
-
-2. Tăng trưởng:
-- Tăng trưởng doanh thu: {metrics['growth'].get('revenue_growth', 0):.2f}%
-- Tăng trưởng EPS: {metrics['growth'].get('eps_growth', 0):.2f}%
-
-3. Hiệu quả hoạt động:
-- ROE: {metrics['performance'].get('roe', 0):.2f}%
-- ROA: {metrics['performance'].get('roa', 0):.2f}%
-- Biên lợi nhuận: {metrics['performance'].get('profit_margin', 0):.2f}%
-
-4. Sức khỏe tài chính:
-- Tỷ lệ nợ/vốn chủ sở hữu: {metrics['financial_health'].get('debt_to_equity', 0):.2f}
-- Tỷ lệ thanh toán hiện hành: {metrics['financial_health'].get('current_ratio', 0):.2f}
-
-5. Cổ tức:
-- Tỷ suất cổ tức: {metrics['dividend'].get('dividend_yield', 0):.2f}%
-- Tỷ lệ chi trả: {metrics['dividend'].get('payout_ratio', 0):.2f}%
-
-Hãy đánh giá dựa trên 5 khía cạnh trên và đưa ra kết luận tổng quan về cổ phiếu này. Phân tích chi tiết điểm mạnh, điểm yếu và rủi ro tiềm ẩn. Cuối cùng, đưa ra khuyến nghị đầu tư."""
-
+from typing import Dict, List, Optional
+import json
+import pandas as pd
+import os
+from pathlib import Path
+
+from .columnar import read_arrays, read_frame, write_arrays, write_frame
+from .datastore import clean_numeric, load_table, parse_numbers
+from .datastore import find_column as _find_column
+from .fundamentals import FundamentalsStore, build_arrays as build_fundamentals
+from .risk_aggregates import load_stock_info
+from .screener import MetricPanel, Screener, build_panel
+from .sectors import SECTOR_CANDIDATES, YEAR_CANDIDATES, SectorStats, sector_averages, sector_key
+from .sectors import build_arrays as build_sector_stats
+from .telemetry import stage
+
+
+STATEMENT_FRAMES = ['balance_sheet', 'income_statement', 'cash_flow', 'indicators']
+SYMBOL_CANDIDATES = ['symbol', 'ma', 'mã', 'ticker', 'code']
+DTE_CANDIDATES = ['debt to equity', 'debt/equity', 'debt_equity', 'nợ/vốn', 'd/e']
+CR_CANDIDATES = ['current ratio', 'liquidity', 'current_ratio', 'khả năng thanh toán', 'thanh khoản hiện hành']
+
+# Cấu trúc dict trả về của get_stock_metrics: nhóm → các cột của metrics_table
+METRIC_GROUPS = {
+    'valuation': ['pe_ratio', 'pb_ratio', 'industry_pe', 'industry_pb'],
+    'growth': ['revenue_growth', 'eps_growth'],
+    'performance': ['roe', 'roa', 'profit_margin'],
+    'financial_health': ['debt_to_equity', 'current_ratio'],
+    'dividend': ['dividend_yield', 'payout_ratio'],
+}
+
+
+def _num(s: pd.Series) -> pd.Series:
+    """Cột → float, NaN = 0. Các bảng đã được chuẩn hoá số lúc load nên thường chỉ cần fillna."""
+    return parse_numbers(s).fillna(0.0)
+
+
+def _prepare_statement(df: pd.DataFrame) -> pd.DataFrame:
+    """Chạy 1 lần lúc chuyển CSV → cache: cột số dạng text ("1,234", "(56)", NBSP...) → float64."""
+    keep = [c for c in (_find_column(df, SYMBOL_CANDIDATES), _find_column(df, SECTOR_CANDIDATES)) if c]
+    return clean_numeric(df, keep=keep)
+
+
+# tăng khi đổi _prepare_statement / clean_numeric → bỏ cache dạng cột cũ
+STATEMENT_PREP_VERSION = 1
+
+
+class StockAnalyzer:
+    def __init__(self, data_path: str = None, snapshot_dir: Optional[Path] = None):
+        # Ưu tiên DATA_DIR từ env; nếu không có thì fallback
+        env_dir = os.getenv("DATA_DIR", "").strip()
+        if data_path:
+            self.data_path = data_path
+        elif env_dir:
+            self.data_path = os.path.abspath(env_dir) + os.sep
+        else:
+            repo_root = Path(__file__).resolve().parents[2]
+            public_dir = repo_root / "frontend" / "public"
+            if public_dir.exists():
+                self.data_path = str(public_dir.resolve()) + os.sep
+            else:
+                # Fallback 2: .../data/data_cleaned (giữ tương thích cũ)
+                self.data_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'data_cleaned')) + os.sep
+
+        self.balance_sheet: Optional[pd.DataFrame] = None
+        self.income_statement: Optional[pd.DataFrame] = None
+        self.cash_flow: Optional[pd.DataFrame] = None
+        self.indicators: Optional[pd.DataFrame] = None
+        self.average_indicators: Optional[pd.DataFrame] = None
+        self.screener: Optional[Screener] = None
+        self.fundamentals: Optional[FundamentalsStore] = None
+        self.sectors: Optional[SectorStats] = None
+        self.stock_info: Optional[pd.DataFrame] = None
+        if snapshot_dir is not None:
+            # worker của app.serve: chỉ gắn bảng chỉ số loader đã dựng, không đọc CSV
+            self._attach_snapshot(Path(snapshot_dir))
+        else:
+            self.load_data()
+
+    # ---------------- Snapshot dùng chung (nhiều worker) ----------------
+    def save_snapshot(self, path: Path):
+        """Ghi các bảng dựng sẵn phục vụ request (metrics_table) cho worker khác mmap lại."""
+        if self.metrics_table is not None:
+            write_frame(self.metrics_table.rename_axis('symbol').reset_index(), path / 'metrics')
+        if self.screener is not None:
+            write_arrays(self.screener.panel.arrays(), path / 'screener')
+        if self.fundamentals is not None:
+            write_arrays(self.fundamentals.arrays(), path / 'fundamentals')
+        if self.sectors is not None:
+            write_arrays(self.sectors.arrays(), path / 'sectors')
+        path.mkdir(parents=True, exist_ok=True)
+        with open(path / 'meta.json', 'w', encoding='utf-8') as f:
+            json.dump({'data_path': self.data_path, 'metrics_error': self._metrics_error}, f, ensure_ascii=False)
+
+    def _attach_snapshot(self, path: Path):
+        with stage("analyzer.snapshot_attach"):
+            with open(path / 'meta.json', encoding='utf-8') as f:
+                meta = json.load(f)
+            self.metrics_table = None
+            self._metrics = {}
+            self._sym_keys = {}
+            self._metrics_error = meta['metrics_error']
+            if (path / 'metrics').exists():
+                self._set_metrics(read_frame(path / 'metrics').set_index('symbol'))
+            self.screener = Screener(MetricPanel(read_arrays(path / 'screener'))) if (path / 'screener').exists() else None
+            fund = path / 'fundamentals'
+            self.fundamentals = FundamentalsStore(read_arrays(fund)) if fund.exists() else None
+            if self.screener is not None and (path / 'sectors').exists():
+                self.sectors = SectorStats(self.screener.panel, read_arrays(path / 'sectors'))
+
+    def load_data(self):
+        """Load all necessary CSV files. Keeps DataFrames or raises a descriptive exception."""
+        # CSV được chuyển 1 lần sang cache dạng cột (app/datastore.py), các lần sau đọc mmap;
+        # cột số dạng text được chuẩn hoá thành float ngay lúc chuyển (_prepare_statement)
+        read_kwargs = {'encoding': 'utf-8-sig'}
+
+        def load(name: str) -> pd.DataFrame:
+            return load_table(
+                os.path.join(self.data_path, name), _prepare_statement,
+                version=STATEMENT_PREP_VERSION, read_kwargs=read_kwargs,
+            )
+
+        with stage("analyzer.load"):
+            try:
+                self.balance_sheet = load('Balance_sheet.csv')
+                self.income_statement = load('Income_statement.csv')
+                self.cash_flow = load('Cash_flow.csv')
+                self.indicators = load('Indicators.csv')
+                # Average_indicators là OPTIONAL
+                avg_path = os.path.join(self.data_path, 'Average_indicators.csv')
+                if os.path.exists(avg_path):
+                    self.average_indicators = load('Average_indicators.csv')
+                else:
+                    self.average_indicators = None
+                # ngành của mã (Indicators không có cột ngành)
+                self.stock_info = load_stock_info(self.data_path)
+            except FileNotFoundError as e:
+                raise Exception(f"Data file not found: {e.filename}")
+            except Exception as e:
+                raise Exception(f"Error loading data: {str(e)}")
+
+        with stage("analyzer.index"):
+            self._build_index()
+            self._resolve_columns()
+        with stage("analyzer.metrics"):
+            self._build_metrics()
+        with stage("analyzer.screener"):
+            self._build_screener()
+        with stage("analyzer.fundamentals"):
+            frames = {name: getattr(self, name) for name in STATEMENT_FRAMES}
+            self.fundamentals = FundamentalsStore(build_fundamentals(frames))
+
+    # ---------------- Index & metrics table (dựng 1 lần lúc load) ----------------
+    def _build_index(self):
+        """Resolve cột mã cổ phiếu của từng bảng 1 lần (mã đã chuẩn hoá theo dòng)."""
+        self._sym_keys: Dict[str, pd.Series] = {}
+        for name in STATEMENT_FRAMES:
+            df = getattr(self, name)
+            sym_col = _find_column(df, SYMBOL_CANDIDATES)
+            if df is None or not sym_col:
+                continue
+            key = df[sym_col].astype(str).str.upper().str.strip()
+            self._sym_keys[name] = key
+
+    def _resolve_columns(self):
+        """Fuzzy-match tên cột 1 lần (thay vì mỗi request)."""
+        ind, inc, bs = self.indicators, self.income_statement, self.balance_sheet
+        self._cols: Dict[str, Optional[str]] = {
+            'year': _find_column(ind, YEAR_CANDIDATES),
+            'pe': _find_column(ind, ['p/e', 'pe', 'price to earnings', 'pe_ratio']),
+            'pb': _find_column(ind, ['p/b', 'pb', 'price to book', 'pb_ratio']),
+            'revenue': _find_column(inc, ['revenue', 'doanh thu', 'doanh thu thuần', 'net revenue']),
+            'eps': _find_column(inc, ['eps', 'earnings per share', 'lãi cơ bản trên cổ phiếu']),
+            'roe': _find_column(ind, ['roe', 'return on equity']),
+            'roa': _find_column(ind, ['roa', 'return on assets']),
+            'profit_margin': _find_column(ind, ['profit margin', 'margin']),
+            'dte_ind': _find_column(ind, DTE_CANDIDATES),
+            'cr_ind': _find_column(ind, CR_CANDIDATES),
+            'dte_bs': _find_column(bs, DTE_CANDIDATES),
+            'cr_bs': _find_column(bs, CR_CANDIDATES),
+            'dividend_yield': _find_column(ind, ['dividend yield', 'yield', 'dividend']),
+            'payout_ratio': _find_column(ind, ['payout ratio', 'payout', 'payout_ratio']),
+        }
+
+    def _last_rows(self, name: str) -> pd.DataFrame:
+        """Dòng cuối cùng của mỗi symbol (giống rows.iloc[-1]), index = symbol."""
+        df = getattr(self, name)
+        key = self._sym_keys[name]
+        last = ~key.duplicated(keep='last').to_numpy()
+        out = df[last]
+        out.index = key[last].to_numpy()
+        return out
+
+    def _growth_table(self, column: Optional[str]) -> pd.Series:
+        """Tăng trưởng YoY giữa 2 giá trị (khác NaN) cuối cùng của mỗi symbol, theo %."""
+        if column is None or 'income_statement' not in self._sym_keys:
+            return pd.Series(dtype=float)
+        raw = self.income_statement[column]
+        keep = raw.notna().to_numpy()
+        t = pd.DataFrame({
+            'k': self._sym_keys['income_statement'][keep].to_numpy(),
+            'v': _num(raw[keep]).to_numpy(),
+        })
+        g = t.groupby('k', sort=False).tail(2).groupby('k', sort=False)['v']
+        latest, previous, n = g.last(), g.first(), g.size()
+        ok = (n >= 2) & (previous != 0)
+        growth = ((latest - previous) / previous.abs()) * 100.0
+        return growth.where(ok, 0.0)
+
+    def _build_metrics(self):
+        """Tính toàn bộ metrics cho mọi symbol trong 1 lượt vectorized → bảng + dict tra cứu."""
+        self.metrics_table: Optional[pd.DataFrame] = None
+        self._metrics: Dict[str, Dict] = {}
+        self._metrics_error: Optional[str] = None
+        if self.indicators is None or self.average_indicators is None:
+            self._metrics_error = 'Indicators data not loaded'
+            return
+        if 'indicators' not in self._sym_keys:
+            self._metrics_error = "Không tìm thấy cột mã cổ phiếu (symbol) trong dữ liệu."
+            return
+
+        c = self._cols
+        ind = self._last_rows('indicators')
+        t = pd.DataFrame(index=ind.index)
+
+        def col(frame: pd.DataFrame, name: Optional[str]) -> pd.Series:
+            if not name:
+                return pd.Series(0.0, index=frame.index)
+            return _num(frame[name])
+
+        # Định giá
+        t['pe_ratio'] = col(ind, c['pe'])
+        t['pb_ratio'] = col(ind, c['pb'])
+        # TB ngành cùng năm: ngành theo Stock_info, tra Average_indicators theo (ngành, năm)
+        t['industry_pe'] = 0.0
+        t['industry_pb'] = 0.0
+        avg = sector_averages(self.average_indicators, {'industry_pe': ['p/e', 'pe'], 'industry_pb': ['p/b', 'pb']})
+        if avg is not None and c['year'] and self.stock_info is not None and len(self.stock_info):
+            sector = pd.Series(t.index, index=t.index).map(self.stock_info.set_index('ticker')['sector'])
+            key = sector_key(sector, pd.to_numeric(ind[c['year']], errors='coerce').astype('Int64'))
+            for out_col in ('industry_pe', 'industry_pb'):
+                if out_col in avg.columns:
+                    t[out_col] = key.map(avg[out_col]).fillna(0.0)
+
+        # Tăng trưởng
+        t['revenue_growth'] = self._growth_table(c['revenue']).reindex(t.index).fillna(0.0)
+        t['eps_growth'] = self._growth_table(c['eps']).reindex(t.index).fillna(0.0)
+
+        # Hiệu quả hoạt động
+        t['roe'] = col(ind, c['roe'])
+        t['roa'] = col(ind, c['roa'])
+        t['profit_margin'] = col(ind, c['profit_margin'])
+
+        # Sức khỏe tài chính: ưu tiên Indicators, fallback Balance_sheet
+        dte, cr = col(ind, c['dte_ind']), col(ind, c['cr_ind'])
+        from_ind = (dte != 0) | (cr != 0)
+        if 'balance_sheet' in self._sym_keys:
+            bs = self._last_rows('balance_sheet')
+            dte_bs = col(bs, c['dte_bs']).reindex(t.index).fillna(0.0)
+            cr_bs = col(bs, c['cr_bs']).reindex(t.index).fillna(0.0)
+        else:
+            dte_bs = cr_bs = pd.Series(0.0, index=t.index)
+        t['debt_to_equity'] = dte.where(from_ind, dte_bs)
+        t['current_ratio'] = cr.where(from_ind, cr_bs)
+
+        # Cổ tức
+        t['dividend_yield'] = col(ind, c['dividend_yield'])
+        t['payout_ratio'] = col(ind, c['payout_ratio'])
+
+        self._set_metrics(t.astype(float))
+
+    def _build_screener(self):
+        """Bảng (symbol, năm) dạng mảng cho bộ lọc toàn thị trường (app/screener.py)."""
+        frames = {name: getattr(self, name) for name in STATEMENT_FRAMES}
+        panel = MetricPanel(build_panel(frames, self.stock_info, self.average_indicators))
+        self.screener = Screener(panel)
+        with stage("analyzer.sectors"):
+            self.sectors = SectorStats(panel, build_sector_stats(panel))
+
+    def _set_metrics(self, t: pd.DataFrame):
+        """Bảng chỉ số (index = symbol) + dict tra cứu theo symbol."""
+        t.index.name = None
+        self.metrics_table = t
+        self._metrics = {
+            sym: {
+                group: {m: float(row[m]) for m in names}
+                for group, names in METRIC_GROUPS.items()
+            }
+            for sym, row in zip(t.index, t.to_dict('records'))
+        }
+
+    def get_stock_metrics(self, symbol: str) -> Dict:
+        """Return a dict of metrics or raise a descriptive exception."""
+        if not symbol:
+            raise Exception("Symbol is empty")
+        if self._metrics_error:
+            raise Exception(f"Error analyzing stock {symbol}: {self._metrics_error}")
+        metrics = self._metrics.get(symbol.upper().strip())
+        if metrics is None:
+            raise Exception(f"Error analyzing stock {symbol}: No indicators data found for symbol {symbol}")
+        # copy để caller sửa thoải mái mà không đụng bảng dùng chung
+        return {group: dict(values) for group, values in metrics.items()}
+
+    def get_stock_metrics_many(self, symbols: List[str]) -> Dict[str, Dict]:
+        """Bulk lookup: {SYMBOL: metrics} cho các symbol có dữ liệu (symbol thiếu bị bỏ qua)."""
+        if self._metrics_error:
+            raise Exception(self._metrics_error)
+        out: Dict[str, Dict] = {}
+        for symbol in symbols:
+            key = str(symbol).upper().strip()
+            metrics = self._metrics.get(key)
+            if metrics is not None:
+                out[key] = {group: dict(values) for group, values in metrics.items()}
+        return out
+
+    def generate_analysis_prompt(self, metrics: Dict) -> str:
+        """Tạo prompt để gửi cho Gemini"""
+        prompt = f"""Hãy phân tích cổ phiếu này dựa trên các chỉ số sau và đưa ra đánh giá tổng quan:
+
+1. Định giá:
+- P/E: {metrics['valuation'].get('pe_ratio', 0):.2f} (Trung bình ngành: {metrics['valuation'].get('industry_pe', 0):.2f})
+- P/B: {metrics['valuation'].get('pb_ratio', 0):.2f} (Trung bình ngành: {metrics['valuation'].get('industry_pb', 0):.2f})
+
+2. Tăng trưởng:
+- Tăng trưởng doanh thu: {metrics['growth'].get('revenue_growth', 0):.2f}%
+- Tăng trưởng EPS: {metrics['growth'].get('eps_growth', 0):.2f}%
+
+3. Hiệu quả hoạt động:
+- ROE: {metrics['performance'].get('roe', 0):.2f}%
+- ROA: {metrics['performance'].get('roa', 0):.2f}%
+- Biên lợi nhuận: {metrics['performance'].get('profit_margin', 0):.2f}%
+
+4. Sức khỏe tài chính:
+- Tỷ lệ nợ/vốn chủ sở hữu: {metrics['financial_health'].get('debt_to_equity', 0):.2f}
+- Tỷ lệ thanh toán hiện hành: {metrics['financial_health'].get('current_ratio', 0):.2f}
+
+5. Cổ tức:
+- Tỷ suất cổ tức: {metrics['dividend'].get('dividend_yield', 0):.2f}%
+- Tỷ lệ chi trả: {metrics['dividend'].get('payout_ratio', 0):.2f}%
+
+Hãy đánh giá dựa trên 5 khía cạnh trên và đưa ra kết luận tổng quan về cổ phiếu này. Phân tích chi tiết điểm mạnh, điểm yếu và rủi ro tiềm ẩn. Cuối cùng, đưa ra khuyến nghị đầu tư."""
+
         return prompt
\ No newline at end of file
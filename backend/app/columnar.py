@@ -0,0 +1,113 @@
+# app/columnar.py
+
+from __future__ import annotations
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# Lưu DataFrame dạng cột: mỗi cột 1 file .npy + meta.json
+#   - số   → lưu nguyên dtype
+#   - ngày → int64 (giữ đơn vị datetime64 gốc trong meta)
+#   - chuỗi → mã int32 + mảng categories (unicode cố định)
+# Đọc lại bằng np.load(mmap_mode="c") → gần như zero-copy.
+# =========================================================
+META_FILE = "meta.json"
+
+
+def _col_file(i: int, suffix: str = "") -> str:
+    return f"c{i:03d}{suffix}.npy"
+
+
+def write_frame(df: pd.DataFrame, path: str | Path) -> None:
+    """Ghi df vào thư mục path (ghi ra thư mục tạm rồi rename để atomic)."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+
+    cols: list[dict] = []
+    for i, name in enumerate(df.columns):
+        s = df[name]
+        if pd.api.types.is_datetime64_any_dtype(s.dtype):
+            arr = s.to_numpy()
+            np.save(tmp / _col_file(i), arr.view("int64"))
+            cols.append({"name": name, "kind": "datetime", "dtype": str(arr.dtype)})
+        elif isinstance(s.dtype, pd.api.extensions.ExtensionDtype) and pd.api.types.is_numeric_dtype(s.dtype):
+            # Int64 / Float64 / boolean (nullable) → float64, NA → NaN
+            np.save(tmp / _col_file(i), s.to_numpy(dtype="float64", na_value=np.nan))
+            cols.append({"name": name, "kind": "numeric"})
+        elif pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_numeric_dtype(s.dtype):
+            np.save(tmp / _col_file(i), s.to_numpy())
+            cols.append({"name": name, "kind": "numeric"})
+        else:
+            codes, cats = pd.factorize(s, sort=True)
+            np.save(tmp / _col_file(i), codes.astype("int32"))
+            np.save(tmp / _col_file(i, "_cats"), np.asarray(cats, dtype=str))
+            cols.append({"name": name, "kind": "category"})
+
+    with open(tmp / META_FILE, "w", encoding="utf-8") as f:
+        json.dump({"n_rows": int(len(df)), "columns": cols}, f, ensure_ascii=False)
+
+    if path.exists():
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        # tiến trình khác vừa ghi cùng đích → giữ bản đó
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def read_frame(path: str | Path, mmap: bool = True, categorical: bool = False) -> pd.DataFrame:
+    """
+    Đọc lại DataFrame đã ghi bằng write_frame.
+    mmap=True: cột số map thẳng từ file ở chế độ copy-on-write ("c") →
+    đọc không copy, ghi vào (nếu có) chỉ sửa bản riêng trong RAM, không đụng file.
+    categorical=True: cột chuỗi trả về dạng pd.Categorical (mã int + categories)
+    thay vì mảng object → không tạo 1 object str cho mỗi dòng.
+    """
+    path = Path(path)
+    with open(path / META_FILE, encoding="utf-8") as f:
+        meta = json.load(f)
+
+    mode = "c" if mmap else None
+    data: dict[int, object] = {}
+    for i, c in enumerate(meta["columns"]):
+        arr = np.load(path / _col_file(i), mmap_mode=mode)
+        if c["kind"] == "datetime":
+            data[i] = np.asarray(arr).view(c["dtype"])
+        elif c["kind"] == "category":
+            cats = np.load(path / _col_file(i, "_cats")).astype(object)
+            codes = np.asarray(arr)
+            if categorical:
+                data[i] = pd.Categorical.from_codes(codes, categories=cats)
+                continue
+            vals = cats[np.where(codes < 0, 0, codes)] if len(cats) else np.full(len(codes), None, dtype=object)
+            vals[codes < 0] = None
+            data[i] = vals
+        else:
+            data[i] = np.asarray(arr)  # ndarray view trên vùng mmap, không copy
+    # key theo vị trí rồi mới đặt tên → giữ được cả cột trùng tên
+    df = pd.DataFrame(data, index=pd.RangeIndex(meta["n_rows"]), copy=False)
+    df.columns = [c["name"] for c in meta["columns"]]
+    return df
+
+
+def write_arrays(arrays: dict[str, np.ndarray], path: str | Path) -> None:
+    """Ghi các mảng NumPy rời (chỉ mục dựng sẵn...) vào thư mục path, mỗi mảng 1 file .npy."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(path / f"{name}.npy", np.asarray(arr))
+
+
+def read_arrays(path: str | Path, mmap: bool = True) -> dict[str, np.ndarray]:
+    """Đọc lại write_arrays; mmap=True → map chỉ đọc ("r"), dùng chung page cache giữa các process."""
+    mode = "r" if mmap else None
+    return {p.stem: np.load(p, mmap_mode=mode) for p in sorted(Path(path).glob("*.npy"))}
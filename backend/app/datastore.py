@@ -0,0 +1,190 @@
+# app/datastore.py
+
+from __future__ import annotations
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .columnar import META_FILE, read_frame, write_frame
+from .telemetry import REGISTRY, stage
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Lớp dữ liệu dùng chung cho StockAnalyzer + risk engine:
+#   CSV nguồn → (đọc + chuẩn hoá 1 lần) → cache dạng cột .npy
+#   → các lần sau đọc bằng mmap, không parse text.
+# Cache bị vô hiệu khi size/mtime của file nguồn, read_kwargs
+# hoặc (tên, version) của hàm chuẩn hoá thay đổi.
+# =========================================================
+CACHE_VERSION = 1
+
+DATA_CACHE = REGISTRY.counter("data_cache_total", "Số lần đọc CSV qua cache dạng cột (result=hit|miss)")
+
+Transform = Callable[[pd.DataFrame], pd.DataFrame]
+
+
+def default_cache_root() -> Path:
+    """DATA_CACHE_DIR nếu có, mặc định backend/.cache/data."""
+    env_dir = (os.getenv("DATA_CACHE_DIR") or "").strip()
+    if env_dir:
+        return Path(env_dir)
+    return Path(__file__).resolve().parents[1] / ".cache" / "data"
+
+
+def cache_enabled() -> bool:
+    return os.getenv("DATA_CACHE", "1") != "0"
+
+
+def _short_hash(obj: object) -> str:
+    raw = json.dumps(obj, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha1(raw).hexdigest()[:12]
+
+
+def _cache_prefix(src: Path) -> str:
+    # 1 prefix / file nguồn (theo đường dẫn tuyệt đối) → dọn được bản cũ
+    return f"{src.stem}-{_short_hash(str(src.resolve()))[:8]}-"
+
+
+def _cache_dir(src: Path, tag: dict, root: Path) -> Path:
+    st = src.stat()
+    sig = _short_hash({
+        "cache_version": CACHE_VERSION,
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        **tag,
+    })
+    return root / f"{_cache_prefix(src)}{sig}"
+
+
+def _prune(root: Path, prefix: str, keep: Path) -> None:
+    """Xoá các bản cache cũ của cùng file nguồn."""
+    for d in root.glob(f"{prefix}*"):
+        if d != keep and d.is_dir():
+            shutil.rmtree(d, ignore_errors=True)
+
+
+def load_table(
+    path: str | Path,
+    transform: Transform | None = None,
+    version: int | str = 0,
+    read_kwargs: dict | None = None,
+    cache_root: str | Path | None = None,
+) -> pd.DataFrame:
+    """
+    Đọc 1 CSV qua cache dạng cột.
+
+    transform: hàm chuẩn hoá (đổi tên cột, ép kiểu...) chạy đúng 1 lần lúc
+    chuyển đổi; kết quả của nó là thứ được cache. Đổi logic của transform
+    thì tăng `version` để bỏ cache cũ.
+    """
+    src = Path(path)
+    if not src.exists():
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), str(src))
+    read_kwargs = read_kwargs or {}
+
+    def convert() -> pd.DataFrame:
+        with stage(f"csv.parse.{src.stem}"):
+            df = pd.read_csv(src, **read_kwargs)
+            return transform(df) if transform is not None else df
+
+    if not cache_enabled():
+        return convert()
+
+    root = Path(cache_root) if cache_root else default_cache_root()
+    tag = {
+        "transform": getattr(transform, "__qualname__", None),
+        "version": version,
+        "read_kwargs": read_kwargs,
+    }
+    d = _cache_dir(src, tag, root)
+    if (d / META_FILE).exists():
+        try:
+            with stage(f"csv.cache_read.{src.stem}"):
+                df = read_frame(d)
+            DATA_CACHE.inc(result="hit")
+            return df
+        except Exception as e:
+            logger.warning("Cache hỏng %s, đọc lại CSV: %s", d, e)
+
+    DATA_CACHE.inc(result="miss")
+    df = convert()
+    try:
+        write_frame(df, d)
+        _prune(root, _cache_prefix(src), d)
+        return read_frame(d)
+    except OSError as e:
+        logger.warning("Không ghi được cache cho %s: %s", src, e)
+        return df
+
+
+def find_column(df: Optional[pd.DataFrame], candidates: list[str]) -> Optional[str]:
+    """Try to find a column in df whose name matches any candidate (case-insensitive, substring).
+    Returns the matching column name or None."""
+    if df is None:
+        return None
+    cols = list(df.columns)
+    low_cols = [c.lower() for c in cols]
+    for cand in candidates:
+        lc = cand.lower()
+        # exact match
+        for i, c in enumerate(low_cols):
+            if c == lc:
+                return cols[i]
+        # contains
+        for i, c in enumerate(low_cols):
+            if lc in c:
+                return cols[i]
+    return None
+
+
+# =========================================================
+# Chuẩn hoá cột số dạng text (1 lần lúc chuyển CSV → cache, không parse lúc request)
+#   "1,234.5" / "1 234" / "1\xa0234" → 1234.5 ; "(1,234)" → -1234 (âm kiểu kế toán)
+#   ô rỗng / không phải số → NaN
+# =========================================================
+_NUM_NOISE = "[\\s,\u00a0\u202f]"  # khoảng trắng (kể cả NBSP), dấu phân cách nghìn
+_NUM_PATTERN = r"[+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?|[+-]?(?:inf|infinity|nan)"
+
+
+def parse_numbers(s: pd.Series) -> pd.Series:
+    """Cột text → float64 bằng phép chuỗi vectorized (cột đã là số thì chỉ ép kiểu)."""
+    if pd.api.types.is_bool_dtype(s.dtype) or pd.api.types.is_numeric_dtype(s.dtype):
+        return pd.Series(s.to_numpy(dtype="float64", na_value=np.nan), index=s.index, name=s.name)
+    t = s.astype("string").str.replace(_NUM_NOISE, "", regex=True)
+    neg = t.str.startswith("(", na=False) & t.str.endswith(")", na=False)
+    t = t.where(~neg, "-" + t.str.slice(1, -1))
+    try:
+        out = t.astype("float64")  # nhanh: mọi ô đều là số (hoặc NA)
+    except (TypeError, ValueError):
+        ok = t.str.fullmatch(_NUM_PATTERN, case=False, na=False).to_numpy(dtype=bool)
+        out = pd.Series(np.nan, index=s.index)
+        out[ok] = t[ok].astype("float64")
+    return pd.Series(out.to_numpy(dtype="float64", na_value=np.nan), index=s.index, name=s.name)
+
+
+def clean_numeric(df: pd.DataFrame, keep: Iterable[str] = (), min_share: float = 0.5) -> pd.DataFrame:
+    """
+    Đổi mọi cột text "trông như số" (>= min_share ô khác rỗng parse được) sang float64.
+    Cột trong `keep` (mã, ngành...) giữ nguyên.
+    """
+    keep = set(keep)
+    for c in df.columns:
+        s = df[c]
+        if c in keep or pd.api.types.is_numeric_dtype(s.dtype) or pd.api.types.is_datetime64_any_dtype(s.dtype):
+            continue
+        filled = s.notna() & s.astype("string").str.strip().ne("")
+        if not filled.any():
+            continue
+        parsed = parse_numbers(s)
+        if parsed[filled.to_numpy(dtype=bool)].notna().mean() >= min_share:
+            df[c] = parsed
+    return df
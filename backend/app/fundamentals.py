@@ -0,0 +1,176 @@
+# app/fundamentals.py
+
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .datastore import find_column
+from .screener import METRICS, SYMBOL_CANDIDATES, YEAR_CANDIDATES
+
+# =========================================================
+# Chuỗi thời gian báo cáo tài chính theo mã (dựng 1 lần lúc load)
+#   - gộp mọi cột số của Balance_sheet / Income_statement / Cash_flow / Indicators
+#     theo (mã, năm), sort theo mã rồi năm → các năm của 1 mã là 1 đoạn liên tiếp
+#     [offsets[i], offsets[i+1]) của ma trận values (dòng × trường)
+#   - yoy (%) tính sẵn cho cả ma trận bằng 1 phép dịch dòng (chỉ khi cùng mã,
+#     năm liền trước); CAGR của khoảng năm được hỏi tính trên đoạn đã cắt
+#   - request = tra dict mã → đoạn, cắt dòng + chọn cột, không lọc DataFrame
+# =========================================================
+# ngoài tên cột gốc, ?fields= nhận tên ngắn của app/screener.py (METRICS: pe, roe, revenue...)
+DEFAULT_FIELDS = ['revenue', 'net_income', 'eps', 'roe', 'pe', 'total_assets', 'equity', 'operating_cf']
+
+
+def build_arrays(frames: dict[str, Optional[pd.DataFrame]]) -> dict[str, np.ndarray]:
+    """
+    Các bảng báo cáo → dict mảng phẳng: 'symbols' + 'offsets' (đoạn dòng của từng mã),
+    'year', 'fields' (tên cột đã bỏ khoảng trắng thừa), 'values' / 'yoy' (dòng × trường, float64),
+    'alias.names' / 'alias.field' (tên ngắn → vị trí trường).
+    """
+    panel = None
+    fields: list[str] = []
+    aliases: dict[str, str] = {}
+    for table, df in frames.items():
+        if df is None:
+            continue
+        sym, year = find_column(df, SYMBOL_CANDIDATES), find_column(df, YEAR_CANDIDATES)
+        if not sym or not year:
+            continue
+        part = {'symbol': df[sym].astype(str).str.upper().str.strip().to_numpy(),
+                'year': pd.to_numeric(df[year], errors='coerce').to_numpy()}
+        for c in df.columns:
+            name = str(c).strip()
+            if c in (sym, year) or name.lower().startswith('unnamed') or name in fields:
+                continue
+            if not pd.api.types.is_numeric_dtype(df[c]):
+                continue
+            part[name] = df[c].to_numpy(dtype='float64')
+            fields.append(name)
+        for alias, (src, candidates) in METRICS.items():
+            col = find_column(df, candidates) if src == table else None
+            if col and str(col).strip() in part:
+                aliases[alias] = str(col).strip()
+        part = pd.DataFrame(part).dropna(subset=['year'])
+        part['year'] = part['year'].astype('int64')
+        part = part.drop_duplicates(['symbol', 'year'], keep='last')
+        panel = part if panel is None else panel.merge(part, on=['symbol', 'year'], how='outer')
+    if panel is None:
+        panel = pd.DataFrame({'symbol': pd.Series(dtype=object), 'year': pd.Series(dtype='int64')})
+    panel = panel.sort_values(['symbol', 'year'], kind='mergesort').reset_index(drop=True)
+
+    sym = panel['symbol'].to_numpy(dtype=str)
+    year = panel['year'].to_numpy(dtype='int32')
+    values = np.ascontiguousarray(panel[fields].to_numpy(dtype='float64')).reshape(len(panel), len(fields))
+
+    # yoy: dòng trước cùng mã và đúng năm liền trước
+    yoy = np.full_like(values, np.nan)
+    if len(panel) > 1:
+        ok = (sym[1:] == sym[:-1]) & (year[1:] - year[:-1] == 1)
+        cur, prev = values[1:][ok], values[:-1][ok]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            yoy[1:][ok] = np.where(prev != 0, (cur - prev) / np.abs(prev) * 100.0, np.nan)
+
+    starts = np.flatnonzero(np.r_[True, sym[1:] != sym[:-1]]) if len(sym) else np.arange(0)
+    names = list(aliases)
+    return {
+        'symbols': sym[starts],
+        'offsets': np.r_[starts, len(sym)].astype(np.int64),
+        'year': year,
+        'fields': np.asarray(fields, dtype=str),
+        'values': values,
+        'yoy': yoy,
+        'alias.names': np.asarray(names, dtype=str),
+        'alias.field': np.asarray([fields.index(aliases[n]) for n in names], dtype=np.int32),
+    }
+
+
+def parse_years(spec: str | None) -> tuple[int, int] | list[int] | None:
+    """"2019-2024" → (2019, 2024); "2021,2023" → [2021, 2023]; None/"" → mọi năm."""
+    if not spec or not spec.strip():
+        return None
+    try:
+        if '-' in spec:
+            lo, hi = (int(x) for x in spec.split('-', 1))
+            return (min(lo, hi), max(lo, hi))
+        return sorted({int(x) for x in spec.split(',') if x.strip()})
+    except ValueError:
+        raise ValueError(f"years không hợp lệ: {spec!r} (vd. 2019-2024 hoặc 2021,2023)") from None
+
+
+def _clean(col: np.ndarray) -> list:
+    return [None if not np.isfinite(x) else round(float(x), 6) for x in col]
+
+
+class FundamentalsStore:
+    """Tra chuỗi nhiều năm theo mã trên mảng của build_arrays (hoặc mmap từ snapshot)."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self._arrays = arrays
+        self.year = arrays['year']
+        self.values = arrays['values']
+        self.yoy = arrays['yoy']
+        self.offsets = arrays['offsets']
+        self.fields = [str(x) for x in arrays['fields']]
+        self.sym_pos = {str(s): i for i, s in enumerate(arrays['symbols'])}
+        self.field_pos = {f.lower(): i for i, f in enumerate(self.fields)}
+        for name, i in zip(arrays['alias.names'], arrays['alias.field']):
+            self.field_pos.setdefault(str(name).lower(), int(i))
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return self._arrays
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(a.nbytes for a in self._arrays.values()))
+
+    def resolve_fields(self, fields: list[str] | None) -> list[tuple[str, int]]:
+        """Tên trường (tên ngắn hoặc tên cột gốc, không phân biệt hoa thường) → (tên, vị trí cột)."""
+        names = fields or [f for f in DEFAULT_FIELDS if f in self.field_pos]
+        out = []
+        for name in names:
+            pos = self.field_pos.get(name.strip().lower())
+            if pos is None:
+                raise ValueError(f"Không có trường '{name}'")
+            out.append((name.strip(), pos))
+        return out
+
+    def get(self, symbol: str, fields: list[tuple[str, int]], years=None) -> Optional[dict]:
+        """Chuỗi của 1 mã dạng cột: years + values / yoy theo trường + cagr (%) của khoảng năm trả về."""
+        i = self.sym_pos.get(symbol.upper().strip())
+        if i is None:
+            return None
+        a, b = int(self.offsets[i]), int(self.offsets[i + 1])
+        yrs = self.year[a:b]
+        if isinstance(years, tuple):
+            rows = np.arange(a + np.searchsorted(yrs, years[0]), a + np.searchsorted(yrs, years[1], side='right'))
+        elif years is not None:
+            rows = a + np.flatnonzero(np.isin(yrs, years))
+        else:
+            rows = np.arange(a, b)
+        cols = np.array([p for _, p in fields], dtype=np.int64)
+        vals = self.values[np.ix_(rows, cols)]
+        growth = self.yoy[np.ix_(rows, cols)]
+        return {
+            'symbol': symbol.upper().strip(),
+            'years': self.year[rows].tolist(),
+            'values': {name: _clean(vals[:, j]) for j, (name, _) in enumerate(fields)},
+            'yoy': {name: _clean(growth[:, j]) for j, (name, _) in enumerate(fields)},
+            'cagr': dict(zip((n for n, _ in fields), _clean(_cagr(vals, self.year[rows])))),
+        }
+
+
+def _cagr(vals: np.ndarray, years: np.ndarray) -> np.ndarray:
+    """CAGR (%) từng cột giữa năm đầu và năm cuối có dữ liệu dương (NaN nếu không đủ 2 năm)."""
+    if not len(vals):
+        return np.full(vals.shape[1], np.nan)
+    pos = np.isfinite(vals) & (vals > 0)
+    n = len(vals)
+    first = np.argmax(pos, axis=0)
+    last = n - 1 - np.argmax(pos[::-1], axis=0)
+    cols = np.arange(vals.shape[1])
+    span = (years[last] - years[first]).astype('float64')
+    ok = pos.any(axis=0) & (span > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = (np.power(vals[last, cols] / vals[first, cols], 1.0 / span) - 1.0) * 100.0
+    return np.where(ok, out, np.nan)
@@ -0,0 +1,268 @@
+# app/llm.py
+
+from __future__ import annotations
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator
+
+from .telemetry import STAGE_SECONDS, stage
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+# =========================================================
+# Lớp gọi LLM cho /api/ai/diagnose
+#   - cache theo nội dung (hash model + prompt): LRU + TTL trong RAM,
+#     thêm tầng đĩa tuỳ chọn (LLM_CACHE_DIR)
+#   - single-flight: nhiều request cùng prompt đang chạy → chỉ 1 lần gọi
+#     (cả generate lẫn stream: stream trùng prompt nhận chung chunk của lời gọi đầu)
+#   - giới hạn số lời gọi đồng thời (semaphore)
+#   - lời gọi SDK (đồng bộ) chạy trong thread → không chặn event loop
+# `model` chỉ cần có generate_content(prompt, stream=False) trả object có
+# `.text` (stream=True: iterable các chunk có `.text`) → test được với
+# model giả chạy local.
+# =========================================================
+class LLMClient:
+    def __init__(
+        self,
+        model,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+        max_concurrency: int | None = None,
+        disk_dir: str | Path | None = None,
+    ):
+        self.model = model
+        self.model_name = str(getattr(model, "model_name", type(model).__name__))
+        self.ttl = float(ttl if ttl is not None else os.getenv("LLM_CACHE_TTL", "21600"))
+        self.max_entries = int(max_entries if max_entries is not None else os.getenv("LLM_CACHE_SIZE", "512"))
+        disk = disk_dir if disk_dir is not None else (os.getenv("LLM_CACHE_DIR") or "").strip()
+        self.disk_dir = Path(disk) if disk else None
+
+        self._mem: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _Broadcast] = {}   # stream đang chạy theo key (cùng task trong _inflight)
+        self._sem = asyncio.Semaphore(
+            int(max_concurrency if max_concurrency is not None else os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        )
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    # ---------------- cache ----------------
+    def key(self, prompt: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _mem_get(self, key: str) -> str | None:
+        item = self._mem.get(key)
+        if item is None:
+            return None
+        expires, text = item
+        if expires < time.time():
+            del self._mem[key]
+            return None
+        self._mem.move_to_end(key)
+        return text
+
+    def _mem_put(self, key: str, text: str, created: float | None = None) -> None:
+        self._mem[key] = ((created or time.time()) + self.ttl, text)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str) -> tuple[float, str] | None:
+        if self.disk_dir is None:
+            return None
+        p = self._disk_path(key)
+        try:
+            with open(p, encoding="utf-8") as f:
+                item = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if item["created"] + self.ttl < time.time():
+            p.unlink(missing_ok=True)
+            return None
+        return item["created"], item["text"]
+
+    def _disk_put(self, key: str, text: str) -> None:
+        if self.disk_dir is None:
+            return
+        p = self._disk_path(key)
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            tmp = p.with_suffix(f".tmp-{os.getpid()}")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"created": time.time(), "model": self.model_name, "text": text}, f, ensure_ascii=False)
+            os.replace(tmp, p)
+        except OSError as e:
+            logger.warning("Không ghi được LLM cache %s: %s", p, e)
+
+    def cached(self, prompt: str) -> str | None:
+        """Câu trả lời đã cache (RAM rồi đĩa) hoặc None."""
+        key = self.key(prompt)
+        text = self._mem_get(key)
+        if text is not None:
+            self.stats["hits"] += 1
+            return text
+        item = self._disk_get(key)
+        if item is not None:
+            created, text = item
+            self._mem_put(key, text, created)
+            self.stats["disk_hits"] += 1
+            return text
+        return None
+
+    def store(self, prompt: str, text: str) -> None:
+        key = self.key(prompt)
+        self._mem_put(key, text)
+        self._disk_put(key, text)
+
+    # ---------------- gọi model ----------------
+    async def _call(self, prompt: str) -> str:
+        async with self._sem:
+            with stage("llm.generate"):  # round trip Gemini (không tính thời gian chờ semaphore)
+                response = await asyncio.to_thread(self.model.generate_content, prompt)
+        return response.text
+
+    async def _run(self, key: str, prompt: str) -> str:
+        try:
+            text = await self._call(prompt)
+            self.store(prompt, text)  # ghi cache trước khi rời in-flight → không có khe gọi trùng
+            return text
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def generate(self, prompt: str) -> str:
+        text = self.cached(prompt)
+        if text is not None:
+            return text
+
+        key = self.key(prompt)
+        task = self._inflight.get(key)
+        if task is None:
+            self.stats["misses"] += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._run(key, prompt))
+        else:
+            self.stats["coalesced"] += 1
+        # shield: 1 client huỷ request không huỷ lời gọi mà client khác đang chờ
+        return await asyncio.shield(task)
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """
+        Trả câu trả lời theo từng chunk ngay khi model sinh ra.
+        Cache hit (hoặc đang có lời gọi không-stream cùng prompt) → 1 chunk duy nhất.
+        Đang có stream cùng prompt → nhận lại các chunk đã sinh rồi theo tiếp stream đó
+        (không gọi model lần nữa). Xong stream thì ghi toàn văn vào cache như generate().
+        """
+        text = self.cached(prompt)
+        if text is not None:
+            yield text
+            return
+        key = self.key(prompt)
+        b = self._streams.get(key)
+        if b is None:
+            task = self._inflight.get(key)
+            if task is not None:
+                self.stats["coalesced"] += 1
+                yield await asyncio.shield(task)
+                return
+            self.stats["misses"] += 1
+            b = self._streams[key] = _Broadcast()
+            # lời gọi chạy ở task riêng: client đầu tiên ngắt kết nối không dừng
+            # stream mà client khác đang theo; generate() cùng prompt chờ toàn văn
+            task = self._inflight[key] = asyncio.ensure_future(self._run_stream(key, prompt, b))
+            task.add_done_callback(_consume_result)
+        else:
+            self.stats["coalesced"] += 1
+        async for piece in b.subscribe():
+            yield piece
+
+    async def _run_stream(self, key: str, prompt: str, b: "_Broadcast") -> str:
+        loop = asyncio.get_running_loop()
+
+        def produce() -> None:
+            # chạy trong thread: đẩy từng chunk về event loop
+            for chunk in self.model.generate_content(prompt, stream=True):
+                try:
+                    piece = chunk.text
+                except ValueError:
+                    continue  # chunk không có text (vd. chỉ có finish_reason)
+                loop.call_soon_threadsafe(b.publish, piece)
+
+        try:
+            # giữ permit tới khi thread sinh chunk kết thúc (kể cả khi mọi client đã rời)
+            # → số lời gọi model đồng thời không vượt max_concurrency
+            async with self._sem:
+                b.t0 = time.perf_counter()
+                await loop.run_in_executor(None, produce)
+                STAGE_SECONDS.observe(time.perf_counter() - b.t0, stage="llm.stream")
+            text = "".join(b.parts)
+            self.store(prompt, text)
+            b.finish()
+            return text
+        except BaseException as e:
+            self.stats["errors"] += 1
+            b.finish(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+            self._streams.pop(key, None)
+
+
+def _consume_result(task: asyncio.Future) -> None:
+    """Lỗi của task stream đã chuyển cho subscriber → không log 'exception never retrieved'."""
+    if not task.cancelled():
+        task.exception()
+
+
+class _Broadcast:
+    """Chunk của 1 lời gọi stream đang chạy, phát cho mọi subscriber (vào muộn thì phát lại từ đầu)."""
+
+    def __init__(self):
+        self.parts: list[str] = []
+        self.error: BaseException | None = None
+        self.finished = False
+        self.t0 = time.perf_counter()
+        self._subs: set[asyncio.Queue] = set()
+
+    def publish(self, piece: str) -> None:
+        if not self.parts:
+            STAGE_SECONDS.observe(time.perf_counter() - self.t0, stage="llm.stream_first_chunk")
+        self.parts.append(piece)
+        for q in self._subs:
+            q.put_nowait(piece)
+
+    def finish(self, error: BaseException | None = None) -> None:
+        self.finished, self.error = True, error
+        for q in self._subs:
+            q.put_nowait(_DONE)
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        q: asyncio.Queue = asyncio.Queue()
+        for piece in self.parts:
+            q.put_nowait(piece)
+        if self.finished:
+            q.put_nowait(_DONE)
+        else:
+            self._subs.add(q)
+        try:
+            while True:
+                item = await q.get()
+                if item is _DONE:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield item
+        finally:
+            self._subs.discard(q)
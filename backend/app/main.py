@@ -1,79 +1,659 @@
-from fastapi import FastAPI, HTTPException, Query
-from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-import pandas as pd
-import google.generativeai as genai
-from dotenv import load_dotenv
-import os
-from .analyzer import StockAnalyzer
-from .risk_engine import get_engine
-
-# Load environment variables
-load_dotenv()
-
-# Configure API
-app = FastAPI()
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Cho phép tất cả origins trong môi trường development
-    allow_credentials=False,  # Đặt False khi allow_origins=["*"]
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Configure Gemini
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash-lite')
-
-# Initialize StockAnalyzer
-analyzer = StockAnalyzer(data_path=os.getenv("DATA_DIR"))
-
-class StockRequest(BaseModel):
-    symbol: str
-
-@app.post("/api/ai/diagnose")
-async def analyze_stock(request: StockRequest):
-    try:
-        # Get stock metrics
-        metrics = analyzer.get_stock_metrics(request.symbol)
-        
-        # Generate analysis prompt
-        prompt = analyzer.generate_analysis_prompt(metrics)
-        
-        # Get response from Gemini
-        response = model.generate_content(prompt)
-        
-        # Return the analysis
-        return {"answer": response.text}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-
-# =========================
-#  Manipulation Watch V1
-# =========================
-
-@app.get("/api/risk/score")
-async def risk_score(
-    ticker: str = Query(..., description="Mã cổ phiếu, ví dụ VCB"),
-    date: str | None = Query(None, description="YYYY-MM-DD (optional)")
-):
-    eng = get_engine()
-    return eng.score(ticker, date)
-
-@app.get("/api/risk/history")
-async def risk_history(
-    ticker: str = Query(...),
-    days: int = Query(180, ge=1, le=1000)
-):
-    eng = get_engine()
-    return eng.history(ticker, days)
-
-@app.get("/api/risk/top")
-async def risk_top(
-    date: str = Query(..., description="YYYY-MM-DD"),
-    k: int = Query(50, ge=1, le=500)
-):
-    eng = get_engine()
-    return {"date": date, "top": eng.top(date, k)}
\ No newline at end of file
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket
+from fastapi.exceptions import RequestValidationError
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from starlette.exceptions import HTTPException as StarletteHTTPException
+from pydantic import BaseModel, Field
+import pandas as pd
+import google.generativeai as genai
+from dotenv import load_dotenv
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import re
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from .analyzer import StockAnalyzer
+from .datastore import DATA_CACHE
+from .fundamentals import parse_years
+from .llm import LLMClient
+from . import snapshot
+from .pubsub import sse as _sse
+from .risk_engine import (
+    SIMILAR_MAX_K,
+    EngineWarming,
+    ManipulationWatchV1,
+    attach_snapshot,
+    engine_status,
+    get_engine,
+    install_engine,
+    reload_engine,
+    start_warmup,
+)
+from .risk_alerts import AlertFeed, Watch
+from .risk_live import LiveRiskService
+from .telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Dựng risk engine ở background thread → server nhận request ngay,
+    # các endpoint /api/risk/* trả 503 "warming" cho tới khi engine sẵn sàng.
+    if os.getenv("RISK_WARMUP", "1") != "0":
+        start_warmup()
+    tasks = [asyncio.create_task(alerts.run())]
+    if live is not None:
+        tasks.append(asyncio.create_task(live.run()))
+    if SNAPSHOT_ROOT is not None:
+        tasks.append(asyncio.create_task(_follow_snapshot(SNAPSHOT_ROOT)))
+    yield
+    for t in tasks:
+        t.cancel()
+
+
+# Configure API
+app = FastAPI(lifespan=lifespan)
+
+# Configure CORS
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],  # Cho phép tất cả origins trong môi trường development
+    allow_credentials=False,  # Đặt False khi allow_origins=["*"]
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# =========================
+#  Instrumentation
+# =========================
+HTTP_SECONDS = REGISTRY.histogram("http_request_seconds", "Latency theo endpoint (route template, method)")
+HTTP_REQUESTS = REGISTRY.counter("http_requests_total", "Số request theo endpoint và status")
+
+# Profiling theo request: bật PROFILE_REQUESTS=1 rồi gửi header `X-Profile: 1`
+# → cProfile của request được ghi ra PROFILE_DIR (mở bằng snakeviz / pstats),
+# đường dẫn trả về ở header X-Profile-Report, top 25 hàm in ra log.
+PROFILE_REQUESTS = os.getenv("PROFILE_REQUESTS", "0") == "1"
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR") or Path(tempfile.gettempdir()) / "gulliver-profiles")
+
+
+def _dump_profile(prof: cProfile.Profile, method: str, route: str) -> str:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_")
+    path = PROFILE_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{method}-{slug}-{uuid.uuid4().hex[:6]}.prof"
+    prof.dump_stats(path)
+    buf = io.StringIO()
+    pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(25)
+    logger.info("Profile %s %s → %s\n%s", method, route, path, buf.getvalue())
+    return str(path)
+
+
+class InstrumentedRoute(APIRoute):
+    """
+    Route đo latency mọi endpoint (histogram theo route template, không theo URL
+    thật → số series cố định). Các endpoint đều là async nên cProfile bật trên
+    thread event loop bắt được toàn bộ phần xử lý của request (kể cả code của
+    request khác chạy xen kẽ trong lúc await — chỉ dùng khi debug).
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        route, method = self.path, ",".join(sorted(self.methods or []))
+
+        async def instrumented(request: Request) -> Response:
+            prof = None
+            if PROFILE_REQUESTS and request.headers.get("x-profile"):
+                prof = cProfile.Profile()
+                prof.enable()
+            t = time.perf_counter()
+            status = 500
+            report = None
+            try:
+                response = await handler(request)
+                status = response.status_code
+            except StarletteHTTPException as e:
+                status = e.status_code
+                raise
+            except RequestValidationError:
+                status = 422
+                raise
+            finally:
+                HTTP_SECONDS.observe(time.perf_counter() - t, method=method, route=route)
+                HTTP_REQUESTS.inc(method=method, route=route, status=status)
+                if prof is not None:
+                    prof.disable()
+                    report = _dump_profile(prof, method, route)
+            if report is not None:
+                response.headers["X-Profile-Report"] = report
+            return response
+
+        return instrumented
+
+
+app.router.route_class = InstrumentedRoute
+
+# Configure Gemini
+genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+model = genai.GenerativeModel('gemini-2.5-flash-lite')
+# Cache + coalescing + giới hạn đồng thời, gọi SDK trong thread (xem app/llm.py)
+llm = LLMClient(model)
+
+# Initialize StockAnalyzer
+# Worker của `python -m app.serve` (SNAPSHOT_ROOT): gắn bảng loader đã dựng,
+# theo dõi CURRENT và đổi engine + analyzer sang thế hệ mới cùng lúc.
+SNAPSHOT_ROOT = snapshot.attached_root()
+SNAPSHOT_POLL = float(os.getenv("SNAPSHOT_POLL", "1.0"))
+if SNAPSHOT_ROOT is not None:
+    _snapshot_gen = snapshot.current(SNAPSHOT_ROOT)
+    if _snapshot_gen is None:
+        raise RuntimeError(f"Chưa có snapshot trong {SNAPSHOT_ROOT} (chạy qua `python -m app.serve`)")
+    analyzer = StockAnalyzer(snapshot_dir=SNAPSHOT_ROOT / _snapshot_gen / "analyzer")
+else:
+    _snapshot_gen = None
+    analyzer = StockAnalyzer(data_path=os.getenv("DATA_DIR"))
+
+
+async def _follow_snapshot(root: Path) -> None:
+    global analyzer, _snapshot_gen
+    while True:
+        await asyncio.sleep(SNAPSHOT_POLL)
+        gen = snapshot.current(root)
+        if gen is None or gen == _snapshot_gen:
+            continue
+        try:
+            eng = await asyncio.to_thread(attach_snapshot, root, gen)
+            an = await asyncio.to_thread(StockAnalyzer, snapshot_dir=root / gen / "analyzer")
+        except Exception:  # thế hệ bị dọn giữa chừng... → thử lại ở vòng sau
+            logger.exception("Không gắn được snapshot %s", gen)
+            continue
+        install_engine(eng)
+        analyzer, _snapshot_gen = an, gen
+        logger.info("Đã chuyển sang snapshot %s", gen)
+
+
+def _ratio(hit: float, total: float) -> float | None:
+    return hit / total if total else None
+
+
+@REGISTRY.collector
+def _app_gauges():
+    """Gauge tính lúc scrape: cache hit ratio, RAM risk engine / analyzer."""
+    st = llm.stats
+    llm_hit = st["hits"] + st["disk_hits"] + st["coalesced"]
+    data_hit, data_miss = DATA_CACHE.value(result="hit"), DATA_CACHE.value(result="miss")
+    gauges = [
+        ("llm_cache_events", "Sự kiện cache LLM (hits, disk_hits, misses, coalesced, errors)",
+         [({"event": k}, float(v)) for k, v in st.items()]),
+        ("llm_cache_hit_ratio", "Tỉ lệ request LLM không phải gọi model (RAM, đĩa hoặc dùng chung)",
+         [({}, _ratio(llm_hit, llm_hit + st["misses"]))]),
+        ("llm_cache_entries", "Số câu trả lời trong cache RAM", [({}, float(len(llm._mem)))]),
+        ("data_cache_hit_ratio", "Tỉ lệ đọc CSV trúng cache dạng cột",
+         [({}, _ratio(data_hit, data_hit + data_miss))]),
+        ("analyzer_symbols", "Số mã có bảng chỉ số dựng sẵn",
+         [({}, float(len(getattr(analyzer, "_metrics", {}) or {})))]),
+    ]
+    try:
+        eng = get_engine(block=False)
+    except EngineWarming:
+        eng = None
+    gauges.append(("risk_engine_ready", "1 nếu risk engine đang phục vụ", [({}, float(eng is not None))]))
+    if eng is not None:
+        gauges += [
+            ("risk_engine_bytes", "Bộ nhớ risk engine theo thành phần (model = kích thước serialize)",
+             [({"part": k}, float(v)) for k, v in eng.memory_usage().items()]),
+            ("risk_scores_rows", "Số dòng (ticker, ngày) đã chấm", [({}, float(len(eng.scores)))]),
+        ]
+    return gauges
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+class StockRequest(BaseModel):
+    symbol: str
+
+@app.post("/api/ai/diagnose")
+async def analyze_stock(request: StockRequest):
+    try:
+        # Get stock metrics
+        metrics = analyzer.get_stock_metrics(request.symbol)
+        
+        # Generate analysis prompt
+        prompt = analyzer.generate_analysis_prompt(metrics)
+        
+        # Get response from Gemini (cached / coalesced, không chặn event loop)
+        answer = await llm.generate(prompt)
+        
+        # Return the analysis
+        return {"answer": answer}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/ai/diagnose/stream")
+async def analyze_stock_stream(request: StockRequest):
+    """
+    Bản streaming (SSE) của /api/ai/diagnose:
+      event: metrics → dict chỉ số (gửi ngay, trước khi gọi Gemini)
+      event: chunk   → {"text": ...} từng đoạn câu trả lời
+      event: done | error
+    """
+    try:
+        metrics = analyzer.get_stock_metrics(request.symbol)
+        prompt = analyzer.generate_analysis_prompt(metrics)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        yield _sse("metrics", metrics)
+        try:
+            async for chunk in llm.stream(prompt):
+                yield _sse("chunk", {"text": chunk})
+        except Exception as e:
+            yield _sse("error", {"detail": str(e)})
+            return
+        yield _sse("done", {})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+class StockBatchRequest(BaseModel):
+    symbols: list[str]
+
+@app.post("/api/metrics:batch")
+async def stock_metrics_batch(request: StockBatchRequest):
+    try:
+        metrics = analyzer.get_stock_metrics_many(request.symbols)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    missing = [s for s in request.symbols if s.upper().strip() not in metrics]
+    return {"metrics": metrics, "missing": missing}
+
+def _split_fields(fields: str | None) -> list[str] | None:
+    """"pe, roe" → ["pe", "roe"]; rỗng → None (dùng mặc định)."""
+    out = [f.strip() for f in (fields or "").split(",") if f.strip()]
+    return out or None
+
+@app.get("/api/screener")
+async def screener(
+    filter: str | None = Query(None, description='vd. "pe < sector_pe and roe > 15 and revenue_growth > 10 and de < 1"'),
+    sort: str | None = Query(None, description='vd. "-roe, pe" hoặc "roe desc, pe asc"'),
+    year: int | None = Query(None, description="Năm báo cáo (mặc định năm mới nhất của từng mã)"),
+    fields: str | None = Query(None, description="Các chỉ số trả về, phân tách bằng dấu phẩy"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    if analyzer.screener is None:
+        raise HTTPException(status_code=503, detail="Screener chưa sẵn sàng")
+    try:
+        return analyzer.screener.screen(filter, sort, year, _split_fields(fields), offset, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def _fundamentals_query(fields: str | list[str] | None, years: str | None):
+    """Store + (trường đã resolve, khoảng năm) hoặc 503 / 422."""
+    store = analyzer.fundamentals
+    if store is None:
+        raise HTTPException(status_code=503, detail="Fundamentals chưa sẵn sàng")
+    if isinstance(fields, str):
+        fields = [f for f in fields.split(",") if f.strip()]
+    try:
+        return store, store.resolve_fields(fields or None), parse_years(years)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@app.get("/api/fundamentals/{symbol}")
+async def fundamentals(
+    symbol: str,
+    fields: str | None = Query(None, description="vd. revenue,net_income,roe hoặc tên cột gốc; mặc định nhóm chỉ số chính"),
+    years: str | None = Query(None, description="2019-2024 hoặc 2021,2023 (mặc định mọi năm)"),
+):
+    store, cols, yrs = _fundamentals_query(fields, years)
+    out = store.get(symbol, cols, yrs)
+    if out is None:
+        raise HTTPException(status_code=404, detail=f"Không có dữ liệu cho mã {symbol.upper().strip()}")
+    return out
+
+def _sector_stats():
+    if analyzer.sectors is None:
+        raise HTTPException(status_code=503, detail="Bảng ngành chưa sẵn sàng")
+    return analyzer.sectors
+
+@app.get("/api/peers/{symbol}")
+async def peers(
+    symbol: str,
+    year: int | None = Query(None, description="Năm báo cáo (mặc định năm mới nhất của mã)"),
+    fields: str | None = Query(None, description="vd. pe,roe,revenue_growth (mặc định mọi chỉ số)"),
+):
+    try:
+        out = _sector_stats().peers(symbol, year, _split_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if out is None:
+        raise HTTPException(status_code=404, detail=f"Không có dữ liệu cho mã {symbol.upper().strip()}")
+    return out
+
+@app.get("/api/sectors/{sector}")
+async def sector_distribution(
+    sector: str,
+    year: int | None = Query(None, description="Năm (mặc định năm mới nhất có dữ liệu)"),
+    fields: str | None = Query(None),
+):
+    try:
+        out = _sector_stats().sector(sector, year, _split_fields(fields))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    if out is None:
+        raise HTTPException(status_code=404, detail=f"Không có dữ liệu cho ngành {sector}")
+    return out
+
+class FundamentalsBatchRequest(BaseModel):
+    symbols: list[str] = Field(..., min_length=1, max_length=2000)
+    fields: list[str] | None = None
+    years: str | None = Field(None, description="2019-2024 hoặc 2021,2023 (optional)")
+
+@app.post("/api/fundamentals:batch")
+async def fundamentals_batch(request: FundamentalsBatchRequest):
+    store, cols, yrs = _fundamentals_query(request.fields, request.years)
+    data, missing = {}, []
+    for s in request.symbols:
+        out = store.get(s, cols, yrs)
+        if out is None:
+            missing.append(s)
+        else:
+            data[out["symbol"]] = out
+    return {"fundamentals": data, "missing": missing}
+
+# =========================
+#  Manipulation Watch V1
+# =========================
+
+def _risk_engine() -> ManipulationWatchV1:
+    """Engine đã sẵn sàng, hoặc 503 nếu đang warm-up (không chặn event loop)."""
+    try:
+        return get_engine(block=False)
+    except EngineWarming:
+        raise HTTPException(
+            status_code=503,
+            detail=engine_status(),
+            headers={"Retry-After": "5"},
+        )
+
+
+@app.get("/api/risk/status")
+async def risk_status():
+    return engine_status()
+
+
+@app.post("/api/risk/reload")
+async def risk_reload():
+    # Dựng lại ở background; engine cũ vẫn phục vụ tới khi bản mới sẵn sàng
+    reload_engine()
+    return engine_status()
+
+
+@app.get("/api/risk/score")
+async def risk_score(
+    ticker: str = Query(..., description="Mã cổ phiếu, ví dụ VCB"),
+    date: str | None = Query(None, description="YYYY-MM-DD (optional)")
+):
+    eng = _risk_engine()
+    return eng.score(ticker, date)
+
+@app.get("/api/risk/history")
+async def risk_history(
+    ticker: str = Query(...),
+    days: int = Query(180, ge=1, le=1000)
+):
+    eng = _risk_engine()
+    return eng.history(ticker, days)
+
+@app.get("/api/risk/top")
+async def risk_top(
+    date: str = Query(..., description="YYYY-MM-DD"),
+    k: int = Query(50, ge=1, le=500),
+    exchange: str | None = Query(None, description="Sàn (HOSE/HNX/UPCOM...), optional"),
+    sector: str | None = Query(None, description="Ngành theo Stock_info.csv, optional"),
+):
+    eng = _risk_engine()
+    out = {"date": date, "top": eng.top(date, k, exchange=exchange, sector=sector)}
+    if sector is not None:
+        out["sector"] = sector
+    elif exchange is not None:
+        out["exchange"] = exchange.upper().strip()
+    return out
+
+@app.get("/api/risk/sector")
+async def risk_sector(
+    date: str | None = Query(None, description="YYYY-MM-DD (mặc định phiên mới nhất)"),
+    sector: str | None = Query(None, description="1 ngành (kèm top-k mã của ngành), optional"),
+    k: int = Query(10, ge=1, le=500),
+):
+    eng = _risk_engine()
+    return eng.sector_summary(date, sector, k)
+
+@app.get("/api/risk/similar")
+async def risk_similar(
+    ticker: str = Query(..., description="Mã cổ phiếu, ví dụ VCB"),
+    date: str | None = Query(None, description="YYYY-MM-DD (mặc định phiên mới nhất)"),
+    k: int = Query(10, ge=1, le=SIMILAR_MAX_K),
+    same_ticker: bool = Query(False, description="Cho phép episode của chính mã đó"),
+):
+    eng = _risk_engine()
+    try:
+        return eng.similar_episodes(ticker, date, k, same_ticker=same_ticker)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+class RiskBatchRequest(BaseModel):
+    tickers: list[str] = Field(..., min_length=1, max_length=2000)
+    date: str | None = Field(None, description="YYYY-MM-DD (optional)")
+
+class RiskHistoryBatchRequest(BaseModel):
+    tickers: list[str] = Field(..., min_length=1, max_length=2000)
+    start: str | None = Field(None, description="YYYY-MM-DD (optional)")
+    end: str | None = Field(None, description="YYYY-MM-DD (optional)")
+    days: int | None = Field(None, ge=1, le=1000, description="Số phiên cuối (mặc định 180 nếu không có start/end)")
+
+@app.post("/api/risk/score:batch")
+async def risk_score_batch(request: RiskBatchRequest):
+    eng = _risk_engine()
+    return eng.score_many(request.tickers, request.date)
+
+@app.post("/api/risk/history:batch")
+async def risk_history_batch(request: RiskHistoryBatchRequest):
+    eng = _risk_engine()
+    return eng.history_many(request.tickers, request.start, request.end, request.days)
+
+# =========================
+#  Risk live (intraday, tạm tính)
+# =========================
+# RISK_LIVE=1 bật luồng bar intraday (xem app/risk_live.py); nguồn bar ở
+# RISK_LIVE_SOURCES, ngoài ra luôn nhận qua POST /api/risk/live:bars.
+live = LiveRiskService.from_env(lambda: get_engine(block=False)) if os.getenv("RISK_LIVE", "0") == "1" else None
+
+
+def _live() -> LiveRiskService:
+    if live is None:
+        raise HTTPException(status_code=404, detail="Risk live đang tắt (đặt RISK_LIVE=1)")
+    if not live.ready:
+        raise HTTPException(status_code=503, detail=engine_status(), headers={"Retry-After": "5"})
+    return live
+
+
+def _ticker_list(tickers: str | None) -> list[str] | None:
+    if not tickers:
+        return None
+    return list(dict.fromkeys(t.upper().strip() for t in tickers.split(",") if t.strip()))
+
+
+async def _ws_forward(ws: WebSocket, q: asyncio.Queue, select, on_client=None) -> None:
+    """
+    Đẩy message của hàng đợi pub/sub ra WebSocket (qua `select`, None = bỏ qua)
+    tới khi client ngắt kết nối; message client gửi lên chuyển cho `on_client`.
+    """
+    recv = asyncio.ensure_future(ws.receive())
+    get = asyncio.ensure_future(q.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait({recv, get}, return_when=asyncio.FIRST_COMPLETED)
+            if get in done:
+                out = select(get.result())
+                if out is not None:
+                    await ws.send_json(out)
+                get = asyncio.ensure_future(q.get())
+            if recv in done:
+                msg = recv.result()
+                if msg["type"] == "websocket.disconnect":
+                    return
+                if on_client is not None and msg.get("text"):
+                    reply = on_client(msg["text"])
+                    if reply is not None:
+                        await ws.send_json(reply)
+                recv = asyncio.ensure_future(ws.receive())
+    finally:
+        recv.cancel()
+        get.cancel()
+
+
+@app.get("/api/risk/live")
+async def risk_live(
+    tickers: str | None = Query(None, description="Danh sách mã, ví dụ VCB,FPT (optional)"),
+    min_risk: float | None = Query(None, ge=0, le=10),
+):
+    lv = _live()
+    return {"runs": lv.runs, **lv.state.snapshot(_ticker_list(tickers), min_risk)}
+
+
+class LiveBarsRequest(BaseModel):
+    bars: list[dict] = Field(..., min_length=1, max_length=10000)
+
+
+@app.post("/api/risk/live:bars")
+async def risk_live_bars(request: LiveBarsRequest):
+    """Hàng đợi bar nội bộ (thay cho feed thật): {ticker, time, open, high, low, close, volume}."""
+    if live is None:
+        raise HTTPException(status_code=404, detail="Risk live đang tắt (đặt RISK_LIVE=1)")
+    accepted = live.submit(request.bars)
+    return {"accepted": accepted, "queued": live.queue.qsize()}
+
+
+@app.websocket("/ws/risk/live")
+async def risk_live_ws(ws: WebSocket, tickers: str | None = None):
+    """
+    Push điểm live: {"type": "snapshot", ...} khi kết nối (nếu đã có điểm), sau đó
+    {"type": "update", ...} mỗi lần chấm có điểm đổi (dạng cột như /api/risk/live).
+    """
+    await ws.accept()
+    if live is None:
+        await ws.close(code=1008, reason="Risk live đang tắt")
+        return
+    watch = _ticker_list(tickers)
+    q = live.hub.subscribe()
+    try:
+        if live.ready:
+            await ws.send_json({"type": "snapshot", **live.state.snapshot(watch)})
+        if watch:
+            keep = set(watch)
+            await _ws_forward(ws, q, lambda msg: live.state.select(msg, keep))
+        else:
+            await _ws_forward(ws, q, lambda msg: msg)
+    finally:
+        live.hub.unsubscribe(q)
+
+
+# =========================
+#  Risk alerts (push)
+# =========================
+alerts = AlertFeed(lambda: get_engine(block=False), live)
+
+
+def _alert_watch(tickers: str | None, source: str | None) -> Watch:
+    if source not in (None, "eod", "live"):
+        raise HTTPException(status_code=422, detail="source phải là eod hoặc live")
+    return Watch(_ticker_list(tickers), (source,) if source else ("eod", "live"))
+
+
+@app.get("/api/risk/alerts")
+async def risk_alerts(
+    tickers: str | None = Query(None, description="Watchlist, ví dụ VCB,FPT (optional)"),
+    source: str | None = Query(None, description="eod | live (mặc định cả hai)"),
+):
+    """Tập alert hiện tại (đã tính sẵn, không quét bảng scores)."""
+    watch = _alert_watch(tickers, source)
+    return {"snapshots": [m for m in map(watch.select, alerts.snapshots()) if m is not None]}
+
+
+@app.get("/api/risk/alerts/stream")
+async def risk_alerts_stream(
+    tickers: str | None = Query(None, description="Watchlist, ví dụ VCB,FPT (optional)"),
+    source: str | None = Query(None, description="eod | live (mặc định cả hai)"),
+):
+    """
+    SSE: event snapshot (tập alert hiện tại theo từng nguồn) rồi event delta
+    {added: [...], cleared: [...]} mỗi khi tập alert trong watchlist đổi.
+    """
+    watch = _alert_watch(tickers, source)
+
+    async def events():
+        q = alerts.hub.subscribe()
+        try:
+            for m in alerts.snapshots():
+                if (m := watch.select(m)) is not None:
+                    yield _sse("snapshot", m)
+            while True:
+                try:
+                    msg = await asyncio.wait_for(q.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"  # giữ kết nối qua proxy
+                    continue
+                if (m := watch.select(msg)) is not None:
+                    yield _sse("delta", m)
+        finally:
+            alerts.hub.unsubscribe(q)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/ws/risk/alerts")
+async def risk_alerts_ws(ws: WebSocket, tickers: str | None = None, source: str | None = None):
+    """
+    Như /api/risk/alerts/stream qua WebSocket; client đổi watchlist bằng cách gửi
+    {"watch": ["VCB", ...] | null, "sources": ["eod", "live"]} → nhận lại snapshot mới.
+    """
+    await ws.accept()
+    watch = Watch(_ticker_list(tickers), (source,) if source in ("eod", "live") else ("eod", "live"))
+
+    def snapshots() -> list[dict]:
+        return [m for m in map(watch.select, alerts.snapshots()) if m is not None]
+
+    def on_client(text: str):
+        try:
+            watch.update(text)
+        except (ValueError, TypeError, AttributeError) as e:
+            return {"type": "error", "detail": f"message không hợp lệ: {e}"}
+        return {"type": "snapshots", "snapshots": snapshots()}
+
+    q = alerts.hub.subscribe()
+    try:
+        for m in snapshots():
+            await ws.send_json(m)
+        await _ws_forward(ws, q, watch.select, on_client)
+    finally:
+        alerts.hub.unsubscribe(q)
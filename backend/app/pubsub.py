@@ -0,0 +1,42 @@
+# app/pubsub.py
+
+from __future__ import annotations
+import asyncio
+import json
+from typing import Any
+
+
+class Broadcaster:
+    """
+    Fan-out message tới nhiều subscriber (WebSocket / SSE) trong cùng event loop.
+    Mỗi subscriber có 1 asyncio.Queue giới hạn; client đọc chậm bị bỏ message
+    cũ nhất thay vì làm nghẽn bên phát (publish không bao giờ chờ).
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._subs: set[asyncio.Queue] = set()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._subs)
+
+    def subscribe(self) -> asyncio.Queue:
+        q: asyncio.Queue = asyncio.Queue(self.maxsize)
+        self._subs.add(q)
+        return q
+
+    def unsubscribe(self, q: asyncio.Queue) -> None:
+        self._subs.discard(q)
+
+    def publish(self, msg: Any) -> None:
+        for q in list(self._subs):
+            if q.full():
+                q.get_nowait()
+                self.dropped += 1
+            q.put_nowait(msg)
+
+
+def sse(event: str, data) -> str:
+    """1 frame Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,84 @@
+# app/rf_infer.py
+
+from __future__ import annotations
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# =========================================================
+# Chấm RandomForest theo chunk cho cả vũ trụ (ticker, ngày)
+#   - X được ép 1 lần về mảng float32 liền khối (sklearn vốn dùng float32)
+#   - chia thành chunk cố định, mỗi chunk là 1 view (không copy)
+#   - nhiều chunk → process pool, mỗi worker nhận model 1 lần (initializer),
+#     chạy cây tuần tự (n_jobs=1) để không tranh CPU với các worker khác
+#   - kết quả ghi thẳng vào mảng output cấp phát sẵn theo vị trí chunk
+# RISK_SCORE_WORKERS (mặc định 1: tuần tự, model tự song song theo cây) /
+# RISK_SCORE_CHUNK (mặc định 65536 dòng).
+# Bật pool (RISK_SCORE_WORKERS > 1) thì script gọi chấm điểm phải có guard
+# `if __name__ == "__main__":` — worker forkserver/spawn import lại module chính.
+# uvicorn, app.serve, app.risk_train, benchmarks.run đều đã có.
+# =========================================================
+DEFAULT_CHUNK_ROWS = 65_536
+
+_MODEL = None  # model trong process worker
+
+
+def score_workers() -> int:
+    return max(int(os.getenv("RISK_SCORE_WORKERS") or 1), 1)
+
+
+def chunk_rows() -> int:
+    return max(int(os.getenv("RISK_SCORE_CHUNK") or DEFAULT_CHUNK_ROWS), 1)
+
+
+def _mp_context():
+    # không fork process đang có thread (warm-up, BLAS, joblib) → forkserver/spawn
+    methods = mp.get_all_start_methods()
+    return mp.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+def _init_worker(model) -> None:
+    global _MODEL
+    if hasattr(model, "n_jobs"):
+        model.n_jobs = 1
+    _MODEL = model
+
+
+def _predict_chunk(x: np.ndarray) -> np.ndarray:
+    return _MODEL.predict_proba(x)[:, 1]
+
+
+def predict_positive(
+    model,
+    X: np.ndarray,
+    chunk: int | None = None,
+    workers: int | None = None,
+) -> np.ndarray:
+    """
+    P(lớp 1) cho từng dòng của X (float64, cùng thứ tự với X).
+    Ít hơn 2 chunk hoặc workers <= 1 → chấm tuần tự trong process hiện tại
+    (model tự song song theo cây với n_jobs của nó).
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    n = len(X)
+    chunk = chunk or chunk_rows()
+    workers = workers or score_workers()
+    out = np.empty(n, dtype=np.float64)
+    starts = range(0, n, chunk)
+
+    if workers <= 1 or len(starts) < 2:
+        for a in starts:
+            out[a:a + chunk] = model.predict_proba(X[a:a + chunk])[:, 1]
+        return out
+
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(starts)),
+        mp_context=_mp_context(),
+        initializer=_init_worker,
+        initargs=(model,),
+    ) as ex:
+        for a, prob in zip(starts, ex.map(_predict_chunk, (X[a:a + chunk] for a in starts))):
+            out[a:a + len(prob)] = prob
+    return out
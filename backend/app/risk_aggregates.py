@@ -0,0 +1,214 @@
+# app/risk_aggregates.py
+
+from __future__ import annotations
+import logging
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .datastore import load_table
+from .score_index import ScoreIndex
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Bảng tổng hợp theo ngày trên bảng scores (dựng 1 lần mỗi khi scores đổi):
+#   - theo nhóm (sàn / ngành lấy từ Stock_info.csv): hoán vị gom dòng của cùng
+#     (nhóm, ngày) thành 1 đoạn liên tiếp, vẫn giữ thứ hạng risk giảm dần
+#     → top-k của 1 sàn / ngành = k dòng đầu đoạn, không lọc lúc truy vấn.
+#   - thống kê (nhóm, ngày): số mã, số alert, risk trung bình / p50 / p90,
+#     risk_pct_daily trung bình — mảng dày (số nhóm × số ngày).
+# Truy vấn: ngày → vị trí ngày (dict), nhóm → mã (dict), rồi đọc thẳng mảng.
+# =========================================================
+STOCK_INFO_FILE = "Stock_info.csv"
+STOCK_INFO_VERSION = 1
+
+DIMENSIONS = ("exchange", "sector")
+STATS = ("n", "alerts", "risk_mean", "risk_p50", "risk_p90", "pct_mean")
+
+
+def _prepare_stock_info(df: pd.DataFrame) -> pd.DataFrame:
+    """Stock_info.csv → ticker / sector / exchange (1 dòng / ticker)."""
+    out = pd.DataFrame({
+        "ticker": df["Symbol"].astype(str).str.upper().str.strip(),
+        "sector": df["Sector"].astype("string").str.strip(),
+        "exchange": df["Exchange"].astype("string").str.upper().str.strip(),
+    })
+    out = out[out["ticker"].ne("") & out["ticker"].ne("NAN")]
+    out = out.replace({"sector": {"": pd.NA}, "exchange": {"": pd.NA}})
+    return out.drop_duplicates("ticker", keep="last").reset_index(drop=True).astype(object)
+
+
+def load_stock_info(data_dir: str | Path) -> pd.DataFrame:
+    """Danh mục mã (qua cache dạng cột); thiếu file → bảng rỗng (không có chiều ngành)."""
+    try:
+        return load_table(Path(data_dir) / STOCK_INFO_FILE, _prepare_stock_info, version=STOCK_INFO_VERSION)
+    except FileNotFoundError:
+        logger.warning("Không có %s trong %s: bỏ qua chiều ngành", STOCK_INFO_FILE, data_dir)
+        return pd.DataFrame(columns=["ticker", "sector", "exchange"])
+
+
+def _quantile_desc(values: np.ndarray, starts: np.ndarray, counts: np.ndarray, q: float) -> np.ndarray:
+    """Phân vị q (nearest-rank) của từng đoạn đã sort giảm dần."""
+    return values[starts + counts - np.ceil(q * counts).astype(np.int64)]
+
+
+class _Dimension:
+    """1 chiều nhóm: hoán vị (nhóm, ngày, hạng) + bảng thống kê nhóm × ngày."""
+
+    def __init__(self, group: np.ndarray, names: list[str], day: np.ndarray, n_days: int,
+                 risk: np.ndarray, pct: np.ndarray | None, threshold: float, keep_order: bool = True):
+        G, D = len(names), n_days
+        self.names = names
+        self.code = {s.lower(): i for i, s in enumerate(names)}
+
+        # nhóm thiếu (-1) dồn về cuối, ngoài mọi đoạn
+        key = np.where(group >= 0, group.astype(np.int64) * D + day, G * D)
+        self.order = np.argsort(key, kind="stable").astype(np.int32 if len(key) < 2**31 else np.int64)
+        counts = np.bincount(key, minlength=G * D + 1)[:G * D]
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+        m = int(self.offsets[-1])
+        rows = self.order[:m]
+        nz = np.flatnonzero(counts)
+        starts, cnt = self.offsets[nz], counts[nz]
+        stats = {s: np.full(G * D, np.nan, dtype=np.float32) for s in STATS}
+        stats["n"] = counts.astype(np.int32)
+        stats["alerts"] = np.zeros(G * D, dtype=np.int32)
+        if m:
+            r = risk[rows].astype(np.float64)
+            stats["alerts"][nz] = np.add.reduceat((r >= threshold).astype(np.int32), starts)
+            stats["risk_mean"][nz] = np.add.reduceat(r, starts) / cnt
+            stats["risk_p50"][nz] = _quantile_desc(r, starts, cnt, 0.5)
+            stats["risk_p90"][nz] = _quantile_desc(r, starts, cnt, 0.9)
+            if pct is not None:
+                stats["pct_mean"][nz] = np.add.reduceat(pct[rows].astype(np.float64), starts) / cnt
+        self.stats = {s: a.reshape(G, D) for s, a in stats.items()}
+        self.n_days = D
+        if not keep_order:  # chỉ cần bảng thống kê
+            self.order = self.order[:0]
+
+    def arrays(self, prefix: str) -> dict[str, np.ndarray]:
+        out = {f"{prefix}.order": self.order, f"{prefix}.offsets": self.offsets,
+               f"{prefix}.names": np.asarray(self.names, dtype=str)}
+        out.update({f"{prefix}.{s}": a for s, a in self.stats.items()})
+        return out
+
+    @classmethod
+    def from_arrays(cls, arrays: dict[str, np.ndarray], prefix: str) -> "_Dimension":
+        d = cls.__new__(cls)
+        d.names = [str(x) for x in arrays[f"{prefix}.names"]]
+        d.code = {s.lower(): i for i, s in enumerate(d.names)}
+        d.order, d.offsets = arrays[f"{prefix}.order"], arrays[f"{prefix}.offsets"]
+        d.stats = {s: arrays[f"{prefix}.{s}"] for s in STATS}
+        d.n_days = d.stats["n"].shape[1]
+        return d
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.order.nbytes + self.offsets.nbytes + sum(a.nbytes for a in self.stats.values()))
+
+    def rows(self, name: str, day: int, k: int) -> np.ndarray:
+        g = self.code.get(name.lower())
+        if g is None:
+            return self.order[:0]
+        a = int(self.offsets[g * self.n_days + day])
+        b = int(self.offsets[g * self.n_days + day + 1])
+        return self.order[a:min(a + k, b)]
+
+
+class RiskAggregates:
+    """
+    Bảng tổng hợp theo (sàn | ngành, ngày) trên bảng scores đã sort
+    (date tăng, risk_0_10 giảm) và ScoreIndex của nó.
+
+    Sàn / ngành lấy từ Stock_info.csv theo ticker; ticker không có trong
+    Stock_info giữ sàn của dòng scores và không thuộc ngành nào.
+    """
+
+    def __init__(self, scores: pd.DataFrame, index: ScoreIndex, info: pd.DataFrame, threshold: float):
+        self.dates = index.dates
+        self.d_pos = {int(d): i for i, d in enumerate(index.dates)}
+        # vị trí ngày của từng dòng: scores sort theo date → lặp theo độ dài block
+        spans = np.fromiter((b - a for a, b in index.d_span.values()), dtype=np.int64, count=len(index.d_span))
+        day = np.repeat(np.arange(len(spans), dtype=np.int64), spans)
+
+        v = index.values
+        risk = v["risk_0_10"]
+        pct = v.get("risk_pct_daily")
+
+        info = info.set_index("ticker")
+        groups = {}
+        for dim in DIMENSIONS:
+            # nhãn theo mã ticker nội bộ → mã nhóm / dòng bằng phép lấy chỉ số (không chuỗi / dòng)
+            by_ticker = pd.Series(index.ticker_names).map(info[dim]).to_numpy(dtype=object)
+            fallback = None
+            if dim == "exchange" and dim in scores.columns:
+                fallback = scores[dim].astype("category")  # bảng scores gọn: đã là category
+            labels = {str(x) for x in by_ticker if isinstance(x, str)}
+            if fallback is not None:
+                labels |= {str(x) for x in fallback.cat.categories}
+            names = sorted(labels)
+            code_of = {s: i for i, s in enumerate(names)}
+            t_group = np.array([code_of.get(x, -1) if isinstance(x, str) else -1 for x in by_ticker], dtype=np.int64)
+            group = t_group[index.ticker_codes] if index.n else np.zeros(0, dtype=np.int64)
+            if fallback is not None:
+                cat = np.array([code_of[str(x)] for x in fallback.cat.categories] + [-1], dtype=np.int64)
+                miss = group < 0
+                group[miss] = cat[fallback.cat.codes.to_numpy()[miss]]  # mã -1 (NaN) → phần tử cuối
+            groups[dim] = _Dimension(group, names, day, len(spans), risk, pct, threshold)
+        self.dims = groups
+        self.market = _Dimension(
+            np.zeros(index.n, dtype=np.int64), ["all"], day, len(spans), risk, pct, threshold, keep_order=False
+        )
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Toàn bộ bảng dạng mảng phẳng (ghi ra đĩa, nạp lại bằng from_arrays)."""
+        out = self.market.arrays("market")
+        for dim, d in self.dims.items():
+            out.update(d.arrays(dim))
+        return out
+
+    @classmethod
+    def from_arrays(cls, index: ScoreIndex, arrays: dict[str, np.ndarray]) -> "RiskAggregates":
+        """Gắn lại bảng đã dựng (vd. mmap từ snapshot) cho index trên cùng bảng scores."""
+        agg = cls.__new__(cls)
+        agg.dates = index.dates
+        agg.d_pos = {int(d): i for i, d in enumerate(index.dates)}
+        agg.dims = {dim: _Dimension.from_arrays(arrays, dim) for dim in DIMENSIONS}
+        agg.market = _Dimension.from_arrays(arrays, "market")
+        return agg
+
+    @property
+    def nbytes(self) -> int:
+        return sum(d.nbytes for d in self.dims.values()) + self.market.nbytes
+
+    def day(self, date_ns: int) -> int | None:
+        return self.d_pos.get(date_ns)
+
+    def top(self, dim: str, name: str, date_ns: int, k: int) -> np.ndarray:
+        """k dòng risk cao nhất của nhóm trong ngày (vị trí dòng trong scores)."""
+        i = self.d_pos.get(date_ns)
+        if i is None:
+            return np.arange(0)
+        return self.dims[dim].rows(name, i, k)
+
+    def summary(self, dim: str, day: int, name: str | None = None) -> dict:
+        """Thống kê các nhóm có dữ liệu trong ngày (dạng cột)."""
+        d = self.dims[dim]
+        if name is not None:
+            g = d.code.get(name.lower())
+            gs = np.array([] if g is None else [g], dtype=np.int64)
+        else:
+            gs = np.arange(len(d.names))
+        gs = gs[d.stats["n"][gs, day] > 0]
+        out = {dim: [d.names[g] for g in gs]}
+        for s in STATS:
+            col = d.stats[s][gs, day]
+            out[s] = col.tolist() if s in ("n", "alerts") else [round(float(x), 4) for x in col]
+        return out
+
+    def market_summary(self, day: int) -> dict:
+        return {s: (int(a[0, day]) if s in ("n", "alerts") else round(float(a[0, day]), 4))
+                for s, a in self.market.stats.items()}
@@ -0,0 +1,204 @@
+# app/risk_alerts.py
+
+from __future__ import annotations
+import asyncio
+import json
+import logging
+import os
+from typing import Callable
+
+from .pubsub import Broadcaster
+from .risk_engine import ALERT_THRESHOLD, EngineWarming, ManipulationWatchV1, on_scores_changed
+from .risk_live import LiveRiskService
+from .score_index import ns_to_str
+from .telemetry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Feed cảnh báo dạng push (thay cho polling /api/risk/top + /api/risk/score)
+#   - tập alert (risk_0_10 >= ALERT_THRESHOLD, như score()) tính 1 lần cho mỗi
+#     lần bảng scores đổi (engine mới / append_session) và mỗi lần chấm live
+#   - so với tập trước → delta {added: [...], cleared: [...]} publish 1 lần,
+#     mỗi subscriber lọc theo watchlist của mình trước khi gửi
+#   - nguồn: "eod" (điểm chính thức của phiên mới nhất; RISK_ALERT_MAX_AGE phiên
+#     trễ cho mã chưa có dòng phiên đó) và "live" (điểm tạm tính intraday, nếu RISK_LIVE=1)
+#   - engine báo bảng scores đổi qua on_scores_changed → không polling
+# =========================================================
+SOURCES = ("eod", "live")
+
+ALERT_EVENTS = REGISTRY.counter(
+    "risk_alert_events_total", "Thay đổi tập alert (source=eod|live, kind=added|cleared)"
+)
+
+
+def eod_alerts(eng: ManipulationWatchV1, max_age: int = 0) -> dict[str, dict]:
+    """
+    Ticker có dòng scores mới nhất đang alert → {ticker: bản ghi} (vectorized).
+    Chỉ xét dòng thuộc `max_age` + 1 phiên cuối của bảng: mã huỷ niêm yết / tạm
+    ngừng giao dịch không giữ alert của phiên cuối cùng mãi mãi.
+    """
+    idx = eng.index
+    if not len(idx.dates):
+        return {}
+    rows = idx.latest_all()
+    v = idx.values
+    since = idx.dates[max(len(idx.dates) - 1 - max_age, 0)]
+    rows = rows[(idx.date[rows] >= since) & (v["risk_0_10"][rows] >= ALERT_THRESHOLD)]
+    return {
+        t: {"ticker": t, "date": d, "risk_0_10": float(r), "close": float(c), "volume": float(vol)}
+        for t, d, r, c, vol in zip(
+            idx.tickers(rows).tolist(),
+            ns_to_str(idx.date[rows]).tolist(),
+            v["risk_0_10"][rows],
+            v["close"][rows],
+            v["volume"][rows],
+        )
+    }
+
+
+def live_alerts(live: LiveRiskService) -> dict[str, dict]:
+    """Ticker có điểm live tạm tính đang alert."""
+    if live.state is None:
+        return {}
+    names = [t for t, (_, r) in live.state.scores.items() if r >= ALERT_THRESHOLD]
+    snap = live.state.snapshot(names)
+    return {
+        t: {"ticker": t, "date": d, "as_of": a, "risk_0_10": r, "close": c, "volume": vol}
+        for t, d, a, r, c, vol in zip(
+            snap["ticker"], snap["session"], snap["as_of"], snap["risk_0_10"], snap["close"], snap["volume"]
+        )
+    }
+
+
+def diff(old: dict[str, dict], new: dict[str, dict]) -> tuple[list[dict], list[str]]:
+    """(ticker mới vào tập alert, ticker vừa ra khỏi tập alert)."""
+    added = [new[t] for t in sorted(new.keys() - old.keys())]
+    cleared = sorted(old.keys() - new.keys())
+    return added, cleared
+
+
+class Watch:
+    """Bộ lọc của 1 subscriber: nguồn + watchlist (None = mọi ticker)."""
+
+    def __init__(self, tickers: list[str] | None = None, sources: tuple[str, ...] = SOURCES):
+        self.tickers = set(tickers) if tickers else None
+        self.sources = sources
+
+    def update(self, text: str) -> None:
+        """Tin nhắn client: {"watch": ["VCB", ...] | null, "sources": ["eod", "live"]}."""
+        msg = json.loads(text)
+        if "watch" in msg:
+            w = msg["watch"]
+            self.tickers = {str(t).upper().strip() for t in w} if w else None
+        if "sources" in msg:
+            self.sources = tuple(s for s in msg["sources"] if s in SOURCES)
+
+    def select(self, msg: dict) -> dict | None:
+        """Phần của message mà subscriber quan tâm (None = không gửi)."""
+        if msg["source"] not in self.sources:
+            return None
+        if self.tickers is None:
+            return msg
+        if msg["type"] == "snapshot":
+            return {**msg, "alerts": [a for a in msg["alerts"] if a["ticker"] in self.tickers]}
+        added = [a for a in msg["added"] if a["ticker"] in self.tickers]
+        cleared = [t for t in msg["cleared"] if t in self.tickers]
+        if not added and not cleared:
+            return None
+        return {**msg, "added": added, "cleared": cleared}
+
+
+class AlertFeed:
+    """
+    Chạy trong event loop của server (lifespan): tính lại tập alert khi engine
+    báo bảng scores đổi (on_scores_changed: install engine mới, chấm lại,
+    append_session) và sau mỗi lần chấm live — không polling.
+    """
+
+    def __init__(
+        self,
+        engine: Callable[[], ManipulationWatchV1],
+        live: LiveRiskService | None = None,
+        max_age: int | None = None,
+    ):
+        self._engine = engine
+        self.live = live
+        self.max_age = int(os.getenv("RISK_ALERT_MAX_AGE", "0")) if max_age is None else max_age
+        self.hub = Broadcaster()
+        self._changed: asyncio.Event | None = None
+        self.current: dict[str, dict[str, dict]] = {s: {} for s in SOURCES}
+        self.as_of: dict[str, str | None] = {s: None for s in SOURCES}
+        self._gen: tuple[int, int] | None = None
+
+    def snapshots(self) -> list[dict]:
+        return [
+            {"type": "snapshot", "source": s, "as_of": self.as_of[s], "alerts": list(self.current[s].values())}
+            for s in SOURCES
+        ]
+
+    def _publish(self, source: str, new: dict[str, dict], as_of: str | None) -> None:
+        added, cleared = diff(self.current[source], new)
+        self.current[source] = new
+        self.as_of[source] = as_of
+        if not added and not cleared:
+            return
+        ALERT_EVENTS.inc(len(added), source=source, kind="added")
+        ALERT_EVENTS.inc(len(cleared), source=source, kind="cleared")
+        self.hub.publish({"type": "delta", "source": source, "as_of": as_of, "added": added, "cleared": cleared})
+
+    def check_engine(self) -> bool:
+        """Bảng scores đổi từ lần trước → tính lại tập alert EOD. True nếu đã tính lại."""
+        try:
+            eng = self._engine()
+        except EngineWarming:
+            return False
+        gen = (id(eng), eng.generation)
+        if gen == self._gen or eng.index is None:
+            return False
+        self._gen = gen
+        as_of = str(ns_to_str(eng.index.dates[-1:])[0]) if len(eng.index.dates) else None
+        self._publish("eod", eod_alerts(eng, self.max_age), as_of)
+        return True
+
+    def check_live(self) -> None:
+        """Sau mỗi lần chấm live có điểm đổi: tính lại tập alert live."""
+        new = live_alerts(self.live)
+        self._publish("live", new, max((a["as_of"] for a in new.values()), default=self.as_of["live"]))
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        changed = self._changed = asyncio.Event()
+        changed.set()  # engine có thể đã sẵn sàng trước khi feed chạy
+        # listener gọi từ thread vừa đổi bảng scores → chuyển về event loop
+        remove = on_scores_changed(lambda eng: loop.call_soon_threadsafe(changed.set))
+        tasks = [asyncio.create_task(self._watch_engine())]
+        if self.live is not None:
+            tasks.append(asyncio.create_task(self._watch_live()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            remove()
+            for t in tasks:
+                t.cancel()
+
+    async def _watch_engine(self) -> None:
+        while True:
+            await self._changed.wait()
+            self._changed.clear()
+            try:
+                self.check_engine()
+            except Exception:  # lỗi 1 lần tính không dừng feed
+                logger.exception("Risk alerts: tính tập alert EOD lỗi")
+
+    async def _watch_live(self) -> None:
+        q = self.live.hub.subscribe()
+        try:
+            while True:
+                await q.get()
+                # gộp các lần chấm dồn lại trong hàng đợi thành 1 lần tính
+                while not q.empty():
+                    q.get_nowait()
+                self.check_live()
+        finally:
+            self.live.hub.unsubscribe(q)
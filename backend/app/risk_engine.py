@@ -1,412 +1,1162 @@
-# app/risk_engine.py
-
-from __future__ import annotations
-import os
-from pathlib import Path
-from dataclasses import dataclass
-
-import pandas as pd
-import numpy as np
-from sklearn.ensemble import RandomForestClassifier
-
-# ======================
-# Config V2: RF (behavior + extra features)
-# ======================
-PRICE_UNIT  = 1.0        # 1.0 nếu close đã là đơn vị chuẩn; đổi nếu dữ liệu là "nghìn VND"
-RANDOM_SEED = 42
-
-OHLCV_FILE = "OHLCV_Merge.csv"
-SHARE_FILE = "Share_outstanding.csv"
-
-# Các feature đã dùng để tạo churn_flag (rule-based) → KHÔNG cho vào model
-RULE_FEATURES = ["ret_1d", "vol_z20", "gap_open"]
-
-# Feature hành vi dùng để train model (behavior-only + extra features)
-BEHAVIOR_FEATURES = [
-    # return & price/volume structure (không dùng ret_1d, vol_z20, gap_open)
-    "ret_3d", "ret_5d",
-    "range_rel", "close_loc",
-
-    # rolling 3d / 5d / 10d
-    "turnover_3d", "volz_3d", "range_3d", "close_loc_3d",
-    "turnover_5d", "volz_5d", "range_5d", "close_loc_5d",
-    "turnover_10d", "volz_10d", "range_10d", "close_loc_10d",
-
-    # cross-sectional ranking
-    "turnover_pct", "mkt_cap_pct",
-
-    # ===== extra behavior features =====
-    "vol_change_5d",      # tốc độ thay đổi volume 5 ngày
-    "turnover_vol_ratio", # tỷ lệ turnover / |vol_z20|
-    "abs_ret_5d",         # biên độ giá tuyệt đối 5 ngày
-    "volatility_10d",     # độ biến động ret_1d trong 10 ngày
-    "price_slope_5d",     # slope giá 5 ngày gần nhất
-]
-
-LABEL_COL = "churn_flag"
-
-
-# =========================================================
-# Helper: chuẩn hoá tên cột (tái dùng đúng logic V1)
-# =========================================================
-def _standardize_cols(df: pd.DataFrame) -> pd.DataFrame:
-    """Chuẩn hoá tên cột phổ biến từ nhiều nguồn khác nhau."""
-    if df is None:
-        return df
-    mapping: dict[str, str] = {}
-    low = {c.lower().strip(): c for c in df.columns}
-
-    def pick(names: list[str]) -> str | None:
-        for n in names:
-            if n in low:
-                return low[n]
-        for n in names:
-            for k in low:
-                if n in k:
-                    return low[k]
-        return None
-
-    # OHLCV
-    if pick(["ticker", "mã", "ma", "symbol"]):
-        mapping[pick(["ticker", "mã", "ma", "symbol"])] = "ticker"
-    if pick(["date", "ngày", "trading_date"]):
-        mapping[pick(["date", "ngày", "trading_date"])] = "date"
-    if pick(["open", "giá mở"]):
-        mapping[pick(["open", "giá mở"])] = "open"
-    if pick(["high", "cao nhất"]):
-        mapping[pick(["high", "cao nhất"])] = "high"
-    if pick(["low", "thấp nhất"]):
-        mapping[pick(["low", "thấp nhất"])] = "low"
-    if pick(["close", "đóng cửa"]):
-        mapping[pick(["close", "đóng cửa"])] = "close"
-    if pick(["volume", "khối lượng", "vol"]):
-        mapping[pick(["volume", "khối lượng", "vol"])] = "volume"
-    if pick(["exchange", "sàn"]):
-        mapping[pick(["exchange", "sàn"])] = "exchange"
-
-    # shares theo năm
-    if pick(["năm", "year"]):
-        mapping[pick(["năm", "year"])] = "year"
-    if "Mã" in df.columns and "ticker" not in mapping:
-        mapping["Mã"] = "ticker"
-    if "Năm" in df.columns and "year" not in mapping:
-        mapping["Năm"] = "year"
-    if "shares_outstanding" in df.columns:
-        mapping["shares_outstanding"] = "shares_outstanding"
-
-    return df.rename(columns=mapping)
-
-
-def _zscore_rolling(s: pd.Series, win: int) -> pd.Series:
-    m = s.rolling(win, min_periods=max(5, win // 3)).mean()
-    sd = s.rolling(win, min_periods=max(5, win // 3)).std()
-    return (s - m) / sd
-
-
-# =========================================================
-# Artifacts: lưu model đã train
-# =========================================================
-@dataclass
-class RiskArtifacts:
-    model: RandomForestClassifier
-
-
-# =========================================================
-# Core Engine: ManipulationWatchV1 (RF version)
-# =========================================================
-class ManipulationWatchV1:
-    """
-    V2: OHLCV + Shares theo năm → feature hành vi + cấu trúc →
-        RandomForest (supervised, behavior + extra features) → risk 0–10 theo ngày.
-    """
-
-    def __init__(self, data_dir: str | None = None):
-        # Dùng chung DATA_DIR như StockAnalyzer để nhất quán
-        env_dir = (os.getenv("DATA_DIR") or "").strip()
-        root = data_dir or env_dir or ""
-        if not root:
-            root = str(Path(__file__).resolve().parents[2] / "frontend" / "public")
-        self.data_dir = Path(root)
-
-        self.df: pd.DataFrame | None = None      # full feature frame
-        self.scores: pd.DataFrame | None = None  # risk per (date, ticker)
-        self.art: RiskArtifacts | None = None    # fitted RF model
-
-        self._load_and_fit()
-
-    # ---------------- Load & Features ----------------
-    def _load_and_fit(self) -> None:
-        ohlcv_path = self.data_dir / OHLCV_FILE
-        shares_path = self.data_dir / SHARE_FILE
-        if not ohlcv_path.exists():
-            raise FileNotFoundError(f"Không thấy {ohlcv_path}")
-        if not shares_path.exists():
-            raise FileNotFoundError(f"Không thấy {shares_path}")
-
-        o = pd.read_csv(ohlcv_path)
-        s = pd.read_csv(shares_path)
-
-        # drop index thừa nếu có
-        for col in ["Unnamed: 0", "Unnamed: 0.1"]:
-            if col in o.columns:
-                o = o.drop(columns=[col])
-            if col in s.columns:
-                s = s.drop(columns=[col])
-
-        o = _standardize_cols(o)
-        s = _standardize_cols(s)
-
-        # chuẩn hoá cơ bản
-        o["ticker"] = o["ticker"].astype(str).str.upper().str.strip()
-        o["date"] = pd.to_datetime(o["date"])
-        o["year"] = o["date"].dt.year
-
-        for c in ["open", "high", "low", "close", "volume"]:
-            if c in o.columns:
-                o[c] = pd.to_numeric(o[c], errors="coerce")
-        # nếu giá đang là "nghìn VND", chỉnh PRICE_UNIT = 1000; mặc định 1.0
-        o["close"] = o["close"] * PRICE_UNIT
-        o = o.sort_values(["ticker", "date"]).reset_index(drop=True)
-
-        s["ticker"] = s["ticker"].astype(str).str.upper().str.strip()
-        s["year"] = pd.to_numeric(s["year"], errors="coerce").astype("Int64")
-        if "shares_outstanding" in s.columns:
-            s["shares_outstanding"] = pd.to_numeric(
-                s["shares_outstanding"], errors="coerce"
-            )
-            # coi 0 hoặc số âm là thiếu dữ liệu, để tránh chia 0 → inf
-            s.loc[s["shares_outstanding"] <= 0, "shares_outstanding"] = np.nan
-
-        # merge shares theo ticker-year
-        df = o.merge(
-            s[["ticker", "year", "shares_outstanding"]],
-            on=["ticker", "year"],
-            how="left",
-        )
-
-        # ffill/bfill shares theo từng ticker
-        df_sorted = df.sort_values(["ticker", "year"])
-        df["shares_outstanding"] = (
-            df_sorted.groupby("ticker")["shares_outstanding"]
-            .transform(lambda x: x.ffill().bfill())
-        )
-
-        # loại bỏ dòng không đủ dữ liệu cơ bản
-        df = df.dropna(subset=["close", "volume", "shares_outstanding"]).copy()
-
-        # ---------- Feature engineering ----------
-        g = df.groupby("ticker", group_keys=False)
-
-        # Return ngắn hạn
-        df["ret_1d"] = g["close"].pct_change(1)
-        df["ret_3d"] = g["close"].pct_change(3)
-        df["ret_5d"] = g["close"].pct_change(5)
-
-        # Biên độ / vị trí giá
-        df["range_rel"] = (df["high"] - df["low"]) / g["close"].shift(1)
-        df["close_loc"] = (
-            df["close"] - (df["high"] + df["low"]) / 2
-        ) / (df["high"] - df["low"]).replace(0, np.nan)
-
-        # Gap mở cửa
-        df["gap_open"] = (df["open"] - g["close"].shift(1)) / g["close"].shift(1)
-
-        # Z-score khối lượng 20 phiên
-        df["vol_z20"] = g["volume"].apply(lambda s_: _zscore_rolling(s_, 20))
-
-        # Turnover & market cap
-        df["turnover"] = df["volume"] / df["shares_outstanding"]
-        df["mkt_cap"] = df["close"] * df["shares_outstanding"]
-
-        # Rolling 3d / 5d / 10d cho hành vi
-        for w in (3, 5, 10):
-            df[f"turnover_{w}d"] = g["turnover"].apply(
-                lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean()
-            )
-            df[f"volz_{w}d"] = g["vol_z20"].apply(
-                lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean()
-            )
-            df[f"range_{w}d"] = g["range_rel"].apply(
-                lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean()
-            )
-            df[f"close_loc_{w}d"] = g["close_loc"].apply(
-                lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean()
-            )
-
-        # ===== extra behavior features (giống notebook fine-tuned) =====
-        df = df.sort_values(["ticker", "date"]).reset_index(drop=True)
-        g2 = df.groupby("ticker", group_keys=False)
-
-        # Tốc độ thay đổi khối lượng trong 5 ngày
-        df["vol_change_5d"] = g2["volume"].transform(
-            lambda x: (x / x.shift(5)) - 1
-        )
-
-        # Tỷ lệ giữa thanh khoản và độ “bất thường” volume
-        df["turnover_vol_ratio"] = df["turnover"] / (df["vol_z20"].abs() + 1e-6)
-
-        # Biên độ giá tuyệt đối 5 ngày
-        df["abs_ret_5d"] = df["ret_5d"].abs()
-
-        # Độ biến động 10 ngày (rolling std của ret_1d)
-        df["volatility_10d"] = g2["ret_1d"].transform(
-            lambda x: x.rolling(10, min_periods=5).std()
-        )
-
-        # Xu hướng giá trong 5 ngày (price slope)
-        df["price_slope_5d"] = g2["close"].transform(
-            lambda x: (x - x.shift(5)) / 5
-        )
-
-        # Rule gán nhãn churn_flag: KL đột biến nhưng biên độ hẹp
-        df[LABEL_COL] = (
-            (df["vol_z20"] > 2.0) & (df["range_rel"].abs() < 0.01)
-        ).astype(int)
-
-        # Chuẩn hoá chéo theo ngày (ranking percentile)
-        df["turnover_pct"] = df.groupby("date")["turnover"].rank(pct=True)
-        df["mkt_cap_pct"] = df.groupby("date")["mkt_cap"].rank(pct=True)
-
-        # ---------- Chọn vũ trụ train: blue-chips ----------
-        agg = (
-            df.groupby("ticker")
-            .agg(
-                med_turn=("turnover", "median"),
-                med_cap=("mkt_cap", "median"),
-            )
-            .replace([np.inf, -np.inf], np.nan)
-            .dropna()
-        )
-        thr_turn = agg["med_turn"].quantile(0.7)
-        thr_cap = agg["med_cap"].quantile(0.7)
-        blue = set(
-            agg[
-                (agg["med_turn"] >= thr_turn)
-                & (agg["med_cap"] >= thr_cap)
-            ].index
-        )
-
-        # Train mask: blue-chips, dữ liệu trước 2024-01-01
-        train_mask = (df["ticker"].isin(blue)) & (
-            df["date"] < pd.Timestamp("2024-01-01")
-        )
-
-        # Chuẩn bị tập train cho RF: chỉ feature hành vi + nhãn
-        train_df = (
-            df.loc[train_mask]
-            .replace([np.inf, -np.inf], np.nan)
-            .dropna(subset=BEHAVIOR_FEATURES + [LABEL_COL])
-            .copy()
-        )
-
-        X_train = train_df[BEHAVIOR_FEATURES]
-        y_train = train_df[LABEL_COL].astype(int)
-
-        # ---------- Train RandomForest (behavior + extra features) ----------
-        rf = RandomForestClassifier(
-            n_estimators=400,
-            max_depth=None,
-            min_samples_leaf=3,            # như cấu hình fine-tuned trên notebook
-            n_jobs=-1,
-            random_state=RANDOM_SEED,
-            class_weight="balanced_subsample",
-        )
-        rf.fit(X_train, y_train)
-
-        # ---------- Score toàn bộ vũ trụ ----------
-        valid_df = (
-            df.replace([np.inf, -np.inf], np.nan)
-            .dropna(subset=BEHAVIOR_FEATURES)
-            .copy()
-        )
-        X_all = valid_df[BEHAVIOR_FEATURES]
-        prob = rf.predict_proba(X_all)[:, 1]  # P(churn_flag = 1)
-
-        out = valid_df[
-            ["date", "ticker", "exchange", "close", "volume", "turnover", "mkt_cap"]
-        ].copy()
-        out["risk_raw"] = prob
-        out["risk_pct_daily"] = out.groupby("date")["risk_raw"].rank(pct=True)
-        out["risk_0_10"] = (out["risk_pct_daily"] * 10).clip(0, 10).round(1)
-
-        self.df = df
-        self.scores = (
-            out.sort_values(["date", "risk_0_10"], ascending=[True, False])
-            .reset_index(drop=True)
-        )
-        self.art = RiskArtifacts(model=rf)
-
-    # ---------------- Public APIs (giữ nguyên format) ----------------
-    def score(self, ticker: str, date: str | None = None) -> dict:
-        if self.scores is None:
-            raise RuntimeError("Risk engine chưa khởi tạo.")
-        t = ticker.upper().strip()
-        s = self.scores[self.scores["ticker"] == t]
-        if s.empty:
-            return {"ticker": t, "message": "No data"}
-        if date:
-            d = pd.to_datetime(date)
-            row = s[s["date"] == d].tail(1)
-            if row.empty:
-                # lấy phiên gần nhất trước date
-                row = s[s["date"] <= d].tail(1)
-        else:
-            row = s.tail(1)
-        if row.empty:
-            return {"ticker": t, "message": "No data at selected date"}
-        r = row.iloc[-1]
-        return {
-            "ticker": t,
-            "date": str(pd.to_datetime(r["date"]).date()),
-            "risk_0_10": float(r["risk_0_10"]),
-            "alert": bool(r["risk_0_10"] >= 8.0),
-            "context": {
-                "close": float(r["close"]),
-                "volume": float(r["volume"]),
-                "turnover": float(r["turnover"]),
-                "mkt_cap": float(r["mkt_cap"]),
-            },
-        }
-
-    def history(self, ticker: str, days: int = 180) -> dict:
-        t = ticker.upper().strip()
-        s = self.scores[self.scores["ticker"] == t].sort_values("date")
-        if s.empty:
-            return {"ticker": t, "history": []}
-        tail = s.tail(days)
-        return {
-            "ticker": t,
-            "history": [
-                {
-                    "date": str(pd.to_datetime(d).date()),
-                    "risk_0_10": float(v),
-                }
-                for d, v in zip(tail["date"], tail["risk_0_10"])
-            ],
-        }
-
-    def top(self, date: str, k: int = 50) -> list[dict]:
-        d = pd.to_datetime(date)
-        s = self.scores[self.scores["date"] == d].nlargest(k, "risk_0_10")
-        return [
-            {
-                "ticker": t,
-                "risk_0_10": float(x),
-                "close": float(c),
-                "volume": float(v),
-            }
-            for t, x, c, v in zip(
-                s["ticker"], s["risk_0_10"], s["close"], s["volume"]
-            )
-        ]
-
-
-# Singleton lười khởi tạo
-_RISK: ManipulationWatchV1 | None = None
-
-
-def get_engine() -> ManipulationWatchV1:
-    global _RISK
-    if _RISK is None:
-        _RISK = ManipulationWatchV1(data_dir=os.getenv("DATA_DIR"))
-    return _RISK
+# app/risk_engine.py
+
+from __future__ import annotations
+import json
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from dataclasses import dataclass
+from typing import Callable
+
+import pandas as pd
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from . import snapshot
+from .columnar import read_arrays, read_frame, write_arrays, write_frame
+from .datastore import load_table
+from .rf_infer import predict_positive
+from .risk_aggregates import RiskAggregates, load_stock_info
+from .risk_similar import SimilarityIndex, build_arrays as build_similar
+from .risk_store import MODEL_FILE, RiskArtifactStore, fingerprint
+from .score_index import ScoreIndex, ns_to_str, to_ns
+from .telemetry import REGISTRY, stage
+
+logger = logging.getLogger(__name__)
+
+RISK_ARTIFACT = REGISTRY.counter(
+    "risk_artifact_total", "Nguồn scores khi dựng engine (result=hit|rescore|incremental)"
+)
+
+# ======================
+# Config V2: RF (behavior + extra features)
+# ======================
+PRICE_UNIT  = 1.0        # 1.0 nếu close đã là đơn vị chuẩn; đổi nếu dữ liệu là "nghìn VND"
+RANDOM_SEED = 42
+
+OHLCV_FILE = "OHLCV_Merge.csv"
+SHARE_FILE = "Share_outstanding.csv"
+
+# Các feature đã dùng để tạo churn_flag (rule-based) → KHÔNG cho vào model
+RULE_FEATURES = ["ret_1d", "vol_z20", "gap_open"]
+
+# Feature hành vi dùng để train model (behavior-only + extra features)
+BEHAVIOR_FEATURES = [
+    # return & price/volume structure (không dùng ret_1d, vol_z20, gap_open)
+    "ret_3d", "ret_5d",
+    "range_rel", "close_loc",
+
+    # rolling 3d / 5d / 10d
+    "turnover_3d", "volz_3d", "range_3d", "close_loc_3d",
+    "turnover_5d", "volz_5d", "range_5d", "close_loc_5d",
+    "turnover_10d", "volz_10d", "range_10d", "close_loc_10d",
+
+    # cross-sectional ranking
+    "turnover_pct", "mkt_cap_pct",
+
+    # ===== extra behavior features =====
+    "vol_change_5d",      # tốc độ thay đổi volume 5 ngày
+    "turnover_vol_ratio", # tỷ lệ turnover / |vol_z20|
+    "abs_ret_5d",         # biên độ giá tuyệt đối 5 ngày
+    "volatility_10d",     # độ biến động ret_1d trong 10 ngày
+    "price_slope_5d",     # slope giá 5 ngày gần nhất
+]
+
+LABEL_COL = "churn_flag"
+
+# /api/risk/similar: số phiên sau mỗi episode dùng để báo risk / lợi suất về sau
+SIMILAR_HORIZONS = (5, 10, 20)
+SIMILAR_MAX_K = 100
+
+# risk_0_10 từ ngưỡng này trở lên → alert
+ALERT_THRESHOLD = 8.0
+
+# Train universe / model (như cấu hình fine-tuned trên notebook) — mặc định của app.risk_train
+TRAIN_CUTOFF = "2024-01-01"
+BLUE_CHIP_QUANTILE = 0.7
+RF_PARAMS = dict(
+    n_estimators=400,
+    max_depth=None,
+    min_samples_leaf=3,
+    n_jobs=-1,
+    random_state=RANDOM_SEED,
+    class_weight="balanced_subsample",
+)
+
+# Tăng khi đổi logic feature/label/score → artifact cũ tự động bị bỏ qua
+FEATURE_VERSION = 2
+# Tăng khi đổi _prepare_ohlcv / _prepare_shares / _standardize_cols → bỏ cache dữ liệu cũ
+DATA_PREP_VERSION = 1
+
+
+def _config_signature() -> dict:
+    """
+    Hằng số feature/score → đưa vào fingerprint artifact. Cấu hình train
+    (cutoff, quantile, tham số RF) nằm trong manifest của model do
+    app.risk_train sinh ra, không nằm trong fingerprint.
+    """
+    return {
+        "feature_version": FEATURE_VERSION,
+        "price_unit": PRICE_UNIT,
+        "behavior_features": BEHAVIOR_FEATURES,
+        "rule_features": RULE_FEATURES,
+        "label_col": LABEL_COL,
+    }
+
+
+# =========================================================
+# Helper: chuẩn hoá tên cột (tái dùng đúng logic V1)
+# =========================================================
+def _standardize_cols(df: pd.DataFrame) -> pd.DataFrame:
+    """Chuẩn hoá tên cột phổ biến từ nhiều nguồn khác nhau."""
+    if df is None:
+        return df
+    mapping: dict[str, str] = {}
+    low = {c.lower().strip(): c for c in df.columns}
+
+    def pick(names: list[str]) -> str | None:
+        for n in names:
+            if n in low:
+                return low[n]
+        for n in names:
+            for k in low:
+                if n in k:
+                    return low[k]
+        return None
+
+    # OHLCV
+    if pick(["ticker", "mã", "ma", "symbol"]):
+        mapping[pick(["ticker", "mã", "ma", "symbol"])] = "ticker"
+    if pick(["date", "ngày", "trading_date"]):
+        mapping[pick(["date", "ngày", "trading_date"])] = "date"
+    if pick(["open", "giá mở"]):
+        mapping[pick(["open", "giá mở"])] = "open"
+    if pick(["high", "cao nhất"]):
+        mapping[pick(["high", "cao nhất"])] = "high"
+    if pick(["low", "thấp nhất"]):
+        mapping[pick(["low", "thấp nhất"])] = "low"
+    if pick(["close", "đóng cửa"]):
+        mapping[pick(["close", "đóng cửa"])] = "close"
+    if pick(["volume", "khối lượng", "vol"]):
+        mapping[pick(["volume", "khối lượng", "vol"])] = "volume"
+    if pick(["exchange", "sàn"]):
+        mapping[pick(["exchange", "sàn"])] = "exchange"
+
+    # shares theo năm
+    if pick(["năm", "year"]):
+        mapping[pick(["năm", "year"])] = "year"
+    if "Mã" in df.columns and "ticker" not in mapping:
+        mapping["Mã"] = "ticker"
+    if "Năm" in df.columns and "year" not in mapping:
+        mapping["Năm"] = "year"
+    if "shares_outstanding" in df.columns:
+        mapping["shares_outstanding"] = "shares_outstanding"
+
+    return df.rename(columns=mapping)
+
+
+# =========================================================
+# Feature builder (vectorized)
+#   df phải sort theo (ticker, date) với RangeIndex. Mọi shift là phép
+#   NumPy trên mảng đã sort (mask theo vị trí trong ticker); mọi rolling
+#   là 1 lượt groupby-rolling nhiều cột (Cython) thay vì apply từng ticker.
+# =========================================================
+ROLL_WINDOWS = (3, 5, 10)
+VOLZ_WINDOW = 20
+
+
+def _group_pos(tickers: pd.Series) -> np.ndarray:
+    """Vị trí của từng dòng trong ticker của nó (0, 1, 2, ...)."""
+    return tickers.groupby(tickers, sort=False).cumcount().to_numpy()
+
+
+def _lag(values: np.ndarray, k: int, pos: np.ndarray) -> np.ndarray:
+    """Tương đương groupby("ticker").shift(k) trên mảng đã sort theo ticker."""
+    out = np.full(len(values), np.nan)
+    if k < len(values):
+        out[k:] = values[:-k]
+    out[pos < k] = np.nan
+    return out
+
+
+def _group_rolling(
+    df: pd.DataFrame, cols: list[str], win: int, min_periods: int, how: str = "mean"
+) -> pd.DataFrame:
+    """Rolling theo ticker cho nhiều cột trong một lượt."""
+    r = df[cols].groupby(df["ticker"], sort=False).rolling(win, min_periods=min_periods)
+    out = getattr(r, how)()
+    return out.reset_index(level=0, drop=True)
+
+
+def build_features(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Thêm toàn bộ feature hành vi (BEHAVIOR_FEATURES trừ 2 cột xếp hạng theo ngày)
+    + RULE_FEATURES + turnover / mkt_cap vào df đã sort theo (ticker, date).
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):  # chia 0 → inf/NaN như pandas
+        df = _build_features(df)
+    # lưu feature hành vi ở float32: RandomForest vốn ép X về float32 nên
+    # kết quả predict không đổi, RAM cho các cột này giảm một nửa
+    feats = [c for c in BEHAVIOR_FEATURES if c in df.columns]
+    df[feats] = df[feats].astype(np.float32)
+    return df
+
+
+def _build_features(df: pd.DataFrame) -> pd.DataFrame:
+    pos = _group_pos(df["ticker"])
+    close = df["close"].to_numpy(dtype=float)
+    volume = df["volume"].to_numpy(dtype=float)
+    close_1 = _lag(close, 1, pos)
+    close_5 = _lag(close, 5, pos)
+
+    # Return ngắn hạn
+    df["ret_1d"] = close / close_1 - 1
+    df["ret_3d"] = close / _lag(close, 3, pos) - 1
+    df["ret_5d"] = close / close_5 - 1
+
+    # Biên độ / vị trí giá
+    df["range_rel"] = (df["high"] - df["low"]) / close_1
+    df["close_loc"] = (
+        df["close"] - (df["high"] + df["low"]) / 2
+    ) / (df["high"] - df["low"]).replace(0, np.nan)
+
+    # Gap mở cửa
+    df["gap_open"] = (df["open"] - close_1) / close_1
+
+    # Z-score khối lượng 20 phiên
+    vz = _group_rolling(df, ["volume"], VOLZ_WINDOW, max(5, VOLZ_WINDOW // 3), "mean")
+    vs = _group_rolling(df, ["volume"], VOLZ_WINDOW, max(5, VOLZ_WINDOW // 3), "std")
+    df["vol_z20"] = (df["volume"] - vz["volume"]) / vs["volume"]
+
+    # Turnover & market cap
+    df["turnover"] = df["volume"] / df["shares_outstanding"]
+    df["mkt_cap"] = df["close"] * df["shares_outstanding"]
+
+    # Rolling 3d / 5d / 10d cho hành vi: 1 lượt / cửa sổ cho cả 4 cột
+    base = ["turnover", "vol_z20", "range_rel", "close_loc"]
+    for w in ROLL_WINDOWS:
+        r = _group_rolling(df, base, w, max(2, w // 2), "mean")
+        df[f"turnover_{w}d"] = r["turnover"]
+        df[f"volz_{w}d"] = r["vol_z20"]
+        df[f"range_{w}d"] = r["range_rel"]
+        df[f"close_loc_{w}d"] = r["close_loc"]
+
+    # ===== extra behavior features (giống notebook fine-tuned) =====
+    # Tốc độ thay đổi khối lượng trong 5 ngày
+    df["vol_change_5d"] = volume / _lag(volume, 5, pos) - 1
+
+    # Tỷ lệ giữa thanh khoản và độ “bất thường” volume
+    df["turnover_vol_ratio"] = df["turnover"] / (df["vol_z20"].abs() + 1e-6)
+
+    # Biên độ giá tuyệt đối 5 ngày
+    df["abs_ret_5d"] = df["ret_5d"].abs()
+
+    # Độ biến động 10 ngày (rolling std của ret_1d)
+    df["volatility_10d"] = _group_rolling(df, ["ret_1d"], 10, 5, "std")["ret_1d"]
+
+    # Xu hướng giá trong 5 ngày (price slope)
+    df["price_slope_5d"] = (close - close_5) / 5
+
+    return df
+
+
+# Số phiên cần giữ lại mỗi ticker để tính lại đúng feature của phiên mới:
+# volz_10d = mean 10 phiên của vol_z20, mỗi vol_z20 cần 20 phiên volume → 20 + 10 - 1
+TAIL_SESSIONS = VOLZ_WINDOW + max(ROLL_WINDOWS) - 1
+TAIL_COLS = [
+    "ticker", "date", "year", "exchange",
+    "open", "high", "low", "close", "volume", "shares_outstanding",
+]
+SCORE_COLS = ["date", "ticker", "exchange", "close", "volume", "turnover", "mkt_cap"]
+
+
+def _prepare_ohlcv(o: pd.DataFrame) -> pd.DataFrame:
+    """Chuẩn hoá OHLCV thô (CSV hoặc phiên mới): tên cột, ticker, ngày, kiểu số."""
+    # drop index thừa nếu có
+    o = o.drop(columns=[c for c in ["Unnamed: 0", "Unnamed: 0.1"] if c in o.columns])
+    o = _standardize_cols(o)
+
+    # chuẩn hoá cơ bản
+    o["ticker"] = o["ticker"].astype(str).str.upper().str.strip()
+    o["date"] = pd.to_datetime(o["date"])
+    o["year"] = o["date"].dt.year
+
+    for c in ["open", "high", "low", "close", "volume"]:
+        if c in o.columns:
+            o[c] = pd.to_numeric(o[c], errors="coerce")
+    # nếu giá đang là "nghìn VND", chỉnh PRICE_UNIT = 1000; mặc định 1.0
+    o["close"] = o["close"] * PRICE_UNIT
+    return o
+
+
+def _prepare_shares(s: pd.DataFrame) -> pd.DataFrame:
+    """Chuẩn hoá Share_outstanding.csv → (ticker, year, shares_outstanding)."""
+    s = s.drop(columns=[c for c in ["Unnamed: 0", "Unnamed: 0.1"] if c in s.columns])
+    s = _standardize_cols(s)
+
+    s["ticker"] = s["ticker"].astype(str).str.upper().str.strip()
+    s["year"] = pd.to_numeric(s["year"], errors="coerce")
+    # dòng không có năm không bao giờ khớp khi merge → bỏ luôn, giữ year kiểu int
+    s = s.dropna(subset=["year"]).astype({"year": "int64"})
+    if "shares_outstanding" in s.columns:
+        s["shares_outstanding"] = pd.to_numeric(
+            s["shares_outstanding"], errors="coerce"
+        )
+        # coi 0 hoặc số âm là thiếu dữ liệu, để tránh chia 0 → inf
+        s.loc[s["shares_outstanding"] <= 0, "shares_outstanding"] = np.nan
+    return s.reset_index(drop=True)
+
+
+def _add_cross_section(df: pd.DataFrame) -> pd.DataFrame:
+    """Chuẩn hoá chéo theo ngày (ranking percentile)."""
+    df["turnover_pct"] = df.groupby("date")["turnover"].rank(pct=True).astype(np.float32)
+    df["mkt_cap_pct"] = df.groupby("date")["mkt_cap"].rank(pct=True).astype(np.float32)
+    return df
+
+
+def _compact_scores(out: pd.DataFrame) -> pd.DataFrame:
+    """
+    Bố cục gọn cho bảng scores thường trú: ticker/exchange dạng category (mã int),
+    risk_raw / risk_pct_daily float32. date giữ datetime64 (bản chất là int64 epoch);
+    close/volume/turnover/mkt_cap/risk_0_10 giữ float64 vì đi thẳng ra response.
+    """
+    out = out.copy()
+    for c in ("ticker", "exchange"):
+        if c in out.columns and not isinstance(out[c].dtype, pd.CategoricalDtype):
+            out[c] = out[c].astype("category")
+    for c in ("risk_raw", "risk_pct_daily"):
+        if c in out.columns:
+            out[c] = out[c].astype(np.float32)
+    return out
+
+
+def _score_rows(df: pd.DataFrame, model: RandomForestClassifier) -> pd.DataFrame:
+    """
+    Chấm các dòng đủ feature → risk_raw + xếp hạng trong ngày (risk_0_10).
+    Kết quả giữ kèm BEHAVIOR_FEATURES (cùng thứ tự dòng) cho chỉ mục similar;
+    tách ra bằng _split_features trước khi đưa vào bảng scores.
+    """
+    # ma trận feature float32 liền khối chỉ gồm các dòng hợp lệ (không NaN / inf);
+    # không copy cả frame feature như replace().dropna()
+    X = df[BEHAVIOR_FEATURES].to_numpy(dtype=np.float32)
+    valid = np.isfinite(X).all(axis=1)
+    X = X[valid]
+    with stage("risk.predict"):
+        prob = predict_positive(model, X)  # P(churn_flag = 1), theo chunk (pool nếu RISK_SCORE_WORKERS > 1)
+
+    with stage("risk.rank"):
+        out = df.loc[valid, SCORE_COLS + BEHAVIOR_FEATURES].copy()
+        out["risk_raw"] = prob
+        out["risk_pct_daily"] = out.groupby("date")["risk_raw"].rank(pct=True)
+        out["risk_0_10"] = (out["risk_pct_daily"] * 10).clip(0, 10).round(1)
+        return out.sort_values(["date", "risk_0_10"], ascending=[True, False])
+
+
+def _split_features(out: pd.DataFrame) -> tuple[pd.DataFrame, np.ndarray]:
+    """Kết quả _score_rows → (dòng scores, ma trận BEHAVIOR_FEATURES float32 cùng thứ tự)."""
+    return out.drop(columns=BEHAVIOR_FEATURES), out[BEHAVIOR_FEATURES].to_numpy(dtype=np.float32)
+
+
+def _tail_buffer(df: pd.DataFrame) -> pd.DataFrame:
+    """TAIL_SESSIONS phiên cuối của mỗi ticker (dữ liệu thô đã merge shares)."""
+    cols = [c for c in TAIL_COLS if c in df.columns]
+    return (
+        df.groupby("ticker", sort=False)
+        .tail(TAIL_SESSIONS)[cols]
+        .sort_values(["ticker", "date"], kind="mergesort")
+        .reset_index(drop=True)
+    )
+
+
+# =========================================================
+# Pipeline: panel feature → tập train → fit → chấm
+# (dùng chung cho engine phục vụ và app.risk_train chạy offline)
+# =========================================================
+def default_train_config() -> dict:
+    """Cấu hình train mặc định (như cấu hình fine-tuned trên notebook)."""
+    return {
+        "train_cutoff": TRAIN_CUTOFF,
+        "blue_chip_quantile": BLUE_CHIP_QUANTILE,
+        "rf_params": dict(RF_PARAMS),
+    }
+
+
+def resolve_data_dir(data_dir: str | Path | None = None) -> Path:
+    """Dùng chung DATA_DIR như StockAnalyzer để nhất quán (mặc định frontend/public)."""
+    env_dir = (os.getenv("DATA_DIR") or "").strip()
+    root = data_dir or env_dir or ""
+    if not root:
+        root = str(Path(__file__).resolve().parents[2] / "frontend" / "public")
+    return Path(root)
+
+
+def input_paths(data_dir: Path) -> list[Path]:
+    """File đầu vào của engine (đưa vào fingerprint artifact)."""
+    paths = [data_dir / OHLCV_FILE, data_dir / SHARE_FILE]
+    for p in paths:
+        if not p.exists():
+            raise FileNotFoundError(f"Không thấy {p}")
+    return paths
+
+
+def load_panel(data_dir: str | Path) -> pd.DataFrame:
+    """
+    OHLCV + shares theo năm → frame (ticker, date) đã sort, đủ feature hành vi,
+    nhãn LABEL_COL và xếp hạng chéo theo ngày.
+    """
+    data_dir = Path(data_dir)
+    ohlcv_path = data_dir / OHLCV_FILE
+    shares_path = data_dir / SHARE_FILE
+    if not ohlcv_path.exists():
+        raise FileNotFoundError(f"Không thấy {ohlcv_path}")
+    if not shares_path.exists():
+        raise FileNotFoundError(f"Không thấy {shares_path}")
+
+    # CSV → cache dạng cột (đã chuẩn hoá cột/kiểu) → đọc mmap ở các lần sau
+    with stage("risk.load_csv"):
+        o = load_table(ohlcv_path, _prepare_ohlcv, version=DATA_PREP_VERSION)
+        s = load_table(shares_path, _prepare_shares, version=DATA_PREP_VERSION)
+
+    with stage("risk.merge"):
+        o = o.sort_values(["ticker", "date"]).reset_index(drop=True)
+
+        # merge shares theo ticker-year
+        df = o.merge(
+            s[["ticker", "year", "shares_outstanding"]],
+            on=["ticker", "year"],
+            how="left",
+        )
+
+        # ffill/bfill shares theo từng ticker (df đang sort theo ticker, date)
+        sh = df.groupby("ticker", sort=False)["shares_outstanding"].ffill()
+        df["shares_outstanding"] = sh.groupby(df["ticker"], sort=False).bfill()
+
+        # loại bỏ dòng không đủ dữ liệu cơ bản
+        df = df.dropna(subset=["close", "volume", "shares_outstanding"]).copy()
+        df = df.sort_values(["ticker", "date"], kind="mergesort").reset_index(drop=True)
+
+    # ---------- Feature engineering ----------
+    with stage("risk.features"):
+        df = build_features(df)
+
+    with stage("risk.label_cross_section"):
+        # Rule gán nhãn churn_flag: KL đột biến nhưng biên độ hẹp
+        df[LABEL_COL] = (
+            (df["vol_z20"] > 2.0) & (df["range_rel"].abs() < 0.01)
+        ).astype(int)
+
+        # Chuẩn hoá chéo theo ngày (ranking percentile)
+        return _add_cross_section(df)
+
+
+def train_mask(
+    df: pd.DataFrame,
+    cutoff: str = TRAIN_CUTOFF,
+    quantile: float = BLUE_CHIP_QUANTILE,
+) -> pd.Series:
+    """Vũ trụ train: blue-chips (median turnover & mkt_cap ≥ quantile), trước cutoff."""
+    agg = (
+        df.groupby("ticker")
+        .agg(
+            med_turn=("turnover", "median"),
+            med_cap=("mkt_cap", "median"),
+        )
+        .replace([np.inf, -np.inf], np.nan)
+        .dropna()
+    )
+    thr_turn = agg["med_turn"].quantile(quantile)
+    thr_cap = agg["med_cap"].quantile(quantile)
+    blue = set(
+        agg[
+            (agg["med_turn"] >= thr_turn)
+            & (agg["med_cap"] >= thr_cap)
+        ].index
+    )
+    return (df["ticker"].isin(blue)) & (df["date"] < pd.Timestamp(cutoff))
+
+
+def training_set(df: pd.DataFrame, mask: pd.Series | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (X, y) cho RF: chỉ feature hành vi + nhãn, bỏ dòng NaN / inf.
+    X là mảng float32 (đúng kiểu sklearn dùng bên trong) → model không gắn tên cột,
+    chấm bằng ma trận NumPy theo chunk ở _score_rows.
+    """
+    train_df = (
+        df.loc[mask, BEHAVIOR_FEATURES + [LABEL_COL]]
+        .replace([np.inf, -np.inf], np.nan)
+        .dropna()
+    )
+    X = train_df[BEHAVIOR_FEATURES].to_numpy(dtype=np.float32)
+    y = train_df[LABEL_COL].to_numpy(dtype=int)
+    return X, y
+
+
+def fit_model(X: np.ndarray, y: np.ndarray, rf_params: dict | None = None) -> RandomForestClassifier:
+    rf = RandomForestClassifier(**(RF_PARAMS if rf_params is None else rf_params))
+    with stage("risk.fit"):
+        rf.fit(X, y)
+    return rf
+
+
+def score_panel(
+    df: pd.DataFrame, model: RandomForestClassifier
+) -> tuple[pd.DataFrame, pd.DataFrame, dict[str, np.ndarray]]:
+    """
+    Chấm toàn bộ panel → (bảng scores gọn, tail buffer cho append_session,
+    mảng chỉ mục similar trên BEHAVIOR_FEATURES theo dòng scores).
+    """
+    out, X = _split_features(_score_rows(df, model).reset_index(drop=True))
+    with stage("risk.similar"):
+        similar = build_similar(X, seed=RANDOM_SEED)
+    return _compact_scores(out), _tail_buffer(df), similar
+
+
+# =========================================================
+# Artifacts: lưu model đã train
+# =========================================================
+@dataclass
+class RiskArtifacts:
+    model: RandomForestClassifier
+
+
+# =========================================================
+# Core Engine: ManipulationWatchV1 (RF version)
+# =========================================================
+class ManipulationWatchV1:
+    """
+    V2: OHLCV + Shares theo năm → feature hành vi + cấu trúc →
+        RandomForest (supervised, behavior + extra features) → risk 0–10 theo ngày.
+    """
+
+    def __init__(
+        self,
+        data_dir: str | None = None,
+        artifact_dir: str | None = None,
+        use_cache: bool = True,
+        incremental: bool | None = None,
+        snapshot_dir: str | Path | None = None,
+    ):
+        """snapshot_dir: gắn (chỉ đọc) bản engine do loader publish (xem app/serve.py) thay vì tự nạp / chấm."""
+        self.data_dir = resolve_data_dir(data_dir)
+
+        self.scores: pd.DataFrame | None = None  # risk per (date, ticker)
+        self.art: RiskArtifacts | None = None    # fitted RF model
+        self.index: ScoreIndex | None = None     # chỉ mục ticker/ngày trên scores
+        self.tail: pd.DataFrame | None = None    # TAIL_SESSIONS phiên cuối / ticker (append_session)
+        self.aggregates: RiskAggregates | None = None  # top-k / thống kê theo sàn, ngành × ngày
+        self.similar: SimilarityIndex | None = None    # láng giềng gần nhất trên BEHAVIOR_FEATURES
+        self.generation = 0                      # tăng mỗi lần bảng scores đổi (chấm lại / append_session)
+        self.snapshot_dir = Path(snapshot_dir) if snapshot_dir else None
+        self.stock_info: pd.DataFrame | None = None  # ticker → sector / exchange (Stock_info.csv)
+
+        # Artifact store: model + scores theo fingerprint (đầu vào + config feature)
+        self.store = RiskArtifactStore(artifact_dir)
+        self.use_cache = use_cache and os.getenv("RISK_CACHE", "1") != "0"
+        self.fingerprint: str | None = None
+        self.train_info: dict = {}               # cấu hình + báo cáo CV của model (manifest)
+        # incremental: đầu vào đổi → chấm thêm phiên mới bằng model của artifact
+        # gần nhất thay vì train lại toàn bộ (RISK_INCREMENTAL=1)
+        if incremental is None:
+            incremental = os.getenv("RISK_INCREMENTAL", "0") == "1"
+        self.incremental = incremental
+
+        if self.snapshot_dir is not None:
+            self._attach_snapshot(self.snapshot_dir)
+            return
+        self.stock_info = load_stock_info(self.data_dir)
+        self._load_or_score()
+
+    # ---------------- Artifact cache ----------------
+    def _load_or_score(self) -> None:
+        """
+        Nạp model + scores từ artifact khớp fingerprint. Đầu vào đổi → chấm lại
+        bằng model của artifact gần nhất (cùng config feature, cùng thư mục dữ liệu)
+        rồi lưu artifact mới.
+        Engine phục vụ không bao giờ train: model do `python -m app.risk_train` sinh ra.
+        """
+        self.fingerprint = fingerprint(input_paths(self.data_dir), _config_signature())
+        if self.use_cache and self._load_artifact(self.fingerprint):
+            RISK_ARTIFACT.inc(result="hit")
+            return
+
+        prev = self.store.latest(_config_signature(), self.data_dir)
+        if prev is None or not self._load_artifact(prev):
+            raise FileNotFoundError(
+                f"Chưa có model risk đã train cho {self.data_dir} trong {self.store.root} "
+                "(chạy `python -m app.risk_train` trong thư mục backend)"
+            )
+        if self.incremental and self.use_cache:
+            RISK_ARTIFACT.inc(result="incremental")
+            self._score_newer()
+        else:
+            RISK_ARTIFACT.inc(result="rescore")
+            self._score_all()
+
+        if self.use_cache:
+            try:
+                with stage("risk.artifact_save"):
+                    self.store.save(
+                        self.fingerprint,
+                        self.art.model,
+                        {"scores": self.scores, "tail": self.tail},
+                        {
+                            "config": _config_signature(),
+                            "train": self.train_info,
+                            "data_dir": str(self.data_dir),
+                            "n_scores": int(len(self.scores)),
+                            "scored_from": prev,
+                        },
+                        arrays={"similar": self.similar.arrays() if self.similar is not None else None},
+                    )
+            except OSError as e:
+                # không ghi được cache (read-only FS...) thì vẫn phục vụ bình thường
+                logger.warning("Không lưu được artifact risk engine: %s", e)
+                return
+            # đọc lại bản vừa ghi qua mmap → cột scores nằm trong page cache,
+            # dùng chung (read-only) với mọi worker khác nạp cùng artifact
+            cached = self.store.load(self.fingerprint, categorical=("scores",))
+            if cached is not None:
+                self._set_scores(cached[1]["scores"])
+                self._set_similar(self.store.load_arrays(self.fingerprint, "similar"))
+
+    def _load_artifact(self, key: str) -> bool:
+        with stage("risk.artifact_load"):
+            cached = self.store.load(key, categorical=("scores",))
+        if cached is None:
+            return False
+        model, frames, manifest = cached
+        self.art = RiskArtifacts(model=model)
+        self.train_info = manifest.get("train", {})
+        self.tail = frames.get("tail")
+        self._set_scores(frames["scores"])
+        self._set_similar(self.store.load_arrays(key, "similar"))
+        return True
+
+    def _score_newer(self) -> None:
+        """
+        Chế độ incremental: giữ model + scores của artifact trước (cùng config),
+        chỉ chấm các phiên trong OHLCV mới hơn phiên cuối đã lưu (qua tail buffer,
+        như append_session). Lịch sử cũ không được tính lại — sửa dữ liệu quá khứ
+        thì cần chạy không incremental.
+        """
+        o = load_table(self.data_dir / OHLCV_FILE, _prepare_ohlcv, version=DATA_PREP_VERSION)
+        s = load_table(self.data_dir / SHARE_FILE, _prepare_shares, version=DATA_PREP_VERSION)
+        last = self.index.dates[-1] if len(self.index.dates) else None
+        if last is not None:
+            o = o[o["date"].to_numpy().astype("datetime64[ns]").view("int64") > last]
+        o = o.merge(
+            s[["ticker", "year", "shares_outstanding"]], on=["ticker", "year"], how="left"
+        )
+        out = self._append_prepared(o)
+        logger.info("Risk engine incremental: chấm %d dòng mới", len(out))
+
+    def _set_scores(self, scores: pd.DataFrame) -> None:
+        """Gán bảng scores, dựng lại chỉ mục truy vấn và bảng tổng hợp theo ngày."""
+        with stage("risk.index"):
+            index = ScoreIndex(scores)
+        with stage("risk.aggregates"):
+            aggregates = RiskAggregates(scores, index, self.stock_info, ALERT_THRESHOLD)
+        self.scores, self.index, self.aggregates = scores, index, aggregates
+        self.generation += 1
+        _notify_scores(self)
+
+    def _set_similar(self, arrays: dict[str, np.ndarray] | None) -> None:
+        """Chỉ mục similar phải phủ đúng bảng scores hiện tại, lệch số dòng thì bỏ."""
+        index = SimilarityIndex(arrays) if arrays is not None else None
+        self.similar = index if index is not None and index.n == len(self.scores) else None
+
+    # ---------------- Snapshot dùng chung (nhiều worker) ----------------
+    def save_snapshot(self, path: Path) -> None:
+        """Ghi bảng scores + chỉ mục + bảng tổng hợp đã dựng để worker khác mmap lại."""
+        with stage("risk.snapshot_save"):
+            write_frame(self.scores, path / "scores")
+            if self.tail is not None:
+                write_frame(self.tail, path / "tail")
+            write_arrays(self.index.arrays(), path / "index")
+            write_arrays(self.aggregates.arrays(), path / "aggregates")
+            if self.similar is not None:
+                write_arrays(self.similar.arrays(), path / "similar")
+            joblib.dump(self.art.model, path / MODEL_FILE)
+            with open(path / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(
+                    {"fingerprint": self.fingerprint, "train": self.train_info, "data_dir": str(self.data_dir)},
+                    f, ensure_ascii=False, default=str,
+                )
+
+    def _attach_snapshot(self, path: Path) -> None:
+        """
+        Nạp bản do save_snapshot ghi: cột scores và mảng chỉ mục đều là mmap,
+        không sort / dựng lại gì. Model chỉ nạp khi cần chấm live (RISK_LIVE=1);
+        bản gắn snapshot không append_session được (loader publish thế hệ mới).
+        """
+        with stage("risk.snapshot_attach"):
+            with open(path / "meta.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            scores = read_frame(path / "scores", categorical=True)
+            index = ScoreIndex(scores, arrays=read_arrays(path / "index"))
+            aggregates = RiskAggregates.from_arrays(index, read_arrays(path / "aggregates"))
+            self.tail = read_frame(path / "tail") if (path / "tail").exists() else None
+            similar = read_arrays(path / "similar") if (path / "similar").exists() else None
+            if os.getenv("RISK_LIVE", "0") == "1":
+                self.art = RiskArtifacts(model=joblib.load(path / MODEL_FILE))
+        self.fingerprint = meta["fingerprint"]
+        self.train_info = meta.get("train", {})
+        self.scores, self.index, self.aggregates = scores, index, aggregates
+        self._set_similar(similar)
+        self.generation += 1
+
+    # ---------------- Chấm toàn bộ vũ trụ ----------------
+    def _score_all(self) -> None:
+        """Dựng panel feature từ CSV và chấm mọi phiên bằng model hiện có (không train)."""
+        df = load_panel(self.data_dir)
+        scores, self.tail, similar = score_panel(df, self.art.model)
+        # feature frame trung gian (~40 cột × mọi phiên) không giữ lại sau khi chấm;
+        # chỉ còn tail buffer cho append_session (+ vector chuẩn hoá trong chỉ mục similar)
+        del df
+        self._set_scores(scores)
+        self._set_similar(similar)
+
+    # ---------------- Incremental: phiên mới ----------------
+    def append_session(self, df_new: pd.DataFrame) -> pd.DataFrame:
+        """
+        Chấm điểm 1 (hoặc vài) phiên mới mà không train lại.
+
+        df_new: OHLCV thô của các phiên mới (cùng định dạng OHLCV_Merge.csv,
+        có thể thêm cột shares_outstanding). Feature được tính trên
+        tail buffer TAIL_SESSIONS phiên/ticker + dòng mới, chỉ các dòng mới được
+        chấm bằng model hiện có, rồi xếp hạng chéo turnover_pct / mkt_cap_pct /
+        risk_pct_daily trong phạm vi các ngày mới. Shares thiếu được ffill từ
+        phiên trước của ticker (không đọc lại Share_outstanding.csv).
+
+        Trả về các dòng scores vừa thêm.
+        """
+        if self.snapshot_dir is not None:
+            raise RuntimeError("Engine gắn snapshot chỉ đọc: append_session chạy ở loader (app.serve).")
+        if self.art is None or self.tail is None or self.index is None:
+            raise RuntimeError("Risk engine chưa khởi tạo.")
+        with stage("risk.append_session"):
+            return self._append_prepared(_prepare_ohlcv(df_new.copy()))
+
+    def _append_prepared(self, o: pd.DataFrame) -> pd.DataFrame:
+        """append_session trên OHLCV đã qua _prepare_ohlcv."""
+        o = o.dropna(subset=["date"])
+        if o.empty:
+            return self.scores.iloc[:0]
+        if len(self.index.dates) and to_ns(o["date"].min()) <= self.index.dates[-1]:
+            raise ValueError(
+                "append_session chỉ nhận phiên mới hơn phiên cuối đã chấm "
+                f"({ns_to_str(self.index.dates[-1:])[0]})"
+            )
+
+        if "shares_outstanding" in o.columns:
+            o["shares_outstanding"] = pd.to_numeric(o["shares_outstanding"], errors="coerce")
+            o.loc[o["shares_outstanding"] <= 0, "shares_outstanding"] = np.nan
+        else:
+            o["shares_outstanding"] = np.nan
+        if "exchange" not in o.columns:
+            last_ex = self.tail.groupby("ticker")["exchange"].last()
+            o["exchange"] = o["ticker"].map(last_ex)
+
+        # tail + phiên mới → cùng pipeline feature như lúc train
+        cols = [c for c in TAIL_COLS if c in self.tail.columns]
+        df = pd.concat([self.tail, o[cols]], ignore_index=True)
+        df = df.sort_values(["ticker", "date"], kind="mergesort").reset_index(drop=True)
+        sh = df.groupby("ticker", sort=False)["shares_outstanding"].ffill()
+        df["shares_outstanding"] = sh.groupby(df["ticker"], sort=False).bfill()
+        df = df.dropna(subset=["close", "volume", "shares_outstanding"]).reset_index(drop=True)
+
+        is_new = (df["date"] >= o["date"].min()).to_numpy()
+        df = build_features(df)
+        new_rows = _add_cross_section(df.loc[is_new].copy())
+        out, X = _split_features(_score_rows(new_rows, self.art.model))
+
+        self.tail = _tail_buffer(df)
+        similar = self.similar
+        self._set_scores(
+            _compact_scores(pd.concat([self.scores, out], ignore_index=True))
+        )
+        # dòng mới nối cuối bảng scores → gán vào ô gần nhất, không k-means lại
+        if similar is not None:
+            with stage("risk.similar"):
+                self._set_similar(similar.extend(X).arrays())
+        return out.reset_index(drop=True)
+
+    def memory_usage(self) -> dict[str, int]:
+        """Byte theo thành phần (scores đọc mmap từ artifact thì nằm trong page cache dùng chung)."""
+        out = {}
+        if self.scores is not None:
+            out["scores"] = int(self.scores.memory_usage(index=False).sum())
+        if self.index is not None:
+            out["index"] = self.index.nbytes
+        if self.aggregates is not None:
+            out["aggregates"] = self.aggregates.nbytes
+        if self.similar is not None:
+            out["similar"] = self.similar.nbytes
+        if self.tail is not None:
+            out["tail"] = int(self.tail.memory_usage(index=False, deep=True).sum())
+        if self.art is not None and self.train_info.get("model_bytes"):
+            out["model"] = int(self.train_info["model_bytes"])
+        return out
+
+    # ---------------- Public APIs (giữ nguyên format) ----------------
+    def score(self, ticker: str, date: str | None = None) -> dict:
+        if self.scores is None or self.index is None:
+            raise RuntimeError("Risk engine chưa khởi tạo.")
+        t = ticker.upper().strip()
+        idx = self.index
+        if not idx.has(t):
+            return {"ticker": t, "message": "No data"}
+        # phiên đúng ngày, nếu không có thì phiên gần nhất trước date
+        i = idx.latest(t, to_ns(date) if date else None)
+        if i is None:
+            return {"ticker": t, "message": "No data at selected date"}
+        v = idx.values
+        risk = float(v["risk_0_10"][i])
+        return {
+            "ticker": t,
+            "date": str(ns_to_str(idx.date[i:i + 1])[0]),
+            "risk_0_10": risk,
+            "alert": bool(risk >= ALERT_THRESHOLD),
+            "context": {
+                "close": float(v["close"][i]),
+                "volume": float(v["volume"][i]),
+                "turnover": float(v["turnover"][i]),
+                "mkt_cap": float(v["mkt_cap"][i]),
+            },
+        }
+
+    def history(self, ticker: str, days: int = 180) -> dict:
+        t = ticker.upper().strip()
+        rows = self.index.tail(t, days)
+        if len(rows) == 0:
+            return {"ticker": t, "history": []}
+        return {
+            "ticker": t,
+            "history": [
+                {"date": str(d), "risk_0_10": float(x)}
+                for d, x in zip(
+                    ns_to_str(self.index.date[rows]),
+                    self.index.values["risk_0_10"][rows],
+                )
+            ],
+        }
+
+    # ---------------- Batch APIs (payload dạng cột) ----------------
+    def score_many(self, tickers: list[str], date: str | None = None) -> dict:
+        """score() cho cả danh sách ticker trong 1 lượt chọn vectorized."""
+        ts = list(dict.fromkeys(t.upper().strip() for t in tickers))
+        pos = self.index.latest_many(ts, to_ns(date) if date else None)
+        hit = pos >= 0
+        rows = pos[hit]
+        v = self.index.values
+        risk = v["risk_0_10"][rows]
+        return {
+            "date": date,
+            "ticker": [t for t, h in zip(ts, hit) if h],
+            "as_of": ns_to_str(self.index.date[rows]).tolist(),
+            "risk_0_10": risk.astype(float).tolist(),
+            "alert": (risk >= ALERT_THRESHOLD).tolist(),
+            "close": v["close"][rows].astype(float).tolist(),
+            "volume": v["volume"][rows].astype(float).tolist(),
+            "turnover": v["turnover"][rows].astype(float).tolist(),
+            "mkt_cap": v["mkt_cap"][rows].astype(float).tolist(),
+            "missing": [t for t, h in zip(ts, hit) if not h],
+        }
+
+    def history_many(
+        self,
+        tickers: list[str],
+        start: str | None = None,
+        end: str | None = None,
+        days: int | None = None,
+    ) -> dict:
+        """
+        Lịch sử risk_0_10 của nhiều ticker: dòng của ticker[j] nằm ở
+        date/risk_0_10[offsets[j]:offsets[j+1]]. Không có start/end → `days` phiên cuối.
+        """
+        ts = list(dict.fromkeys(t.upper().strip() for t in tickers))
+        if days is None and start is None and end is None:
+            days = 180
+        rows, offsets = self.index.range_many(
+            ts,
+            to_ns(start) if start else None,
+            to_ns(end) if end else None,
+            days,
+        )
+        return {
+            "ticker": ts,
+            "offsets": offsets.tolist(),
+            "date": ns_to_str(self.index.date[rows]).tolist(),
+            "risk_0_10": self.index.values["risk_0_10"][rows].astype(float).tolist(),
+        }
+
+    def top(
+        self,
+        date: str,
+        k: int = 50,
+        exchange: str | None = None,
+        sector: str | None = None,
+    ) -> list[dict]:
+        """k mã risk cao nhất của ngày, trong toàn thị trường hoặc 1 sàn / 1 ngành."""
+        date_ns = to_ns(date)
+        if sector is not None:
+            rows = self.aggregates.top("sector", sector.strip(), date_ns, k)
+        elif exchange is not None:
+            rows = self.aggregates.top("exchange", exchange.upper().strip(), date_ns, k)
+        else:
+            rows = self.index.top(date_ns, k)
+        v = self.index.values
+        return [
+            {
+                "ticker": t,
+                "risk_0_10": float(x),
+                "close": float(c),
+                "volume": float(vol),
+            }
+            for t, x, c, vol in zip(
+                self.index.tickers(rows),
+                v["risk_0_10"][rows],
+                v["close"][rows],
+                v["volume"][rows],
+            )
+        ]
+
+    def sector_summary(self, date: str | None = None, sector: str | None = None, k: int = 10) -> dict:
+        """
+        Thống kê risk theo ngành của 1 ngày (mặc định phiên mới nhất): số mã,
+        số alert, risk trung bình / p50 / p90, risk_pct_daily trung bình (dạng cột),
+        kèm dòng toàn thị trường. Có `sector` → chỉ ngành đó + top-k mã của ngành.
+        """
+        agg = self.aggregates
+        if date is None:
+            if not len(agg.dates):
+                return {"date": None, "market": None, "sector": []}
+            date_ns = int(agg.dates[-1])
+        else:
+            date_ns = to_ns(date)
+        day = agg.day(date_ns)
+        if day is None:
+            return {"date": date, "market": None, "sector": []}
+        out = {
+            "date": str(ns_to_str(np.array([date_ns]))[0]),
+            "market": agg.market_summary(day),
+            **agg.summary("sector", day, sector.strip() if sector else None),
+        }
+        if sector:
+            out["top"] = self.top(out["date"], k, sector=sector)
+        return out
+
+    def similar_episodes(self, ticker: str, date: str | None = None, k: int = 10, same_ticker: bool = False) -> dict:
+        """
+        k episode (ticker, ngày) trong quá khứ có vector BEHAVIOR_FEATURES gần phiên
+        (ticker, date) nhất, kèm risk / lợi suất của chúng SIMILAR_HORIZONS phiên sau đó.
+        Chỉ xét phiên trước ngày truy vấn; mặc định bỏ các phiên của chính ticker.
+        """
+        if self.index is None:
+            raise RuntimeError("Risk engine chưa khởi tạo.")
+        if self.similar is None:
+            raise RuntimeError("Artifact risk chưa có chỉ mục similar (chấm lại để dựng).")
+        t = ticker.upper().strip()
+        idx = self.index
+        if not idx.has(t):
+            return {"ticker": t, "message": "No data"}
+        i = idx.latest(t, to_ns(date) if date else None)
+        if i is None:
+            return {"ticker": t, "message": "No data at selected date"}
+        k = max(1, min(int(k), SIMILAR_MAX_K))
+        code, day = idx.ticker_codes[i], idx.date[i]
+
+        def exclude(rows: np.ndarray) -> np.ndarray:
+            out = idx.date[rows] >= day
+            if not same_ticker:
+                out |= idx.ticker_codes[rows] == code
+            return out
+
+        rows, dist = self.similar.query(i, k, exclude)
+
+        # risk / close của H phiên kế tiếp cùng ticker (ma trận k × H, NaN khi hết dữ liệu)
+        v = idx.values
+        H = max(SIMILAR_HORIZONS)
+        pos, end = idx.order_pos(rows)
+        ahead = pos[:, None] + np.arange(1, H + 1)
+        ok = ahead < end[:, None]
+        later = idx.t_order[np.where(ok, ahead, 0)]
+        risk = np.where(ok, v["risk_0_10"][later], np.nan)
+        close = np.where(ok, v["close"][later], np.nan)
+        base = v["close"][rows].astype(float)
+        outcome = {}
+        for h in SIMILAR_HORIZONS:
+            done = ok[:, h - 1]
+            outcome[f"ret_{h}d"] = np.where(done, close[:, h - 1] / base - 1.0, np.nan)
+            outcome[f"risk_max_{h}d"] = np.where(done, np.nanmax(risk[:, :h], axis=1, initial=-np.inf), np.nan)
+
+        def clean(x: float, digits: int = 4):
+            return None if not np.isfinite(x) else round(float(x), digits)
+
+        episodes = [
+            {
+                "ticker": tk,
+                "date": str(d),
+                "distance": clean(dd),
+                "risk_0_10": float(r),
+                "close": float(c),
+                **{name: clean(col[j]) for name, col in outcome.items()},
+            }
+            for j, (tk, d, dd, r, c) in enumerate(zip(
+                idx.tickers(rows), ns_to_str(idx.date[rows]), dist, v["risk_0_10"][rows], base,
+            ))
+        ]
+        summary = {"n": int(len(rows))}
+        for name, col in outcome.items():
+            has = np.isfinite(col)
+            summary[name] = clean(col[has].mean()) if has.any() else None
+        return {
+            "ticker": t,
+            "date": str(ns_to_str(idx.date[i:i + 1])[0]),
+            "risk_0_10": float(v["risk_0_10"][i]),
+            "horizons": list(SIMILAR_HORIZONS),
+            "similar": episodes,
+            "summary": summary,
+        }
+
+
+# =========================================================
+# Singleton: dựng ở background, single-flight, hot-swap
+#   - start_warmup(): dựng engine trong worker thread (gọi lúc startup).
+#     Nhiều lời gọi đồng thời dùng chung 1 lần dựng.
+#   - get_engine(block=False): trả engine nếu sẵn sàng, ngược lại ném
+#     EngineWarming (endpoint trả 503) thay vì chặn event loop.
+#   - reload_engine(): dựng engine mới trong khi engine cũ vẫn phục vụ,
+#     xong thì thay bằng 1 phép gán (atomic).
+#   - Worker của app.serve (SNAPSHOT_ROOT): "dựng" = gắn thế hệ snapshot hiện tại;
+#     reload nhờ loader dựng thế hệ mới, install_engine() đổi sang khi có.
+# =========================================================
+class EngineWarming(RuntimeError):
+    """Risk engine chưa sẵn sàng (đang dựng ở background hoặc lần dựng trước lỗi)."""
+
+
+_RISK: ManipulationWatchV1 | None = None
+_RISK_LOCK = threading.Lock()
+_BUILD: Future | None = None
+_BUILD_ERROR: BaseException | None = None
+_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="risk-engine")
+
+
+def attach_snapshot(root: Path, gen: str | None = None) -> ManipulationWatchV1:
+    """Engine chỉ đọc trên thế hệ snapshot `gen` (mặc định thế hệ CURRENT của loader)."""
+    gen = gen or snapshot.current(root)
+    if gen is None:
+        raise EngineWarming(f"Loader chưa publish snapshot nào trong {root}")
+    return ManipulationWatchV1(data_dir=os.getenv("DATA_DIR"), snapshot_dir=root / gen / "risk")
+
+
+def install_engine(eng: ManipulationWatchV1) -> None:
+    """Thay engine đang phục vụ bằng 1 phép gán (request đang chạy giữ bản cũ)."""
+    global _RISK, _BUILD_ERROR
+    with _RISK_LOCK:
+        _RISK = eng
+        _BUILD_ERROR = None
+    _notify_scores(eng)
+
+
+# Hook "bảng scores đổi" (engine mới được install, _set_scores sau chấm lại /
+# append_session): gọi đồng bộ từ thread vừa đổi → listener tự chuyển về
+# event loop của mình (vd. AlertFeed dùng call_soon_threadsafe).
+_SCORE_LISTENERS: list[Callable[[ManipulationWatchV1], None]] = []
+
+
+def on_scores_changed(fn: Callable[[ManipulationWatchV1], None]) -> Callable[[], None]:
+    """Đăng ký listener; trả hàm huỷ đăng ký."""
+    _SCORE_LISTENERS.append(fn)
+    return lambda: _SCORE_LISTENERS.remove(fn) if fn in _SCORE_LISTENERS else None
+
+
+def _notify_scores(eng: ManipulationWatchV1) -> None:
+    for fn in list(_SCORE_LISTENERS):
+        try:
+            fn(eng)
+        except Exception:  # listener lỗi không làm hỏng lần chấm / install
+            logger.exception("Listener bảng scores lỗi")
+
+
+def _build_and_swap() -> ManipulationWatchV1:
+    root = snapshot.attached_root()
+    if root is not None:
+        eng = attach_snapshot(root)
+    else:
+        eng = ManipulationWatchV1(data_dir=os.getenv("DATA_DIR"))
+    install_engine(eng)
+    return eng
+
+
+def _on_build_done(fut: Future) -> None:
+    global _BUILD, _BUILD_ERROR
+    exc = fut.exception()
+    with _RISK_LOCK:
+        if _BUILD is fut:
+            _BUILD = None
+        if exc is not None:
+            _BUILD_ERROR = exc
+    if exc is not None:
+        logger.error("Dựng risk engine thất bại: %s", exc)
+
+
+def start_warmup(force: bool = False) -> Future:
+    """Bắt đầu dựng engine ở background (nếu chưa có lần dựng nào đang chạy)."""
+    global _BUILD
+    with _RISK_LOCK:
+        if _BUILD is not None:
+            return _BUILD
+        if _RISK is not None and not force:
+            done: Future = Future()
+            done.set_result(_RISK)
+            return done
+        fut = _BUILD = _EXECUTOR.submit(_build_and_swap)
+    fut.add_done_callback(_on_build_done)
+    return fut
+
+
+def reload_engine() -> Future:
+    """Dựng lại engine (vd. dữ liệu mới) và hot-swap khi xong."""
+    root = snapshot.attached_root()
+    if root is not None:
+        # worker chỉ đọc: loader dựng + publish, mọi worker tự chuyển thế hệ
+        snapshot.request_reload(root)
+        done: Future = Future()
+        done.set_result(_RISK)
+        return done
+    return start_warmup(force=True)
+
+
+def engine_status() -> dict:
+    with _RISK_LOCK:
+        eng, building, err = _RISK, _BUILD is not None, _BUILD_ERROR
+    if eng is not None:
+        status = "ready"
+    elif building:
+        status = "warming"
+    elif err is not None:
+        status = "error"
+    else:
+        status = "idle"
+    out = {"status": status, "reloading": bool(eng is not None and building)}
+    if eng is not None:
+        out["fingerprint"] = eng.fingerprint
+        if eng.snapshot_dir is not None:
+            out["snapshot"] = eng.snapshot_dir.parent.name
+    if err is not None:
+        out["error"] = str(err)
+    return out
+
+
+def get_engine(block: bool = True) -> ManipulationWatchV1:
+    eng = _RISK
+    if eng is not None:
+        return eng
+    fut = start_warmup()
+    if not block:
+        raise EngineWarming("Risk engine đang khởi tạo, thử lại sau.")
+    return fut.result()
@@ -0,0 +1,270 @@
+# app/risk_eval.py
+
+from __future__ import annotations
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .datastore import load_table
+from .rf_infer import _mp_context
+from .risk_engine import (
+    ALERT_THRESHOLD,
+    DATA_PREP_VERSION,
+    OHLCV_FILE,
+    ManipulationWatchV1,
+    _prepare_ohlcv,
+    resolve_data_dir,
+)
+from .risk_aggregates import load_stock_info
+from .telemetry import LAST_STAGES, stage
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Event study / backtest cho tín hiệu risk_0_10
+#   python -m app.risk_eval [--horizons 5 10 20] [--thresholds 7 8 9] --out eval.json
+#   python -m app.risk_eval ... --compare eval.json [--max-drop 0.1]   # exit 1 nếu lift giảm > 10%
+#   1) OHLCV sort theo (ticker, ngày), chia shard theo ticker (đoạn dòng liên tiếp)
+#      → process pool; mỗi shard tính cửa sổ tương lai h phiên cho MỌI dòng bằng
+#      sliding window NumPy: lợi suất close[t+h]/close[t], drawdown min(low) / close[t],
+#      độ biến động std log-return (t, t+h] — cửa sổ vượt qua ticker khác bị bỏ
+#   2) lợi suất vượt trội = lợi suất − trung bình cùng ngày của toàn thị trường
+#   3) ghép với bảng scores theo (ticker, ngày); mỗi ngưỡng → tập sự kiện
+#      risk_0_10 >= ngưỡng; so với nền (mọi dòng đã chấm cùng nhóm):
+#      hit rate (drawdown ≤ −dd_hit), lift = hit rate / tỉ lệ nền, vol_lift
+#      theo toàn thị trường / sàn / năm
+#   4) --compare: cổng hồi quy khi đổi model / feature — lift tổng của mỗi
+#      (ngưỡng, h) không được thấp hơn bản cũ quá --max-drop
+# =========================================================
+HORIZONS = (5, 10, 20)
+THRESHOLDS = (7.0, ALERT_THRESHOLD, 9.0)
+DD_HIT = 0.10               # sự kiện "trúng": giảm sâu hơn 10% trong h phiên
+GROUPS = ("all", "exchange", "year")
+OUTCOMES = ("ret", "abn_ret", "dd", "vol")
+
+
+def eval_workers() -> int:
+    return max(int(os.getenv("RISK_EVAL_WORKERS") or os.cpu_count() or 1), 1)
+
+
+def _forward_windows(
+    close: np.ndarray, low: np.ndarray, pos: np.ndarray, size: np.ndarray, horizons: tuple[int, ...]
+) -> dict[str, np.ndarray]:
+    """
+    Cửa sổ tương lai cho 1 shard (dòng sort theo ticker, ngày). pos / size: vị trí
+    của dòng trong ticker / số phiên của ticker. Kết quả theo %, NaN nếu cửa sổ
+    thiếu phiên hoặc vượt sang ticker khác.
+    """
+    n = len(close)
+    out = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logret = np.diff(np.log(close), prepend=np.nan)
+        for h in horizons:
+            ret, dd, vol = (np.full(n, np.nan) for _ in range(3))
+            m = n - h
+            if m > 0:
+                ok = (pos[:m] + h) < size[:m]
+                ret[:m] = np.where(ok, close[h:] / close[:m] - 1.0, np.nan)
+                dd[:m] = np.where(ok, np.lib.stride_tricks.sliding_window_view(low[1:], h).min(axis=1) / close[:m] - 1.0, np.nan)
+                if h > 1:
+                    w = np.lib.stride_tricks.sliding_window_view(logret[1:], h)
+                    vol[:m] = np.where(ok, w.std(axis=1, ddof=1), np.nan)
+            out[f"ret_{h}"] = ret * 100.0
+            out[f"dd_{h}"] = np.minimum(dd, 0.0) * 100.0
+            out[f"vol_{h}"] = vol * 100.0
+    return out
+
+
+def _shard(args) -> dict[str, np.ndarray]:
+    return _forward_windows(*args)
+
+
+def forward_outcomes(ohlcv: pd.DataFrame, horizons: tuple[int, ...], workers: int | None = None) -> pd.DataFrame:
+    """(ticker, date) + ret_h / abn_ret_h / dd_h / vol_h (%) cho mọi phiên OHLCV, song song theo ticker."""
+    o = (
+        ohlcv[["ticker", "date", "close", "low"]]
+        .drop_duplicates(["ticker", "date"], keep="last")
+        .sort_values(["ticker", "date"], kind="mergesort")
+        .reset_index(drop=True)
+    )
+    close = o["close"].to_numpy(dtype=np.float64)
+    low = o["low"].fillna(o["close"]).to_numpy(dtype=np.float64)
+    code = pd.factorize(o["ticker"])[0]
+    starts = np.flatnonzero(np.r_[True, code[1:] != code[:-1]]) if len(o) else np.arange(0)
+    bounds = np.r_[starts, len(o)]
+    size = np.repeat(np.diff(bounds), np.diff(bounds))
+    pos = np.arange(len(o)) - np.repeat(starts, np.diff(bounds))
+
+    # shard = nhóm ticker liền nhau có số dòng xấp xỉ bằng nhau (ranh giới luôn ở đầu ticker)
+    workers = workers or eval_workers()
+    n_shards = max(min(workers * 4, len(starts)), 1)
+    cuts = np.unique(starts[np.searchsorted(starts, np.linspace(0, len(o), n_shards + 1)[1:-1])]) if len(o) else []
+    edges = np.r_[0, cuts, len(o)].astype(np.int64)
+    tasks = [(close[a:b], low[a:b], pos[a:b], size[a:b], horizons) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+    if workers <= 1 or len(tasks) < 2:
+        parts = [_shard(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), mp_context=_mp_context()) as ex:
+            parts = list(ex.map(_shard, tasks))
+
+    out = pd.DataFrame({"ticker": o["ticker"].to_numpy(), "date": o["date"].to_numpy()})
+    for key in (parts[0] if parts else {}):
+        out[key] = np.concatenate([p[key] for p in parts])
+    for h in horizons:
+        if f"ret_{h}" in out:
+            out[f"abn_ret_{h}"] = out[f"ret_{h}"] - out.groupby("date")[f"ret_{h}"].transform("mean")
+    return out
+
+
+def _table(frame: pd.DataFrame, by: list[str], thresholds, horizons, dd_hit: float) -> pd.DataFrame:
+    """Bảng sự kiện vs nền theo nhóm `by` cho mọi (ngưỡng, h): 1 groupby / (ngưỡng)."""
+    rows = []
+    keys = by or (lambda _: "all")
+    for h in horizons:
+        cols = {f"{k}_{h}": k for k in OUTCOMES}
+        f = frame[by + ["risk_0_10"] + list(cols)].rename(columns=cols)
+        f = f[f["ret"].notna()]
+        f = f.assign(hit=(f["dd"] <= -dd_hit * 100.0).astype(np.float64))
+        base = f.groupby(keys)[["hit", "vol"]].mean().rename(columns={"hit": "base_rate", "vol": "base_vol"})
+        for t in thresholds:
+            ev = f[f["risk_0_10"] >= t]
+            g = ev.groupby(keys)
+            tab = g[list(OUTCOMES)].mean().add_prefix("mean_")
+            tab["n"] = g.size()
+            tab["hit_rate"] = g["hit"].mean()
+            tab = tab.join(base, how="left")
+            tab["lift"] = tab["hit_rate"] / tab["base_rate"]
+            tab["vol_lift"] = tab["mean_vol"] / tab["base_vol"]
+            tab.insert(0, "horizon", h)
+            tab.insert(0, "threshold", t)
+            rows.append(tab.reset_index())
+    if not rows:
+        return pd.DataFrame()
+    out = pd.concat(rows, ignore_index=True)
+    return out.rename(columns={"index": "group"}) if not by else out.rename(columns={by[0]: "group"})
+
+
+def evaluate(
+    scores: pd.DataFrame,
+    ohlcv: pd.DataFrame,
+    stock_info: pd.DataFrame | None = None,
+    horizons: tuple[int, ...] = HORIZONS,
+    thresholds: tuple[float, ...] = THRESHOLDS,
+    dd_hit: float = DD_HIT,
+    workers: int | None = None,
+) -> dict:
+    """Báo cáo event study: {'config', 'data', 'tables': {all|exchange|year: [dòng]}}."""
+    with stage("eval.forward"):
+        fwd = forward_outcomes(ohlcv, horizons, workers)
+    with stage("eval.join"):
+        s = pd.DataFrame({
+            "ticker": scores["ticker"].astype(str).to_numpy(),
+            "date": scores["date"].to_numpy(),
+            "risk_0_10": scores["risk_0_10"].to_numpy(dtype=np.float64),
+        })
+        exchange = pd.Series(
+            scores["exchange"].astype(str).to_numpy() if "exchange" in scores.columns else "", index=s.index
+        )
+        if stock_info is not None and len(stock_info):
+            # sàn theo Stock_info như bảng tổng hợp (app/risk_aggregates.py), thiếu thì giữ sàn của scores
+            exchange = s["ticker"].map(stock_info.set_index("ticker")["exchange"]).fillna(exchange)
+        s["exchange"] = exchange.astype(object)
+        s["year"] = pd.DatetimeIndex(s["date"]).year
+        frame = s.merge(fwd, on=["ticker", "date"], how="left")
+    with stage("eval.tables"):
+        tables = {
+            group: _table(frame, [] if group == "all" else [group], thresholds, horizons, dd_hit)
+            for group in GROUPS
+        }
+    return {
+        "config": {"horizons": list(horizons), "thresholds": list(thresholds), "dd_hit": dd_hit},
+        "data": {
+            "rows": int(len(frame)),
+            "tickers": int(s["ticker"].nunique()),
+            "events": {str(t): int((s["risk_0_10"] >= t).sum()) for t in thresholds},
+        },
+        "tables": {
+            g: json.loads(t.to_json(orient="records", double_precision=6)) for g, t in tables.items()
+        },
+    }
+
+
+def compare(old: dict, new: dict, max_drop: float = 0.1) -> bool:
+    """In lift tổng (toàn thị trường) cũ → mới; False nếu (ngưỡng, h) nào giảm quá max_drop."""
+    def key(r):
+        return (float(r["threshold"]), int(r["horizon"]))
+
+    before = {key(r): r for r in old["tables"]["all"]}
+    ok = True
+    for r in new["tables"]["all"]:
+        prev = before.get(key(r))
+        if prev is None or prev.get("lift") is None or r.get("lift") is None:
+            continue
+        ratio = r["lift"] / prev["lift"] if prev["lift"] else float("inf")
+        bad = ratio < 1 - max_drop
+        ok &= not bad
+        print(f"{'FAIL' if bad else 'ok':>4}  risk>={key(r)[0]:<4} h={key(r)[1]:<3} "
+              f"lift {prev['lift']:.3f} → {r['lift']:.3f} ({ratio - 1:+.1%})  hit {r['hit_rate']:.3f}  n={r['n']}")
+    return ok
+
+
+def _print_table(rows: list[dict]) -> None:
+    print(f"{'risk>=':>6} {'h':>3} {'n':>8} {'hit':>7} {'base':>7} {'lift':>6} "
+          f"{'ret%':>7} {'abn%':>7} {'dd%':>7} {'vol%':>6} {'vlift':>6}")
+    for r in rows:
+        print(f"{r['threshold']:>6} {r['horizon']:>3} {r['n']:>8} {r['hit_rate'] or 0:7.4f} {r['base_rate'] or 0:7.4f} "
+              f"{r['lift'] or 0:6.3f} {r['mean_ret'] or 0:7.3f} {r['mean_abn_ret'] or 0:7.3f} "
+              f"{r['mean_dd'] or 0:7.3f} {r['mean_vol'] or 0:6.3f} {r['vol_lift'] or 0:6.3f}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m app.risk_eval",
+        description="Event study cho tín hiệu risk_0_10: lợi suất / drawdown / biến động sau alert, hit rate và lift.",
+    )
+    ap.add_argument("--data-dir", help="thư mục chứa OHLCV_Merge.csv, Share_outstanding.csv (mặc định DATA_DIR)")
+    ap.add_argument("--artifact-dir", help="thư mục artifact (mặc định RISK_ARTIFACT_DIR / backend/.cache/risk)")
+    ap.add_argument("--horizons", type=int, nargs="+", default=list(HORIZONS), help="số phiên nhìn về sau")
+    ap.add_argument("--thresholds", type=float, nargs="+", default=list(THRESHOLDS), help="ngưỡng risk_0_10 của sự kiện")
+    ap.add_argument("--dd-hit", type=float, default=DD_HIT, help="drawdown (tỉ lệ) tính là trúng")
+    ap.add_argument("--workers", type=int, help="số process (mặc định RISK_EVAL_WORKERS / số CPU)")
+    ap.add_argument("--out", help="ghi báo cáo JSON ra file này")
+    ap.add_argument("--compare", help="báo cáo JSON cũ: exit 1 nếu lift giảm quá --max-drop")
+    ap.add_argument("--max-drop", type=float, default=0.1)
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    t = time.perf_counter()
+    data_dir = resolve_data_dir(args.data_dir)
+    eng = ManipulationWatchV1(data_dir=str(data_dir), artifact_dir=args.artifact_dir)
+    with stage("eval.load_ohlcv"):
+        ohlcv = load_table(data_dir / OHLCV_FILE, _prepare_ohlcv, version=DATA_PREP_VERSION)
+    report = evaluate(
+        eng.scores, ohlcv, load_stock_info(data_dir),
+        horizons=tuple(args.horizons), thresholds=tuple(args.thresholds), dd_hit=args.dd_hit, workers=args.workers,
+    )
+    report["fingerprint"] = eng.fingerprint
+    report["elapsed_s"] = round(time.perf_counter() - t, 3)
+    report["stages"] = {k: round(v, 4) for k, v in sorted(LAST_STAGES.items()) if k.startswith("eval.")}
+    _print_table(report["tables"]["all"])
+    print(f"{report['data']['rows']} dòng, {report['data']['tickers']} mã trong {report['elapsed_s']:.1f}s")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            if not compare(json.load(f), report, args.max_drop):
+                return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,549 @@
+# app/risk_live.py
+
+from __future__ import annotations
+import asyncio
+import csv
+import json
+import logging
+import math
+import os
+from collections import deque
+from pathlib import Path
+from typing import AsyncIterator, Callable
+
+import numpy as np
+import pandas as pd
+
+from .pubsub import Broadcaster
+from .rf_infer import predict_positive
+from .risk_engine import (
+    ALERT_THRESHOLD,
+    BEHAVIOR_FEATURES,
+    PRICE_UNIT,
+    ROLL_WINDOWS,
+    VOLZ_WINDOW,
+    EngineWarming,
+    ManipulationWatchV1,
+    build_features,
+)
+from .score_index import ns_to_str, to_ns
+from .telemetry import REGISTRY, stage
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Risk intraday (tạm tính) từ luồng bar OHLCV
+#   - mỗi ticker giữ trạng thái cuộn của các phiên đã chốt (lấy từ tail buffer
+#     của engine) + phiên đang chạy gộp từ các bar: open đầu, high/low cực trị,
+#     close cuối, volume cộng dồn → cập nhật O(1) / bar
+#   - feature của phiên đang chạy (vol_z20, turnover_*, volz_*, range_*,
+#     close_loc_*, ...) = thống kê cộng dồn của ≤ 19 phiên đã chốt (tính lại
+#     1 lần khi chốt phiên) gộp với giá trị hiện tại → O(1) / ticker
+#   - định kỳ (RISK_LIVE_INTERVAL giây) chấm các ticker có bar mới bằng model
+#     đang phục vụ; turnover_pct / mkt_cap_pct / risk_0_10 xếp hạng chéo trên
+#     các ticker của phiên live mới nhất (cùng thời điểm trong phiên)
+#   - nguồn bar: tail file CSV, TCP (mỗi dòng 1 JSON), hoặc hàng đợi nội bộ
+#     (POST /api/risk/live:bars); kết quả ở /api/risk/live + WebSocket
+# Điểm live là tạm tính: phiên chỉ được chấm chính thức khi engine
+# append_session / reload với dữ liệu EOD.
+# =========================================================
+LIVE_BARS = REGISTRY.counter(
+    "risk_live_bars_total", "Bar intraday nhận được (result=applied|stale|late|unknown|invalid)"
+)
+
+VOLZ_MIN = max(5, VOLZ_WINDOW // 3)
+ROLL_MIN = {w: max(2, w // 2) for w in ROLL_WINDOWS}
+VOLAT_WINDOW, VOLAT_MIN = 10, 5
+ROLL_BASE = ("turnover", "vol_z20", "range_rel", "close_loc")
+
+_HIST_VOL = VOLZ_WINDOW - 1                        # volume của 19 phiên trước (vol_z20)
+_HIST_ROLL = max(max(ROLL_WINDOWS), VOLAT_WINDOW) - 1  # 9 phiên trước (rolling 10)
+_HIST_CLOSE = 5                                     # close_1 / close_3 / close_5
+_FEAT_POS = {f: i for i, f in enumerate(BEHAVIOR_FEATURES)}
+_NS_PER_DAY = 86_400 * 10**9
+_NAN = math.nan
+
+
+def _div(a: float, b: float) -> float:
+    """a / b theo ngữ nghĩa NumPy (chia 0 → ±inf / NaN) trên float Python."""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        return _NAN if a == 0 or math.isnan(a) else math.copysign(math.inf, a)
+
+
+def _sum_count(values) -> tuple[float, int]:
+    """Tổng + số phần tử khác NaN (rolling mean của pandas bỏ qua NaN)."""
+    s, n = 0.0, 0
+    for x in values:
+        if x == x:
+            s += x
+            n += 1
+    return s, n
+
+
+def _moments(values) -> tuple[int, float, float]:
+    """(n, mean, M2) của các phần tử khác NaN — cộng thêm 1 giá trị kiểu Welford."""
+    n, mean, m2 = 0, 0.0, 0.0
+    for x in values:
+        if x == x:
+            n += 1
+            d = x - mean
+            mean += d / n
+            m2 += d * (x - mean)
+    return n, mean, m2
+
+
+def _std_with(mom: tuple[int, float, float], x: float, min_periods: int) -> tuple[float, float]:
+    """(mean, std ddof=1) của cửa sổ = các phiên trước (mom) + x; NaN nếu chưa đủ min_periods."""
+    n, mean, m2 = mom
+    if x == x:
+        n += 1
+        d = x - mean
+        mean += d / n
+        m2 += d * (x - mean)
+    if n < min_periods or n < 2:
+        return _NAN, _NAN
+    return mean, math.sqrt(max(m2, 0.0) / (n - 1))
+
+
+def _last(d: deque, k: int) -> float:
+    return d[-k] if len(d) >= k else _NAN
+
+
+class _Ticker:
+    """Trạng thái cuộn của 1 ticker: lịch sử phiên đã chốt + phiên đang chạy."""
+
+    __slots__ = (
+        "exchange", "shares",
+        "close", "volume", "turnover", "vol_z20", "range_rel", "close_loc", "ret_1d",
+        "_part", "session", "o", "h", "l", "c", "v", "bars", "last_ts",
+    )
+
+    def __init__(self, exchange: str | None, shares: float):
+        self.exchange = exchange
+        self.shares = shares
+        self.close: deque = deque(maxlen=_HIST_CLOSE)
+        self.volume: deque = deque(maxlen=_HIST_VOL)
+        for name in (*ROLL_BASE, "ret_1d"):
+            setattr(self, name, deque(maxlen=_HIST_ROLL))
+        self._part: dict | None = None
+        self.session: int | None = None  # ngày (ns) của phiên đang chạy
+        self.o = self.h = self.l = self.c = self.v = _NAN
+        self.bars = 0
+        self.last_ts = 0
+
+    # ---- lịch sử phiên đã chốt ----
+    def push(self, close: float, volume: float, base: dict) -> None:
+        self.close.append(close)
+        self.volume.append(volume)
+        for name in (*ROLL_BASE, "ret_1d"):
+            getattr(self, name).append(base[name])
+        self._part = None
+
+    def _partials(self) -> dict:
+        """Thống kê của các phiên đã chốt cho từng cửa sổ (tính lại sau mỗi lần chốt)."""
+        if self._part is None:
+            p = {
+                "volume": _moments(self.volume),
+                "ret_1d": _moments(list(self.ret_1d)[-(VOLAT_WINDOW - 1):]),
+            }
+            for name in ROLL_BASE:
+                hist = list(getattr(self, name))
+                for w in ROLL_WINDOWS:
+                    p[name, w] = _sum_count(hist[-(w - 1):])
+            self._part = p
+        return self._part
+
+    # ---- phiên đang chạy ----
+    def add_bar(self, day: int, ts: int, o: float, h: float, l: float, c: float, v: float) -> bool:
+        if self.session is not None and day < self.session:
+            return False  # bar trễ của phiên đã chốt
+        if self.session is None or day > self.session:
+            if self.session is not None:
+                self._close_session()
+            self.session, self.o, self.h, self.l, self.c, self.v, self.bars = day, o, h, l, c, v, 1
+        else:
+            self.h = max(self.h, h)
+            self.l = min(self.l, l)
+            self.c = c
+            self.v += v
+            self.bars += 1
+        self.last_ts = max(self.last_ts, ts)
+        return True
+
+    def _close_session(self) -> None:
+        _, base = self.features()
+        self.push(self.c, self.v, base)
+
+    def features(self) -> tuple[list[float], dict]:
+        """
+        Feature của phiên đang chạy theo đúng công thức build_features
+        (turnover_pct / mkt_cap_pct để NaN — xếp hạng chéo điền sau).
+        """
+        p = self._partials()
+        h, l, c, v, sh = self.h, self.l, self.c, self.v, self.shares
+        c1, c3, c5 = _last(self.close, 1), _last(self.close, 3), _last(self.close, 5)
+
+        ret_1d = _div(c, c1) - 1
+        ret_5d = _div(c, c5) - 1
+        turnover = _div(v, sh)
+        vol_mean, vol_std = _std_with(p["volume"], v, VOLZ_MIN)
+        base = {
+            "turnover": turnover,
+            "vol_z20": _div(v - vol_mean, vol_std),
+            "range_rel": _div(h - l, c1),
+            "close_loc": _div(c - (h + l) / 2, h - l) if h != l else _NAN,
+            "ret_1d": ret_1d,
+        }
+        f = {
+            "ret_3d": _div(c, c3) - 1,
+            "ret_5d": ret_5d,
+            "range_rel": base["range_rel"],
+            "close_loc": base["close_loc"],
+        }
+        for w in ROLL_WINDOWS:
+            for name, col in zip(ROLL_BASE, (f"turnover_{w}d", f"volz_{w}d", f"range_{w}d", f"close_loc_{w}d")):
+                s, n = p[name, w]
+                x = base[name]
+                if x == x:
+                    s, n = s + x, n + 1
+                f[col] = s / n if n >= ROLL_MIN[w] else _NAN
+        f["vol_change_5d"] = _div(v, _last(self.volume, 5)) - 1
+        f["turnover_vol_ratio"] = turnover / (abs(base["vol_z20"]) + 1e-6)
+        f["abs_ret_5d"] = abs(ret_5d)
+        f["volatility_10d"] = _std_with(p["ret_1d"], ret_1d, VOLAT_MIN)[1]
+        f["price_slope_5d"] = (c - c5) / 5
+        base["mkt_cap"] = c * sh
+        return [f.get(name, _NAN) for name in BEHAVIOR_FEATURES], base
+
+
+def parse_bar(raw: dict) -> tuple:
+    """
+    Bar dạng dict → (ticker, ts_ns, open, high, low, close, volume, shares | None).
+    Nhận ticker|symbol, time|ts|datetime|date; close nhân PRICE_UNIT như _prepare_ohlcv.
+    """
+    ticker = raw.get("ticker") or raw.get("symbol")
+    ts = next((raw[k] for k in ("time", "ts", "datetime", "date") if raw.get(k) not in (None, "")), None)
+    if not ticker or ts is None:
+        raise ValueError("bar thiếu ticker hoặc thời gian")
+    o, h, l, c, v = (float(raw[k]) for k in ("open", "high", "low", "close", "volume"))
+    shares = raw.get("shares_outstanding")
+    shares = float(shares) if shares not in (None, "") else None
+    return str(ticker).upper().strip(), to_ns(ts), o, h, l, c * PRICE_UNIT, v, shares
+
+
+class LiveRiskState:
+    """
+    Trạng thái live của mọi ticker + điểm tạm tính. Không async, không khoá:
+    chỉ được gọi từ event loop (LiveRiskService).
+    """
+
+    def __init__(self, tail: pd.DataFrame, last_date_ns: int | None):
+        self.last_date = last_date_ns  # phiên EOD cuối đã chấm chính thức
+        self.tickers: dict[str, _Ticker] = {}
+        self.dirty: set[str] = set()
+        # ticker → (risk_raw, risk_0_10) của lần chấm gần nhất
+        self.scores: dict[str, tuple[float, float]] = {}
+        if tail is not None and len(tail):
+            self._seed(tail)
+
+    def _seed(self, tail: pd.DataFrame) -> None:
+        """Lịch sử cuộn từ tail buffer (feature tính bằng đúng pipeline batch)."""
+        df = build_features(tail.copy())
+        cols = {name: df[name].to_numpy(dtype=float).tolist() for name in ("close", "volume", *ROLL_BASE, "ret_1d")}
+        shares = df["shares_outstanding"].to_numpy(dtype=float).tolist()
+        ex = df["exchange"].astype(object).to_numpy() if "exchange" in df.columns else None
+        tk = df["ticker"].astype(str).to_numpy()
+        bounds = np.flatnonzero(np.r_[True, tk[1:] != tk[:-1], True])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            st = _Ticker(ex[hi - 1] if ex is not None else None, shares[hi - 1])
+            for i in range(max(lo, hi - _HIST_VOL), hi):
+                st.push(cols["close"][i], cols["volume"][i], {n: cols[n][i] for n in (*ROLL_BASE, "ret_1d")})
+            self.tickers[tk[lo]] = st
+
+    def apply(self, bar: tuple) -> str:
+        """Gộp 1 bar đã parse vào phiên đang chạy của ticker. Trả nhãn kết quả (metric)."""
+        ticker, ts, o, h, l, c, v, shares = bar
+        day = ts - ts % _NS_PER_DAY
+        if self.last_date is not None and day <= self.last_date:
+            return "stale"  # phiên đã có điểm chính thức
+        st = self.tickers.get(ticker)
+        if st is None:
+            if shares is None:
+                return "unknown"  # ticker mới, không có shares → không tính được turnover
+            st = self.tickers[ticker] = _Ticker(None, shares)
+        elif shares is not None:
+            st.shares = shares
+        if not st.add_bar(day, ts, o, h, l, c, v):
+            return "late"
+        self.dirty.add(ticker)
+        return "applied"
+
+    def live(self) -> list[str]:
+        """Ticker đang có phiên live thuộc phiên mới nhất (mã chưa có bar phiên đó thì không tính)."""
+        sessions = {t: st.session for t, st in self.tickers.items() if st.session is not None}
+        newest = max(sessions.values(), default=None)
+        return [t for t, day in sessions.items() if day == newest]
+
+    def pending(self) -> tuple[list[str], np.ndarray]:
+        """
+        Ticker có bar mới từ lần chấm trước + ma trận feature float32 (chỉ dòng hữu hạn).
+        turnover_pct / mkt_cap_pct: percentile trong các ticker của phiên live mới nhất
+        (như xếp hạng chéo theo ngày của batch); mã còn ở phiên cũ không được chấm.
+        """
+        dirty, self.dirty = self.dirty, set()
+        live = self.live()
+        if not dirty or not live:
+            return [], np.empty((0, len(BEHAVIOR_FEATURES)), dtype=np.float32)
+        st = self.tickers
+        turn = pd.Series([_div(st[t].v, st[t].shares) for t in live], index=live)
+        cap = pd.Series([st[t].c * st[t].shares for t in live], index=live)
+        turn_pct, cap_pct = turn.rank(pct=True), cap.rank(pct=True)
+
+        names = [t for t in live if t in dirty]
+        X = np.array([st[t].features()[0] for t in names], dtype=np.float32).reshape(len(names), -1)
+        X[:, _FEAT_POS["turnover_pct"]] = turn_pct[names].to_numpy()
+        X[:, _FEAT_POS["mkt_cap_pct"]] = cap_pct[names].to_numpy()
+        ok = np.isfinite(X).all(axis=1)
+        return [t for t, k in zip(names, ok) if k], X[ok]
+
+    def set_scores(self, names: list[str], prob: np.ndarray) -> list[str]:
+        """Ghi risk_raw mới, xếp hạng lại risk_0_10 trong phiên live mới nhất → ticker có điểm đổi."""
+        live = set(self.live())
+        raw = {t: r for t, (r, _) in self.scores.items() if t in live}
+        raw.update(zip(names, prob.tolist()))
+        if not raw:
+            return []
+        s = pd.Series(raw)
+        r010 = (s.rank(pct=True) * 10).clip(0, 10).round(1)
+        changed = set(names)
+        new = {}
+        for t, r, x in zip(s.index, s.to_numpy(), r010.to_numpy()):
+            new[t] = (float(r), float(x))
+            if t in self.scores and self.scores[t][1] != new[t][1]:
+                changed.add(t)
+        self.scores = new
+        return sorted(changed)
+
+    def snapshot(self, tickers: list[str] | None = None, min_risk: float | None = None) -> dict:
+        """Điểm tạm tính mới nhất dạng cột (giống score:batch)."""
+        names = sorted(self.scores) if tickers is None else [t for t in tickers if t in self.scores]
+        if min_risk is not None:
+            names = [t for t in names if self.scores[t][1] >= min_risk]
+        st = self.tickers
+        risk = [self.scores[t][1] for t in names]
+        return {
+            "ticker": names,
+            "session": ns_to_str([st[t].session for t in names]).tolist(),
+            "as_of": [str(pd.Timestamp(st[t].last_ts)) for t in names],
+            "bars": [st[t].bars for t in names],
+            "risk_0_10": risk,
+            "risk_raw": [self.scores[t][0] for t in names],
+            "alert": [x >= ALERT_THRESHOLD for x in risk],
+            "close": [st[t].c for t in names],
+            "volume": [st[t].v for t in names],
+            "turnover": [_div(st[t].v, st[t].shares) for t in names],
+            "exchange": [st[t].exchange for t in names],
+        }
+
+    def select(self, payload: dict, tickers: set[str]) -> dict | None:
+        """Chỉ giữ các dòng của `tickers` trong payload dạng cột; None nếu không còn dòng nào."""
+        keep = [i for i, t in enumerate(payload["ticker"]) if t in tickers]
+        if not keep:
+            return None
+        n = len(payload["ticker"])
+        return {
+            k: [v[i] for i in keep] if isinstance(v, list) and len(v) == n else v
+            for k, v in payload.items()
+        }
+
+    def rebase(self, tail: pd.DataFrame, last_date_ns: int | None) -> LiveRiskState:
+        """State mới trên tail của engine mới; giữ các phiên live chưa có điểm EOD."""
+        new = LiveRiskState(tail, last_date_ns)
+        for t, old in self.tickers.items():
+            if old.session is None or (last_date_ns is not None and old.session <= last_date_ns):
+                continue
+            st = new.tickers.get(t)
+            if st is None:
+                st = new.tickers[t] = _Ticker(old.exchange, old.shares)
+            st.add_bar(old.session, old.last_ts, old.o, old.h, old.l, old.c, old.v)
+            st.bars = old.bars
+            new.dirty.add(t)
+        return new
+
+
+# =========================================================
+# Nguồn bar (async iterator của dict)
+# =========================================================
+async def tail_csv(path: str | Path, poll: float = 0.5) -> AsyncIterator[dict]:
+    """Theo dõi file CSV (có header) như `tail -f`: đọc từ đầu rồi chờ dòng mới."""
+    path = Path(path)
+    while not path.exists():
+        await asyncio.sleep(poll)
+    with open(path, encoding="utf-8", newline="") as f:
+        header: list[str] | None = None
+        buf = ""
+        while True:
+            line = f.readline()
+            if not line:
+                await asyncio.sleep(poll)
+                continue
+            buf += line
+            if not buf.endswith("\n"):
+                continue  # dòng đang ghi dở
+            row, buf = next(csv.reader([buf]), []), ""
+            if not row:
+                continue
+            if header is None:
+                header = [h.strip() for h in row]
+            else:
+                yield dict(zip(header, row))
+
+
+async def tcp_bars(host: str, port: int, queue: asyncio.Queue) -> None:
+    """TCP server: mỗi dòng 1 bar JSON → queue."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                try:
+                    await queue.put(json.loads(line))
+                except json.JSONDecodeError:
+                    LIVE_BARS.inc(result="invalid")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logger.info("Risk live: nhận bar qua tcp://%s:%d", host, port)
+    async with server:
+        await server.serve_forever()
+
+
+# =========================================================
+# Service: hàng đợi bar → state → chấm định kỳ → broadcast
+# =========================================================
+class LiveRiskService:
+    """
+    Chạy trong event loop của server (lifespan). Bar từ mọi nguồn vào 1 hàng đợi;
+    mỗi `interval` giây các ticker có bar mới được chấm bằng model của engine
+    đang phục vụ (predict chạy trong thread), kết quả đổi được publish lên `hub`.
+    Engine được hot-swap (reload) → state dựng lại trên tail mới.
+    """
+
+    def __init__(
+        self,
+        engine: Callable[[], ManipulationWatchV1],
+        sources: list[str] | None = None,
+        interval: float = 1.0,
+        queue_size: int = 100_000,
+    ):
+        self._engine = engine
+        self.sources = sources or []
+        self.interval = interval
+        self.queue: asyncio.Queue = asyncio.Queue(queue_size)
+        self.hub = Broadcaster()
+        self.state: LiveRiskState | None = None
+        self._eng: ManipulationWatchV1 | None = None
+        self._gen: tuple[int, int] | None = None
+        self.runs = 0
+
+    @classmethod
+    def from_env(cls, engine: Callable[[], ManipulationWatchV1]) -> LiveRiskService:
+        """RISK_LIVE_SOURCES="tail:/path/bars.csv,tcp:0.0.0.0:9009", RISK_LIVE_INTERVAL giây."""
+        sources = [s.strip() for s in os.getenv("RISK_LIVE_SOURCES", "").split(",") if s.strip()]
+        return cls(engine, sources, float(os.getenv("RISK_LIVE_INTERVAL", "1.0")))
+
+    @property
+    def ready(self) -> bool:
+        return self.state is not None
+
+    def submit(self, bars: list[dict]) -> int:
+        """Đưa bar vào hàng đợi (không chờ); trả số bar nhận được."""
+        n = 0
+        for b in bars:
+            try:
+                self.queue.put_nowait(b)
+            except asyncio.QueueFull:
+                break
+            n += 1
+        return n
+
+    async def run(self) -> None:
+        tasks = [asyncio.create_task(self._consume()), asyncio.create_task(self._score_loop())]
+        for spec in self.sources:
+            kind, _, arg = spec.partition(":")
+            if kind == "tail":
+                tasks.append(asyncio.create_task(self._pump(tail_csv(arg))))
+            elif kind == "tcp":
+                host, _, port = arg.rpartition(":")
+                tasks.append(asyncio.create_task(tcp_bars(host or "127.0.0.1", int(port), self.queue)))
+            else:
+                logger.warning("Risk live: bỏ qua nguồn không hỗ trợ %r", spec)
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+
+    async def _pump(self, source: AsyncIterator[dict]) -> None:
+        async for bar in source:
+            await self.queue.put(bar)
+
+    async def _consume(self) -> None:
+        while True:
+            raw = await self.queue.get()
+            if self.state is None:
+                await self._wait_engine()
+            try:
+                result = self.state.apply(parse_bar(raw))
+            except (KeyError, ValueError, TypeError) as e:
+                logger.debug("Risk live: bar lỗi %r: %s", raw, e)
+                result = "invalid"
+            LIVE_BARS.inc(result=result)
+
+    async def _wait_engine(self) -> None:
+        while not self._sync_engine():
+            await asyncio.sleep(self.interval)
+
+    def _sync_engine(self) -> bool:
+        """Gắn state với bảng scores đang phục vụ; đổi → rebase. False nếu engine chưa sẵn sàng."""
+        try:
+            eng = self._engine()
+        except EngineWarming:
+            return False
+        gen = (id(eng), eng.generation)
+        if gen != self._gen:
+            # engine mới hoặc vừa append_session → dựng lại trên tail mới
+            last = int(eng.index.dates[-1]) if eng.index is not None and len(eng.index.dates) else None
+            self.state = (
+                LiveRiskState(eng.tail, last) if self.state is None else self.state.rebase(eng.tail, last)
+            )
+            self._eng, self._gen = eng, gen
+        return True
+
+    async def _score_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.score_once()
+            except Exception:  # 1 lần chấm lỗi không dừng luồng live
+                logger.exception("Risk live: chấm điểm lỗi")
+
+    async def score_once(self) -> list[str]:
+        """Chấm các ticker có bar mới; publish {"type": "update", ...} nếu có điểm đổi."""
+        if not self._sync_engine():
+            return []
+        state, model = self.state, self._eng.art.model
+        names, X = state.pending()
+        if not names:
+            return []
+        with stage("risk.live_score"):
+            prob = await asyncio.to_thread(predict_positive, model, X, None, 1)
+        if state is not self.state:  # engine vừa đổi trong lúc predict → bỏ kết quả cũ
+            return []
+        changed = state.set_scores(names, prob)
+        self.runs += 1
+        if changed and len(self.hub):
+            self.hub.publish({"type": "update", **state.snapshot(changed)})
+        return changed
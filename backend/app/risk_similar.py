@@ -0,0 +1,133 @@
+# app/risk_similar.py
+
+from __future__ import annotations
+from typing import Callable, Optional
+
+import numpy as np
+
+# =========================================================
+# Chỉ mục "hành vi tương tự" trên vector BEHAVIOR_FEATURES của bảng scores
+# (IVF: lượng tử thô bằng k-means + quét phẳng trong các ô gần nhất)
+#   - dựng lúc chấm điểm: chuẩn hoá (mean / std, cắt ±CLIP), k-means ~√N ô,
+#     hoán vị gom dòng cùng ô thành đoạn liên tiếp (order + offsets, như
+#     app/risk_aggregates.py), vector lưu float16 theo thứ tự đó
+#   - truy vấn: khoảng cách tới các tâm → NPROBE ô gần nhất → khoảng cách
+#     chính xác trên vài nghìn dòng → k láng giềng; không quét cả bảng
+#   - mọi thứ là mảng phẳng → lưu trong artifact / snapshot, nạp lại bằng mmap
+# Vị trí dòng luôn là vị trí trong bảng scores (append_session chỉ thêm dòng cuối).
+# =========================================================
+CLIP = 8.0              # |z| tối đa sau chuẩn hoá (feature đuôi dày: turnover, volz...)
+NPROBE = 16             # số ô quét mỗi truy vấn (recall@10 ~0.9 so với quét toàn bộ)
+KMEANS_PER_CELL = 64    # k-means chạy trên mẫu ~64 điểm / ô, gán ô cho toàn bảng sau
+KMEANS_ITERS = 15
+ASSIGN_CHUNK = 65_536
+
+
+def _n_cells(n: int) -> int:
+    return int(np.clip(round(np.sqrt(n)), 1, 4096)) if n else 0
+
+
+def _assign(z: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Ô gần nhất của từng vector (theo chunk để ma trận khoảng cách nhỏ)."""
+    out = np.empty(len(z), dtype=np.int32)
+    c2 = (centroids.astype(np.float32) ** 2).sum(axis=1)
+    for a in range(0, len(z), ASSIGN_CHUNK):
+        x = z[a:a + ASSIGN_CHUNK].astype(np.float32)
+        out[a:a + len(x)] = np.argmin(c2[None, :] - 2.0 * (x @ centroids.T), axis=1)
+    return out
+
+
+def _kmeans(z: np.ndarray, k: int, seed: int) -> np.ndarray:
+    """Lloyd trên mẫu ngẫu nhiên (đủ cho lượng tử thô, không cần hội tụ hẳn)."""
+    rng = np.random.default_rng(seed)
+    sample = z[rng.choice(len(z), min(len(z), KMEANS_PER_CELL * k), replace=False)].astype(np.float32)
+    centroids = sample[rng.choice(len(sample), k, replace=False)].copy()
+    for _ in range(KMEANS_ITERS):
+        cell = _assign(sample, centroids)
+        counts = np.bincount(cell, minlength=k)
+        sums = np.stack([np.bincount(cell, weights=col, minlength=k) for col in sample.T], axis=1)
+        nz = counts > 0
+        centroids[nz] = sums[nz] / counts[nz, None]
+    return centroids
+
+
+def _layout(z: np.ndarray, cell: np.ndarray, n_cells: int) -> dict[str, np.ndarray]:
+    """Gom dòng theo ô: order (vị trí dòng scores), offsets, vecs theo order, where (dòng → vị trí trong order)."""
+    order = np.argsort(cell, kind="stable").astype(np.int64)
+    where = np.empty(len(order), dtype=np.int64)
+    where[order] = np.arange(len(order))
+    return {
+        "cell": cell,
+        "order": order,
+        "offsets": np.concatenate([[0], np.cumsum(np.bincount(cell, minlength=n_cells))]).astype(np.int64),
+        "vecs": z[order].astype(np.float16),
+        "where": where,
+    }
+
+
+def build_arrays(X: np.ndarray, seed: int = 42) -> dict[str, np.ndarray]:
+    """Vector feature thô (dòng theo thứ tự bảng scores, đều hữu hạn) → mảng của chỉ mục."""
+    X = np.asarray(X, dtype=np.float32)
+    mean = X.mean(axis=0) if len(X) else np.zeros(X.shape[1], dtype=np.float32)
+    scale = X.std(axis=0) if len(X) else np.ones(X.shape[1], dtype=np.float32)
+    scale = np.where(scale > 0, scale, 1.0).astype(np.float32)
+    z = np.clip((X - mean) / scale, -CLIP, CLIP)
+    k = _n_cells(len(z))
+    centroids = _kmeans(z, k, seed) if k else np.zeros((0, X.shape[1]), dtype=np.float32)
+    cell = _assign(z, centroids) if k else np.zeros(0, dtype=np.int32)
+    return {"mean": mean.astype(np.float32), "scale": scale, "centroids": centroids, **_layout(z, cell, k)}
+
+
+class SimilarityIndex:
+    """Truy vấn k láng giềng gần nhất theo dòng scores (mảng từ build_arrays hoặc mmap)."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self._arrays = arrays
+        self.mean, self.scale = arrays["mean"], arrays["scale"]
+        self.centroids = arrays["centroids"]
+        self.order, self.offsets = arrays["order"], arrays["offsets"]
+        self.vecs, self.where = arrays["vecs"], arrays["where"]
+
+    @property
+    def n(self) -> int:
+        return len(self.order)
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return self._arrays
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(a.nbytes for a in self._arrays.values()))
+
+    def extend(self, X: np.ndarray) -> "SimilarityIndex":
+        """Thêm dòng mới (nối cuối bảng scores) vào ô gần nhất với chuẩn hoá / tâm hiện có."""
+        z_new = np.clip((np.asarray(X, dtype=np.float32) - self.mean) / self.scale, -CLIP, CLIP)
+        if not len(self.centroids):
+            return SimilarityIndex(build_arrays(X)) if len(z_new) else self
+        z = np.concatenate([self.vecs[self.where], z_new.astype(np.float16)])
+        cell = np.concatenate([self._arrays["cell"], _assign(z_new, self.centroids)])
+        arrays = {k: self._arrays[k] for k in ("mean", "scale", "centroids")}
+        return SimilarityIndex({**arrays, **_layout(z, cell, len(self.centroids))})
+
+    def query(self, row: int, k: int, exclude: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+              nprobe: int = NPROBE) -> tuple[np.ndarray, np.ndarray]:
+        """
+        k dòng scores gần dòng `row` nhất (không gồm chính nó) → (dòng, khoảng cách L2 trên z).
+        exclude(rows) → mask bool các dòng cần bỏ (vd. cùng ticker).
+        """
+        q = self.vecs[self.where[row]].astype(np.float32)
+        d_cell = ((self.centroids - q) ** 2).sum(axis=1)
+        cells = np.argsort(d_cell)[:nprobe]
+        cand = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in cells])
+        rows = self.order[cand]
+        keep = rows != row
+        if exclude is not None:
+            keep &= ~exclude(rows)
+        if keep.sum() < k and nprobe < len(self.centroids):
+            # bộ lọc loại gần hết ứng viên của các ô gần → mở rộng vùng quét
+            return self.query(row, k, exclude, nprobe * 4)
+        cand, rows = cand[keep], rows[keep]
+        dist = np.sqrt(((self.vecs[cand].astype(np.float32) - q) ** 2).sum(axis=1))
+        top = np.argsort(dist, kind="stable")[:k] if len(dist) <= k else np.argpartition(dist, k)[:k]
+        top = top[np.argsort(dist[top], kind="stable")]
+        return rows[top], dist[top]
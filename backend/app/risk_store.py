@@ -0,0 +1,176 @@
+# app/risk_store.py
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from .columnar import read_arrays, read_frame, write_arrays, write_frame
+
+logger = logging.getLogger(__name__)
+
+# Tăng khi đổi định dạng lưu trữ (không phải khi đổi feature/model)
+STORE_VERSION = 3
+
+MODEL_FILE = "model.joblib"
+FRAMES_DIR = "frames"
+ARRAYS_DIR = "arrays"
+MANIFEST_FILE = "manifest.json"
+
+
+def default_artifact_root() -> Path:
+    """RISK_ARTIFACT_DIR nếu có, mặc định backend/.cache/risk."""
+    env_dir = (os.getenv("RISK_ARTIFACT_DIR") or "").strip()
+    if env_dir:
+        return Path(env_dir)
+    return Path(__file__).resolve().parents[1] / ".cache" / "risk"
+
+
+def file_signature(path: Path) -> dict:
+    """Chữ ký rẻ của file đầu vào: tên + kích thước + mtime (ns)."""
+    st = path.stat()
+    return {"name": path.name, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def fingerprint(inputs: list[Path], config: dict) -> str:
+    """Khoá của bộ artifact: chữ ký file đầu vào + các hằng số feature/model."""
+    payload = {
+        "store_version": STORE_VERSION,
+        "inputs": [file_signature(p) for p in inputs],
+        "config": config,
+    }
+    raw = json.dumps(payload, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()[:16]
+
+
+class RiskArtifactStore:
+    """
+    Kho artifact theo phiên bản: <root>/<fingerprint>/
+        model.joblib   – RandomForest đã fit
+        frames/<name>/ – các bảng dạng cột (.npy, đọc bằng mmap): scores, tail, ...
+        arrays/<name>/ – mảng dựng sẵn theo dòng scores (vd. chỉ mục similar)
+        manifest.json  – fingerprint + config + thông tin đầu vào
+    """
+
+    def __init__(self, root: str | Path | None = None):
+        self.root = Path(root) if root else default_artifact_root()
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return (self.path_for(key) / MANIFEST_FILE).exists()
+
+    def latest(self, config: dict, data_dir: str | Path | None = None) -> str | None:
+        """
+        Fingerprint của artifact ghi gần nhất có cùng config (None nếu không có).
+        data_dir: chỉ xét artifact dựng từ cùng thư mục dữ liệu — scores / tail của
+        bộ dữ liệu khác không bao giờ được nối tiếp sang.
+        """
+        best: tuple[int, str] | None = None
+        if not self.root.is_dir():
+            return None
+        want = json.loads(json.dumps(config, default=str))
+        src = Path(data_dir).resolve() if data_dir is not None else None
+        for d in self.root.iterdir():
+            m = d / MANIFEST_FILE
+            if d.name.startswith(".") or not m.is_file():
+                continue
+            try:
+                with open(m, encoding="utf-8") as f:
+                    manifest = json.load(f)
+                mtime = m.stat().st_mtime_ns
+            except (OSError, ValueError):
+                continue
+            if manifest.get("config") != want:
+                continue
+            if src is not None and (
+                manifest.get("data_dir") is None or Path(manifest["data_dir"]).resolve() != src
+            ):
+                continue
+            if best is None or mtime > best[0]:
+                best = (mtime, d.name)
+        return best[1] if best else None
+
+    def load(
+        self, key: str, categorical: tuple[str, ...] = ()
+    ) -> tuple[object, dict[str, pd.DataFrame], dict] | None:
+        """
+        Trả (model, frames, manifest) hoặc None nếu chưa có / bị hỏng.
+        Các frame có tên trong `categorical` giữ cột chuỗi ở dạng pd.Categorical.
+        """
+        d = self.path_for(key)
+        if not (d / MANIFEST_FILE).exists():
+            return None
+        try:
+            with open(d / MANIFEST_FILE, encoding="utf-8") as f:
+                manifest = json.load(f)
+            model = joblib.load(d / MODEL_FILE)
+            frames = {
+                name: read_frame(d / FRAMES_DIR / name, categorical=name in categorical)
+                for name in manifest["frames"]
+            }
+        except Exception as e:
+            logger.warning("Không đọc được artifact %s: %s", d, e)
+            return None
+        return model, frames, manifest
+
+    def load_arrays(self, key: str, name: str) -> dict[str, np.ndarray] | None:
+        """Nhóm mảng `name` của artifact (mmap), None nếu artifact không có."""
+        d = self.path_for(key) / ARRAYS_DIR / name
+        if not d.is_dir():
+            return None
+        try:
+            return read_arrays(d)
+        except (OSError, ValueError) as e:
+            logger.warning("Không đọc được mảng %s: %s", d, e)
+            return None
+
+    def save(
+        self,
+        key: str,
+        model: object,
+        frames: dict[str, pd.DataFrame | None],
+        manifest: dict,
+        replace: bool = False,
+        arrays: dict[str, dict[str, np.ndarray] | None] | None = None,
+    ) -> Path:
+        """
+        Ghi vào thư mục tạm rồi rename → worker khác không bao giờ thấy bản dở dang.
+        replace=True: thay bản đã có cùng key (vd. train lại trên cùng dữ liệu);
+        worker đang mmap bản cũ vẫn đọc được tới khi nạp lại.
+        """
+        d = self.path_for(key)
+        tmp = d.with_name(f".{key}.tmp-{os.getpid()}")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+
+        joblib.dump(model, tmp / MODEL_FILE)
+        frames = {name: f for name, f in frames.items() if f is not None}
+        for name, frame in frames.items():
+            write_frame(frame, tmp / FRAMES_DIR / name)
+        arrays = {name: a for name, a in (arrays or {}).items() if a is not None}
+        for name, group in arrays.items():
+            write_arrays(group, tmp / ARRAYS_DIR / name)
+        with open(tmp / MANIFEST_FILE, "w", encoding="utf-8") as f:
+            json.dump(
+                {**manifest, "fingerprint": key, "frames": sorted(frames), "arrays": sorted(arrays)},
+                f, ensure_ascii=False, indent=2, default=str,
+            )
+
+        if d.exists() and (replace or not (d / MANIFEST_FILE).exists()):
+            shutil.rmtree(d, ignore_errors=True)  # bản cũ / bản hỏng từ lần ghi trước
+        try:
+            os.replace(tmp, d)
+        except OSError:
+            # worker khác đã ghi cùng fingerprint trước → giữ bản đó
+            shutil.rmtree(tmp, ignore_errors=True)
+        return d
@@ -0,0 +1,273 @@
+# app/risk_train.py
+
+from __future__ import annotations
+import argparse
+import io
+import itertools
+import json
+import logging
+import math
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score, average_precision_score, roc_auc_score
+
+from .risk_engine import (
+    _config_signature,
+    default_train_config,
+    fit_model,
+    input_paths,
+    load_panel,
+    resolve_data_dir,
+    score_panel,
+    train_mask,
+    training_set,
+)
+from .risk_store import RiskArtifactStore, fingerprint
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Train offline cho risk engine (server chỉ nạp artifact, không train)
+#   python -m app.risk_train [--folds 3] [--n-estimators 100 200 400] ...
+#   1) walk-forward CV trên panel (ticker, ngày) trước cutoff: mỗi fold train
+#      trên blue-chips trước block kiểm tra, đánh giá trên mọi ticker của block
+#   2) so sánh từng cấu hình RF: accuracy / ROC AUC / AP với thời gian fit,
+#      độ trễ predict và kích thước model serialize
+#   3) chọn model nhỏ nhất có AUC cách tốt nhất không quá --tol, fit lại trên
+#      toàn bộ vũ trụ train, chấm panel và ghi artifact cho server
+# =========================================================
+
+
+def walk_forward_folds(dates: pd.Series, cutoff: str, n_folds: int) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Chia các ngày trước cutoff thành n_folds + 1 block liên tiếp.
+    Fold k: train trên ngày < đầu block k+1, kiểm tra trên block k+1.
+    """
+    d = np.unique(dates[dates < pd.Timestamp(cutoff)].to_numpy())
+    if n_folds <= 0 or len(d) < n_folds + 1:
+        return []
+    blocks = np.array_split(d, n_folds + 1)[1:]
+    return [(pd.Timestamp(b[0]), pd.Timestamp(b[-1])) for b in blocks]
+
+
+def param_grid(base: dict, n_estimators=None, max_depth=None, min_samples_leaf=None) -> list[dict]:
+    """Tích Descartes các giá trị cần thử (None = giữ giá trị của base)."""
+    axes = {
+        "n_estimators": n_estimators or [base["n_estimators"]],
+        "max_depth": max_depth or [base["max_depth"]],
+        "min_samples_leaf": min_samples_leaf or [base["min_samples_leaf"]],
+    }
+    return [{**base, **dict(zip(axes, combo))} for combo in itertools.product(*axes.values())]
+
+
+def model_bytes(model) -> int:
+    """Kích thước model khi serialize bằng joblib (như file model.joblib)."""
+    buf = io.BytesIO()
+    joblib.dump(model, buf)
+    return buf.tell()
+
+
+def _safe(metric, y, p) -> float:
+    # fold chỉ có 1 lớp → AUC / AP không xác định
+    return float(metric(y, p)) if len(np.unique(y)) > 1 else math.nan
+
+
+def evaluate(model, X: np.ndarray, y: np.ndarray) -> dict:
+    t = time.perf_counter()
+    prob = model.predict_proba(X)[:, 1]
+    elapsed = time.perf_counter() - t
+    t = time.perf_counter()
+    model.predict_proba(X[:1])
+    one_row = time.perf_counter() - t
+    return {
+        "n_test": int(len(y)),
+        "accuracy": float(accuracy_score(y, prob >= 0.5)),
+        "roc_auc": _safe(roc_auc_score, y, prob),
+        "avg_precision": _safe(average_precision_score, y, prob),
+        "predict_us_per_row": elapsed / max(len(y), 1) * 1e6,
+        "predict_ms_1row": one_row * 1e3,
+    }
+
+
+def cross_validate(df: pd.DataFrame, grid: list[dict], cutoff: str, quantile: float, n_folds: int) -> list[dict]:
+    """Walk-forward CV cho từng cấu hình; trả 1 dòng / (cấu hình, fold)."""
+    rows: list[dict] = []
+    for fold, (start, end) in enumerate(walk_forward_folds(df["date"], cutoff, n_folds)):
+        X_tr, y_tr = training_set(df, train_mask(df, str(start.date()), quantile))
+        X_te, y_te = training_set(df, (df["date"] >= start) & (df["date"] <= end))
+        if len(y_tr) == 0 or len(y_te) == 0 or len(np.unique(y_tr)) < 2:
+            logger.warning("Bỏ qua fold %d (%s → %s): thiếu dữ liệu", fold, start.date(), end.date())
+            continue
+        for i, params in enumerate(grid):
+            t = time.perf_counter()
+            model = fit_model(X_tr, y_tr, params)
+            fit_s = time.perf_counter() - t
+            rows.append({
+                "config": i,
+                "fold": fold,
+                "test_start": str(start.date()),
+                "test_end": str(end.date()),
+                "n_train": int(len(y_tr)),
+                "fit_s": fit_s,
+                "model_bytes": model_bytes(model),
+                **evaluate(model, X_te, y_te),
+            })
+            logger.info("fold %d config %d: %s", fold, i, rows[-1])
+    return rows
+
+
+def summarize(rows: list[dict], grid: list[dict]) -> list[dict]:
+    """Trung bình theo cấu hình qua các fold."""
+    if not rows:
+        return []
+    agg = pd.DataFrame(rows).groupby("config").mean(numeric_only=True)
+    out = []
+    for i, r in agg.iterrows():
+        p = grid[int(i)]
+        out.append({
+            "config": int(i),
+            "n_estimators": p["n_estimators"],
+            "max_depth": p["max_depth"],
+            "min_samples_leaf": p["min_samples_leaf"],
+            **{k: float(r[k]) for k in (
+                "accuracy", "roc_auc", "avg_precision", "fit_s",
+                "predict_us_per_row", "predict_ms_1row", "model_bytes",
+            )},
+        })
+    return out
+
+
+def select(summary: list[dict], tol: float) -> int | None:
+    """Cấu hình nhỏ nhất (rồi predict nhanh nhất) có AUC ≥ AUC tốt nhất − tol."""
+    scored = [s for s in summary if not math.isnan(s["roc_auc"])]
+    if not scored:
+        return None
+    best = max(s["roc_auc"] for s in scored)
+    ok = [s for s in scored if s["roc_auc"] >= best - tol]
+    return min(ok, key=lambda s: (s["model_bytes"], s["predict_us_per_row"]))["config"]
+
+
+def train_artifact(
+    data_dir: str | Path | None = None,
+    artifact_dir: str | Path | None = None,
+    train_config: dict | None = None,
+    n_folds: int = 3,
+    grid: list[dict] | None = None,
+    tol: float = 0.002,
+) -> dict:
+    """
+    CV (nếu n_folds > 0) → chọn cấu hình → fit trên toàn bộ vũ trụ train →
+    chấm panel → ghi artifact theo đúng fingerprint mà server tính.
+    Trả báo cáo (cũng được ghi vào manifest["train"]).
+    """
+    cfg = {**default_train_config(), **(train_config or {})}
+    grid = grid or [cfg["rf_params"]]
+    data_dir = resolve_data_dir(data_dir)
+
+    t0 = time.perf_counter()
+    df = load_panel(data_dir)
+    panel_s = time.perf_counter() - t0
+
+    rows = cross_validate(df, grid, cfg["train_cutoff"], cfg["blue_chip_quantile"], n_folds) if n_folds > 0 else []
+    summary = summarize(rows, grid)
+    chosen = select(summary, tol)
+    params = grid[chosen if chosen is not None else 0]
+
+    X, y = training_set(df, train_mask(df, cfg["train_cutoff"], cfg["blue_chip_quantile"]))
+    if len(y) == 0:
+        raise ValueError("Tập train rỗng (kiểm tra train_cutoff / blue_chip_quantile)")
+    t = time.perf_counter()
+    model = fit_model(X, y, params)
+    fit_s = time.perf_counter() - t
+    scores, tail, similar = score_panel(df, model)
+    del df
+
+    report = {
+        "train_cutoff": cfg["train_cutoff"],
+        "blue_chip_quantile": cfg["blue_chip_quantile"],
+        "rf_params": params,
+        "n_train": int(len(y)),
+        "panel_s": panel_s,
+        "fit_s": fit_s,
+        "model_bytes": model_bytes(model),
+        "cv": {"folds": n_folds, "tol": tol, "grid": grid, "summary": summary, "selected": chosen, "rows": rows},
+    }
+    store = RiskArtifactStore(artifact_dir)
+    key = fingerprint(input_paths(data_dir), _config_signature())
+    path = store.save(
+        key,
+        model,
+        {"scores": scores, "tail": tail},
+        {
+            "config": _config_signature(),
+            "train": report,
+            "data_dir": str(data_dir),
+            "n_scores": int(len(scores)),
+        },
+        replace=True,
+        arrays={"similar": similar},
+    )
+    report["artifact"] = str(path)
+    return report
+
+
+def _depth(v: str) -> int | None:
+    return None if v.lower() == "none" else int(v)
+
+
+def _print_summary(summary: list[dict], chosen: int | None) -> None:
+    if not summary:
+        print("(không chạy CV)")
+        return
+    print(f"{'cfg':>3} {'trees':>5} {'depth':>5} {'leaf':>4} {'acc':>7} {'auc':>7} {'ap':>7} "
+          f"{'fit_s':>7} {'us/row':>7} {'ms/1row':>7} {'MB':>8}")
+    for s in summary:
+        mark = "*" if s["config"] == chosen else " "
+        print(f"{s['config']:>3}{mark}{s['n_estimators']:>5} {str(s['max_depth']):>5} {s['min_samples_leaf']:>4} "
+              f"{s['accuracy']:7.4f} {s['roc_auc']:7.4f} {s['avg_precision']:7.4f} "
+              f"{s['fit_s']:7.2f} {s['predict_us_per_row']:7.2f} {s['predict_ms_1row']:7.2f} "
+              f"{s['model_bytes'] / 2**20:8.1f}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    base = default_train_config()
+    ap = argparse.ArgumentParser(
+        prog="python -m app.risk_train",
+        description="Train offline RandomForest cho risk engine và ghi artifact cho server.",
+    )
+    ap.add_argument("--data-dir", help="thư mục chứa OHLCV_Merge.csv, Share_outstanding.csv (mặc định DATA_DIR)")
+    ap.add_argument("--artifact-dir", help="thư mục artifact (mặc định RISK_ARTIFACT_DIR / backend/.cache/risk)")
+    ap.add_argument("--train-cutoff", default=base["train_cutoff"])
+    ap.add_argument("--blue-chip-quantile", type=float, default=base["blue_chip_quantile"])
+    ap.add_argument("--folds", type=int, default=3, help="số fold walk-forward (0 = bỏ CV)")
+    ap.add_argument("--n-estimators", type=int, nargs="+")
+    ap.add_argument("--max-depth", type=_depth, nargs="+", help="số nguyên hoặc 'none'")
+    ap.add_argument("--min-samples-leaf", type=int, nargs="+")
+    ap.add_argument("--tol", type=float, default=0.002, help="AUC được phép kém cấu hình tốt nhất khi chọn model nhỏ hơn")
+    ap.add_argument("--report", help="ghi báo cáo JSON ra file này")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    grid = param_grid(base["rf_params"], args.n_estimators, args.max_depth, args.min_samples_leaf)
+    report = train_artifact(
+        data_dir=args.data_dir,
+        artifact_dir=args.artifact_dir,
+        train_config={"train_cutoff": args.train_cutoff, "blue_chip_quantile": args.blue_chip_quantile},
+        n_folds=args.folds,
+        grid=grid,
+        tol=args.tol,
+    )
+    _print_summary(report["cv"]["summary"], report["cv"]["selected"])
+    print(f"model: {report['rf_params']}  fit {report['fit_s']:.1f}s  "
+          f"{report['model_bytes'] / 2**20:.1f} MB → {report['artifact']}")
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
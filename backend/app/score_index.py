@@ -0,0 +1,223 @@
+# app/score_index.py
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+
+def to_ns(date) -> int:
+    """Ngày (str / Timestamp / datetime64) → int64 nanosecond."""
+    return pd.Timestamp(date).value
+
+
+def ns_to_str(values: np.ndarray) -> np.ndarray:
+    """Mảng int64 ns → mảng chuỗi 'YYYY-MM-DD' (giống str(ts.date()))."""
+    return np.datetime_as_string(np.asarray(values, dtype="int64").view("datetime64[ns]"), unit="D")
+
+
+_NS_PER_DAY = 86_400 * 10**9
+
+
+def _day(ns: np.ndarray | int) -> np.ndarray | int:
+    """int64 ns → số ngày kể từ epoch (dịch +2^31 để luôn dương trong 32 bit)."""
+    return (np.floor_divide(ns, _NS_PER_DAY) + (1 << 31)) & 0xFFFFFFFF
+
+
+def _ranges(lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    """Nối các đoạn [lo_i, hi_i) thành 1 mảng vị trí (không vòng lặp Python)."""
+    n = np.maximum(hi - lo, 0)
+    if n.sum() == 0:
+        return np.arange(0)
+    starts = np.repeat(lo - np.concatenate([[0], np.cumsum(n)[:-1]]), n)
+    return starts + np.arange(n.sum())
+
+
+class ScoreIndex:
+    """
+    Chỉ mục dựng 1 lần trên bảng scores (đã sort theo date tăng, risk_0_10 giảm):
+      - theo ticker: hoán vị `t_order` gom các dòng của cùng ticker thành 1 đoạn
+        liên tiếp (giữ thứ tự ngày) → binary search ngày trong đoạn.
+      - theo ngày: mỗi ngày là 1 block liên tiếp đã xếp hạng sẵn → top-k = k dòng đầu.
+    Mọi truy vấn trả về vị trí dòng (int) trong bảng scores.
+    """
+
+    def __init__(self, scores: pd.DataFrame, arrays: dict[str, np.ndarray] | None = None):
+        """arrays: mảng đã dựng sẵn (từ arrays() của 1 index trên cùng bảng scores) → không sort lại."""
+        self.n = len(scores)
+        self.date = scores["date"].to_numpy().astype("datetime64[ns]", copy=False).view("int64")
+        if arrays is None and self.n and np.any(np.diff(self.date) < 0):
+            raise ValueError("scores phải được sort theo date trước khi dựng index")
+        # cột số dùng cho response: view NumPy, không copy
+        self.values = {
+            c: scores[c].to_numpy()
+            for c in scores.columns
+            if c != "date" and pd.api.types.is_numeric_dtype(scores[c].dtype)
+        }
+
+        # ---- theo ticker ----
+        # ticker dạng category (bảng scores gọn) → dùng thẳng mã int, không
+        # dựng mảng object 1 chuỗi / dòng
+        tk = scores["ticker"]
+        if isinstance(tk.dtype, pd.CategoricalDtype):
+            codes = tk.cat.codes.to_numpy()
+            uniq = np.asarray(tk.cat.categories, dtype=object)
+        else:
+            codes, uniq = pd.factorize(tk.to_numpy(dtype=object))
+            uniq = np.asarray(uniq, dtype=object)
+        self._codes = codes
+        self._names = uniq
+        if arrays is None:
+            arrays = self._build(codes, len(uniq))
+        self.t_order = arrays["t_order"]
+        self.t_key = arrays["t_key"]
+        self._bounds = bounds = arrays["t_bounds"]
+        counts = np.diff(bounds)
+        self.t_span: dict[str, tuple[int, int]] = {
+            t: (int(bounds[i]), int(bounds[i + 1])) for i, t in enumerate(uniq) if counts[i]
+        }
+        self.t_code = {t: i for i, t in enumerate(uniq) if counts[i]}
+
+        # ---- theo ngày ----
+        self.dates = arrays["dates"]
+        self._first = first = arrays["d_first"]
+        ends = np.append(first[1:], self.n)
+        self.d_span: dict[int, tuple[int, int]] = {
+            int(d): (int(a), int(b)) for d, a, b in zip(self.dates, first, ends)
+        }
+
+    def _build(self, codes: np.ndarray, n_names: int) -> dict[str, np.ndarray]:
+        t_order = np.argsort(codes, kind="stable").astype(np.int32 if self.n < 2**31 else np.int64)
+        counts = np.bincount(codes, minlength=n_names) if self.n else np.zeros(n_names, dtype=int)
+        # khoá gộp (mã ticker << 32 | ngày) tăng dần theo thứ tự t_order
+        # → searchsorted cho cả truy vấn 1 ticker lẫn nhiều ticker cùng lúc
+        t_codes = np.repeat(np.arange(n_names, dtype="int64"), counts)
+        uniq_d, first = np.unique(self.date, return_index=True)
+        return {
+            "t_order": t_order,
+            "t_key": (t_codes << 32) | _day(self.date[t_order]),
+            "t_bounds": np.concatenate([[0], np.cumsum(counts)]).astype("int64"),
+            "dates": uniq_d,
+            "d_first": first.astype("int64"),
+        }
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """Mảng dựng sẵn của chỉ mục (ghi ra đĩa rồi truyền lại cho ScoreIndex(scores, arrays))."""
+        return {"t_order": self.t_order, "t_key": self.t_key, "t_bounds": self._bounds,
+                "dates": self.dates, "d_first": self._first}
+
+    @property
+    def nbytes(self) -> int:
+        """Mảng riêng của chỉ mục (date / mã ticker là view trên bảng scores, không tính)."""
+        return int(self.t_order.nbytes + self.t_key.nbytes + self.dates.nbytes)
+
+    @property
+    def ticker_codes(self) -> np.ndarray:
+        """Mã ticker nội bộ của từng dòng scores (chỉ số vào ticker_names)."""
+        return self._codes
+
+    @property
+    def ticker_names(self) -> np.ndarray:
+        """Tên ticker theo mã nội bộ (mảng object)."""
+        return self._names
+
+    def tickers(self, rows: np.ndarray) -> np.ndarray:
+        """Tên ticker của các dòng (mảng object)."""
+        return self._names[self._codes[rows]]
+
+    # ---------------- per-ticker ----------------
+    def has(self, ticker: str) -> bool:
+        return ticker in self.t_span
+
+    def rows(self, ticker: str) -> np.ndarray:
+        """Các dòng của ticker, theo thứ tự ngày tăng."""
+        span = self.t_span.get(ticker)
+        if span is None:
+            return self.t_order[:0]
+        return self.t_order[span[0]:span[1]]
+
+    def latest(self, ticker: str, date_ns: int | None = None) -> int | None:
+        """Dòng cuối cùng của ticker có date <= date_ns (None = dòng mới nhất)."""
+        span = self.t_span.get(ticker)
+        if span is None:
+            return None
+        a, b = span
+        if date_ns is None:
+            return int(self.t_order[b - 1])
+        key = self._key(np.int64(self.t_code[ticker]), date_ns)
+        i = a + int(np.searchsorted(self.t_key[a:b], key, side="right")) - 1
+        if i < a:
+            return None
+        return int(self.t_order[i])
+
+    def latest_all(self) -> np.ndarray:
+        """Dòng mới nhất của mọi ticker (như latest(t) không có ngày, cho tất cả t)."""
+        ends = np.fromiter((b for _, b in self.t_span.values()), dtype=np.int64, count=len(self.t_span))
+        return self.t_order[ends - 1]
+
+    def order_pos(self, rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Vị trí của các dòng trong t_order + cuối đoạn ticker của chúng (dòng sau = t_order[pos + h])."""
+        codes = self._codes[rows].astype("int64")
+        pos = np.searchsorted(self.t_key, (codes << 32) | _day(self.date[rows]))
+        return pos, self._bounds[codes + 1]
+
+    def tail(self, ticker: str, n: int) -> np.ndarray:
+        """n dòng gần nhất của ticker, theo thứ tự ngày tăng."""
+        r = self.rows(ticker)
+        return r[max(len(r) - n, 0):]
+
+    # ---------------- nhiều ticker (batch) ----------------
+    def codes(self, tickers: list[str]) -> np.ndarray:
+        """Mã nội bộ của từng ticker (-1 nếu không có dữ liệu)."""
+        return np.array([self.t_code.get(t, -1) for t in tickers], dtype="int64")
+
+    def _key(self, codes: np.ndarray, date_ns: int) -> np.ndarray:
+        return (codes << 32) | _day(np.int64(date_ns))
+
+    def latest_many(self, tickers: list[str], date_ns: int | None = None) -> np.ndarray:
+        """Như latest() cho cả danh sách; trả vị trí dòng (-1 nếu không có)."""
+        codes = self.codes(tickers)
+        out = np.full(len(codes), -1, dtype="int64")
+        ok = codes >= 0
+        if not ok.any():
+            return out
+        if date_ns is None:
+            # dòng ngay trước khoá nhỏ nhất của ticker kế tiếp = dòng mới nhất
+            i = np.searchsorted(self.t_key, (codes[ok] + 1) << 32, side="left") - 1
+        else:
+            i = np.searchsorted(self.t_key, self._key(codes[ok], date_ns), side="right") - 1
+        found = (i >= 0) & ((self.t_key[np.maximum(i, 0)] >> 32) == codes[ok])
+        out[np.flatnonzero(ok)[found]] = self.t_order[i[found]]
+        return out
+
+    def range_many(
+        self,
+        tickers: list[str],
+        start_ns: int | None = None,
+        end_ns: int | None = None,
+        last: int | None = None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Dòng của từng ticker trong [start, end] (theo ngày, giới hạn `last` dòng cuối).
+        Trả (positions, offsets): dòng của ticker j là positions[offsets[j]:offsets[j+1]].
+        """
+        codes = self.codes(tickers)
+        ok = codes >= 0
+        c = np.where(ok, codes, 0)
+        lo = np.searchsorted(self.t_key, (c << 32) if start_ns is None else self._key(c, start_ns), side="left")
+        hi = np.searchsorted(self.t_key, ((c + 1) << 32) if end_ns is None else self._key(c, end_ns), side="right")
+        hi = np.where(ok, hi, lo)
+        if last is not None:
+            lo = np.maximum(lo, hi - last)
+        n = np.maximum(hi - lo, 0)
+        offsets = np.concatenate([[0], np.cumsum(n)])
+        return self.t_order[_ranges(lo, hi)], offsets
+
+    # ---------------- per-date ----------------
+    def top(self, date_ns: int, k: int) -> np.ndarray:
+        """k dòng risk_0_10 cao nhất của ngày (block đã xếp hạng sẵn)."""
+        span = self.d_span.get(date_ns)
+        if span is None:
+            return np.arange(0)
+        a, b = span
+        return np.arange(a, min(a + k, b))
@@ -0,0 +1,335 @@
+# app/screener.py
+
+from __future__ import annotations
+import ast
+from functools import lru_cache
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .datastore import find_column
+from .sectors import YEAR_CANDIDATES, sector_averages, sector_key
+
+# =========================================================
+# Bộ lọc cơ bản trên toàn vũ trụ mã
+#   - bảng (symbol, năm) dựng 1 lần lúc load từ Indicators / Income_statement /
+#     Balance_sheet / Cash_flow (đã chuẩn hoá số) + ngành, sàn (Stock_info) và
+#     trung bình ngành cùng năm (Average_indicators): mỗi chỉ số 1 mảng float64
+#   - biểu thức lọc / sắp xếp (cú pháp Python, chỉ phép so sánh / số học / and-or)
+#     được biên dịch 1 lần rồi chạy vectorized trên các mảng → không vòng lặp / mã
+#     vd. filter="pe < sector_pe and roe > 15 and revenue_growth > 10 and de < 1"
+#         sort="-roe, pe"
+# =========================================================
+SYMBOL_CANDIDATES = ['symbol', 'ma', 'mã', 'ticker', 'code']
+
+# chỉ số: (bảng, tên cột ứng viên theo thứ tự ưu tiên — như find_column)
+METRICS: dict[str, tuple[str, list[str]]] = {
+    'pe': ('indicators', ['p/e', 'pe']),
+    'pb': ('indicators', ['p/b', 'pb']),
+    'eps': ('indicators', ['eps']),
+    'bvps': ('indicators', ['bvps']),
+    'roe': ('indicators', ['roe']),
+    'roa': ('indicators', ['roa']),
+    'de': ('indicators', ['nợ / vốn chủ sở hữu', 'debt to equity', 'd/e']),
+    'gross_margin': ('indicators', ['biên lợi nhuận gộp', 'gross margin']),
+    'net_margin': ('indicators', ['biên lợi nhuận ròng', 'net margin']),
+    'current_ratio': ('indicators', ['thanh khoản hiện hành', 'current ratio']),
+    'quick_ratio': ('indicators', ['thanh khoản nhanh', 'quick ratio']),
+    'revenue': ('income_statement', ['doanh thu thuần', 'net revenue']),
+    'gross_profit': ('income_statement', ['lợi nhuận gộp', 'gross profit']),
+    'pretax_income': ('income_statement', ['tổng lợi nhuận kế toán trước thuế', 'profit before tax']),
+    'net_income': ('income_statement', ['lợi nhuận sau thuế thu nhập doanh nghiệp', 'net income']),
+    'total_assets': ('balance_sheet', ['tổng cộng tài sản', 'total assets']),
+    'liabilities': ('balance_sheet', ['nợ phải trả', 'liabilities']),
+    'equity': ('balance_sheet', ['vốn chủ sở hữu', 'equity']),
+    'cash': ('balance_sheet', ['tiền và tương đương tiền', 'cash']),
+    'operating_cf': ('cash_flow', ['từ các hoạt động sản xuất kinh doanh', 'operating']),
+    'capex': ('cash_flow', ['tiền chi để mua sắm', 'capital expenditure']),
+    'dividends_paid': ('cash_flow', ['cổ tức đã trả', 'dividends paid']),
+}
+# tăng trưởng so với năm liền trước của cùng mã (%)
+GROWTH = {'revenue_growth': 'revenue', 'net_income_growth': 'net_income', 'eps_growth': 'eps'}
+# trung bình ngành cùng năm (Average_indicators có cùng các cột như Indicators)
+SECTOR_METRICS = ['pe', 'pb', 'eps', 'roe', 'roa', 'de', 'gross_margin', 'net_margin', 'current_ratio']
+LABELS = ('symbol', 'sector', 'exchange')   # cột chuỗi (mã int + bảng tên)
+DEFAULT_FIELDS = ['pe', 'pb', 'roe', 'roa', 'revenue_growth', 'eps_growth', 'de']
+MAX_LIMIT = 1000
+MAX_FILTER_NODES = 512   # số nút AST tối đa của biểu thức lọc (biên dịch / chạy đệ quy theo nút)
+
+
+def _keyed(df: Optional[pd.DataFrame], table: str) -> Optional[pd.DataFrame]:
+    """Bảng → (symbol, year, các chỉ số của bảng), 1 dòng / (symbol, year) (giữ dòng cuối)."""
+    if df is None:
+        return None
+    sym, year = find_column(df, SYMBOL_CANDIDATES), find_column(df, YEAR_CANDIDATES)
+    if not sym or not year:
+        return None
+    out = pd.DataFrame({
+        'symbol': df[sym].astype(str).str.upper().str.strip().to_numpy(),
+        'year': pd.to_numeric(df[year], errors='coerce').to_numpy(),
+    })
+    for name, (src, candidates) in METRICS.items():
+        col = find_column(df, candidates) if src == table else None
+        if col:
+            out[name] = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64')
+    out = out.dropna(subset=['year'])
+    out['year'] = out['year'].astype('int64')
+    return out.drop_duplicates(['symbol', 'year'], keep='last')
+
+
+def build_panel(
+    frames: dict[str, Optional[pd.DataFrame]],
+    stock_info: Optional[pd.DataFrame] = None,
+    average_indicators: Optional[pd.DataFrame] = None,
+) -> dict[str, np.ndarray]:
+    """
+    Bảng (symbol, year) sort theo symbol rồi year → dict mảng phẳng:
+    'code.<nhãn>' / 'names.<nhãn>' cho symbol / sector / exchange, 'year',
+    'm.<chỉ số>' float64 (NaN = không có dữ liệu).
+    """
+    panel = None
+    for table, df in frames.items():
+        part = _keyed(df, table)
+        if part is None:
+            continue
+        panel = part if panel is None else panel.merge(part, on=['symbol', 'year'], how='outer')
+    if panel is None:
+        panel = pd.DataFrame({'symbol': pd.Series(dtype=object), 'year': pd.Series(dtype='int64')})
+    panel = panel.sort_values(['symbol', 'year'], kind='mergesort').reset_index(drop=True)
+    for name in METRICS:
+        if name not in panel.columns:
+            panel[name] = np.nan
+
+    # tăng trưởng YoY: dòng trước của cùng mã, đúng năm liền trước
+    prev_ok = (panel['symbol'].eq(panel['symbol'].shift()) & panel['year'].sub(panel['year'].shift()).eq(1)).to_numpy()
+    for name, base in GROWTH.items():
+        cur = panel[base].to_numpy()
+        prev = np.where(prev_ok, panel[base].shift().to_numpy(), np.nan)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            panel[name] = np.where(prev != 0, (cur - prev) / np.abs(prev) * 100.0, np.nan)
+    panel['fcf'] = panel['operating_cf'] + panel['capex']  # capex ghi số âm trên báo cáo LCTT
+
+    # ngành / sàn (Stock_info) + trung bình ngành cùng năm (Average_indicators)
+    panel['sector'] = pd.Series(pd.NA, index=panel.index, dtype=object)
+    panel['exchange'] = pd.Series(pd.NA, index=panel.index, dtype=object)
+    if stock_info is not None and len(stock_info):
+        info = stock_info.set_index('ticker')
+        panel['sector'] = panel['symbol'].map(info['sector'])
+        panel['exchange'] = panel['symbol'].map(info['exchange'])
+    for name in SECTOR_METRICS:
+        panel[f'sector_{name}'] = np.nan
+    avg = sector_averages(average_indicators, {name: METRICS[name][1] for name in SECTOR_METRICS})
+    if avg is not None:
+        key = sector_key(panel['sector'], panel['year'])
+        for name in SECTOR_METRICS:
+            if name in avg.columns:
+                panel[f'sector_{name}'] = key.map(avg[name]).to_numpy(dtype='float64')
+
+    out: dict[str, np.ndarray] = {'year': panel['year'].to_numpy(dtype='int32')}
+    for label in LABELS:
+        codes, names = pd.factorize(panel[label], sort=True)
+        out[f'code.{label}'] = codes.astype('int32')
+        out[f'names.{label}'] = np.asarray(names, dtype=str)
+    for c in panel.columns:
+        if c not in LABELS and c != 'year':
+            out[f'm.{c}'] = panel[c].to_numpy(dtype='float64')
+    return out
+
+
+# ---------------- Biểu thức lọc / sắp xếp ----------------
+_CMP = {ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+        ast.Eq: np.equal, ast.NotEq: np.not_equal}
+_ARITH = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+
+Program = Callable[['MetricPanel', np.ndarray], np.ndarray]
+
+
+def _compile(node: ast.AST, names: set[str]) -> Program:
+    """AST đã kiểm tra → hàm (panel, rows) → mảng; chỉ cho phép các nút an toàn."""
+    if isinstance(node, ast.Expression):
+        return _compile(node.body, names)
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(v, names) for v in node.values]
+        op = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return lambda p, r: op.reduce([f(p, r) for f in parts])
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.Not, ast.USub, ast.UAdd)):
+        f = _compile(node.operand, names)
+        if isinstance(node.op, ast.Not):
+            return lambda p, r: np.logical_not(f(p, r))
+        return (lambda p, r: np.negative(f(p, r))) if isinstance(node.op, ast.USub) else f
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH:
+        a, b, op = _compile(node.left, names), _compile(node.right, names), _ARITH[type(node.op)]
+
+        def arith(p, r):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return op(a(p, r), b(p, r))
+        return arith
+    if isinstance(node, ast.Compare):
+        steps, left = [], node.left
+        for op, right in zip(node.ops, node.comparators):
+            steps.append(_compare(left, op, right, names))
+            left = right
+        return lambda p, r: np.logical_and.reduce([f(p, r) for f in steps])
+    if isinstance(node, ast.Name):
+        if node.id in LABELS:
+            raise ValueError(f"'{node.id}' chỉ dùng được trong phép == / != / in với chuỗi")
+        names.add(node.id)
+        return lambda p, r, n=node.id: p.column(n, r)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        v = float(node.value)
+        return lambda p, r: v
+    raise ValueError(f"Biểu thức không hỗ trợ: {ast.unparse(node)}")
+
+
+def _compare(left: ast.AST, op: ast.cmpop, right: ast.AST, names: set[str]) -> Program:
+    # nhãn chuỗi: sector == "Banks", exchange in ("HOSE", "HNX"), symbol != "VCB"
+    if isinstance(left, ast.Name) and left.id in LABELS:
+        label = left.id
+        if isinstance(op, (ast.Eq, ast.NotEq)) and isinstance(right, ast.Constant) and isinstance(right.value, str):
+            values = [right.value]
+        elif isinstance(op, (ast.In, ast.NotIn)) and isinstance(right, (ast.List, ast.Tuple, ast.Set)) and all(
+            isinstance(e, ast.Constant) and isinstance(e.value, str) for e in right.elts
+        ):
+            values = [e.value for e in right.elts]
+        else:
+            raise ValueError(f"'{label}' chỉ so sánh được bằng == / != / in với chuỗi")
+        negate = isinstance(op, (ast.NotEq, ast.NotIn))
+        return lambda p, r: p.label_in(label, values, r) != negate
+    if type(op) not in _CMP:
+        raise ValueError(f"Phép so sánh không hỗ trợ: {ast.unparse(op) if hasattr(op, 'lineno') else type(op).__name__}")
+    a, b, f = _compile(left, names), _compile(right, names), _CMP[type(op)]
+    return lambda p, r: f(a(p, r), b(p, r))
+
+
+@lru_cache(maxsize=256)
+def compile_filter(expr: str) -> tuple[Program, frozenset[str]]:
+    """Biên dịch biểu thức lọc (cache theo chuỗi) → (hàm mask, các chỉ số được dùng)."""
+    try:
+        tree = ast.parse(expr, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Biểu thức lọc sai cú pháp: {e.msg}") from None
+    except (RecursionError, MemoryError):
+        raise ValueError("Biểu thức lọc quá dài") from None
+    if sum(1 for _ in ast.walk(tree)) > MAX_FILTER_NODES:
+        raise ValueError(f"Biểu thức lọc quá dài (tối đa {MAX_FILTER_NODES} nút)")
+    names: set[str] = set()
+    return _compile(tree, names), frozenset(names)
+
+
+def parse_sort(expr: str) -> list[tuple[str, bool]]:
+    """"-roe, pe asc, revenue_growth desc" → [(tên, giảm dần?)]."""
+    keys = []
+    for term in (t.strip() for t in expr.split(',')):
+        if not term:
+            continue
+        desc = term.startswith('-')
+        term = term.lstrip('+-').strip()
+        parts = term.split()
+        if len(parts) == 2 and parts[1].lower() in ('asc', 'desc'):
+            desc = parts[1].lower() == 'desc'
+        elif len(parts) != 1:
+            raise ValueError(f"Khoá sắp xếp không hợp lệ: {term!r}")
+        keys.append((parts[0], desc))
+    return keys
+
+
+class MetricPanel:
+    """Bảng (symbol, year) dạng mảng (từ build_panel hoặc mmap từ snapshot)."""
+
+    def __init__(self, arrays: dict[str, np.ndarray]):
+        self._arrays = arrays
+        self.year = arrays['year']
+        self.codes = {label: arrays[f'code.{label}'] for label in LABELS}
+        self.names = {label: arrays[f'names.{label}'].astype(object) for label in LABELS}
+        self.metrics = {k[2:]: v for k, v in arrays.items() if k.startswith('m.')}
+        self.n = len(self.year)
+        sym = self.codes['symbol']
+        # dòng cuối (năm mới nhất) của mỗi mã: bảng sort theo symbol, year
+        self.latest = np.flatnonzero(np.append(sym[1:] != sym[:-1], True)) if self.n else np.arange(0)
+        self._label_pos = {
+            label: {str(s).lower(): i for i, s in enumerate(names)} for label, names in self.names.items()
+        }
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return self._arrays
+
+    @property
+    def years(self) -> list[int]:
+        return sorted(set(np.unique(self.year).tolist()))
+
+    def column(self, name: str, rows: np.ndarray) -> np.ndarray:
+        if name == 'year':
+            return self.year[rows]
+        col = self.metrics.get(name)
+        if col is None:
+            raise ValueError(f"Không có chỉ số '{name}' (có: {', '.join(sorted(self.metrics))})")
+        return col[rows]
+
+    def label_in(self, label: str, values: list[str], rows: np.ndarray) -> np.ndarray:
+        pos = self._label_pos[label]
+        wanted = [pos[v.strip().lower()] for v in values if v.strip().lower() in pos]
+        return np.isin(self.codes[label][rows], wanted)
+
+    def labels(self, label: str, rows: np.ndarray) -> list:
+        codes = self.codes[label][rows]
+        out = self.names[label][np.maximum(codes, 0)] if len(self.names[label]) else np.full(len(codes), None, object)
+        return np.where(codes >= 0, out, None).tolist()
+
+
+class Screener:
+    """Lọc + sắp xếp + phân trang trên MetricPanel."""
+
+    def __init__(self, panel: MetricPanel):
+        self.panel = panel
+
+    def screen(
+        self,
+        filter: str | None = None,
+        sort: str | None = None,
+        year: int | None = None,
+        fields: list[str] | None = None,
+        offset: int = 0,
+        limit: int = 50,
+    ) -> dict:
+        """
+        year=None: năm mới nhất của từng mã; ngược lại chỉ các dòng của năm đó.
+        Trả payload dạng cột: symbol / year / sector / exchange + các chỉ số của `fields`
+        (mặc định DEFAULT_FIELDS + các chỉ số dùng trong filter / sort).
+        """
+        p = self.panel
+        rows = p.latest if year is None else np.flatnonzero(p.year == year)
+        used: set[str] = set()
+        if filter:
+            prog, names = compile_filter(filter)
+            used |= names
+            mask = np.broadcast_to(np.asarray(prog(p, rows), dtype=bool), rows.shape)
+            rows = rows[mask]
+
+        keys = parse_sort(sort) if sort else []
+        if keys:
+            # lexsort: khoá cuối là khoá chính; NaN luôn xếp cuối, hoà thì theo mã
+            cols = [p.codes['symbol'][rows]]
+            for name, desc in reversed(keys):
+                v = p.column(name, rows).astype('float64')
+                cols += [-v if desc else v]
+                cols += [np.isnan(v)]
+                used.add(name)
+            rows = rows[np.lexsort(cols)]
+
+        total = int(len(rows))
+        page = rows[offset:offset + min(limit, MAX_LIMIT)]
+        out_fields = list(dict.fromkeys((fields or DEFAULT_FIELDS) + ([] if fields else sorted(used - {'year'}))))
+        out = {
+            'total': total,
+            'offset': offset,
+            'limit': limit,
+            'symbol': p.labels('symbol', page),
+            'year': p.year[page].tolist(),
+            'sector': p.labels('sector', page),
+            'exchange': p.labels('exchange', page),
+        }
+        for name in out_fields:
+            v = p.column(name, page).astype('float64')
+            out[name] = [None if not np.isfinite(x) else round(float(x), 6) for x in v]
+        return out
@@ -0,0 +1,166 @@
+# app/sectors.py
+
+from __future__ import annotations
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from .datastore import find_column
+
+# =========================================================
+# Chiều ngành cho phần báo cáo tài chính
+#   - ngành của mã: Stock_info.csv (Symbol → Sector), Indicators không có cột ngành
+#   - trung bình ngành: Average_indicators.csv theo khoá (ngành, năm)
+#   - phân phối ngành: trên bảng (mã, năm) của screener, 1 lượt groupby (ngành, năm)
+#     cho mọi chỉ số → phân vị p10..p90, số mã, và hạng phần trăm của từng dòng
+#     → so sánh với ngành của 1 mã = đọc 1 dòng mảng, không quét bảng
+# =========================================================
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+SECTOR_CANDIDATES = ['sector', 'industry', 'nganh']
+YEAR_CANDIDATES = ['năm', 'nam', 'year']
+
+
+def sector_key(sector: pd.Series, year: pd.Series) -> pd.Series:
+    """Khoá 'ngành|năm' (chữ thường) để tra Average_indicators; thiếu ngành → NA."""
+    year = pd.Series(np.asarray(year), index=sector.index).astype('string')
+    key = sector.astype('string').str.strip().str.lower() + '|' + year
+    return key.astype(object).where(key.notna(), None)
+
+
+def sector_averages(avg: Optional[pd.DataFrame], metrics: dict[str, list[str]]) -> Optional[pd.DataFrame]:
+    """Average_indicators → bảng index 'ngành|năm', mỗi chỉ số trong metrics (tên → cột ứng viên) 1 cột float."""
+    if avg is None:
+        return None
+    sector, year = find_column(avg, SECTOR_CANDIDATES), find_column(avg, YEAR_CANDIDATES)
+    if not sector or not year:
+        return None
+    years = pd.to_numeric(avg[year], errors='coerce').astype('Int64')
+    out = pd.DataFrame(index=pd.Index(sector_key(avg[sector], years).to_numpy()))
+    for name, candidates in metrics.items():
+        col = find_column(avg, candidates)
+        if col:
+            out[name] = pd.to_numeric(avg[col], errors='coerce').to_numpy(dtype='float64')
+    return out[out.index.notna() & ~out.index.duplicated(keep='last')]
+
+
+def build_arrays(panel) -> dict[str, np.ndarray]:
+    """
+    Phân phối theo (ngành, năm) trên MetricPanel của screener:
+    'metrics' (tên), 'group.sector' / 'group.year' (G nhóm), 'row_group' (nhóm của từng dòng, -1 = không ngành),
+    'rank' (dòng × chỉ số, hạng % trong nhóm), 'count' (G × chỉ số), 'quantiles' (G × chỉ số × QUANTILES).
+    """
+    metrics = [m for m in panel.metrics if not m.startswith('sector_')]
+    df = pd.DataFrame({m: panel.metrics[m] for m in metrics})
+    df['sector'] = panel.codes['sector']
+    df['year'] = panel.year
+    has = df['sector'].to_numpy() >= 0
+    g = df[has].groupby(['sector', 'year'], sort=True)
+
+    # 1 lượt groupby cho mọi chỉ số: hạng % / dòng, số mã có dữ liệu, phân vị
+    rank = np.full((panel.n, len(metrics)), np.nan, dtype=np.float32)
+    rank[has] = g[metrics].rank(pct=True).mul(100.0).to_numpy(dtype=np.float32)
+    count = g[metrics].count()
+    quant = g[metrics].quantile(list(QUANTILES))   # index (sector, year, q)
+    keys = count.index
+    G, M, Q = len(keys), len(metrics), len(QUANTILES)
+
+    row_group = np.full(panel.n, -1, dtype=np.int32)
+    row_group[has] = g.ngroup().to_numpy(dtype=np.int32)
+    return {
+        'metrics': np.asarray(metrics, dtype=str),
+        'group.sector': keys.get_level_values(0).to_numpy(dtype=np.int32),
+        'group.year': keys.get_level_values(1).to_numpy(dtype=np.int32),
+        'row_group': row_group,
+        'rank': rank,
+        'count': count.to_numpy(dtype=np.int32).reshape(G, M),
+        'quantiles': quant.to_numpy(dtype='float64').reshape(G, Q, M).transpose(0, 2, 1).copy(),
+    }
+
+
+def _clean(x: float, digits: int = 4):
+    return None if not np.isfinite(x) else round(float(x), digits)
+
+
+class SectorStats:
+    """Hạng / phân phối ngành đã tính sẵn, tra theo dòng của MetricPanel."""
+
+    def __init__(self, panel, arrays: dict[str, np.ndarray]):
+        self.panel = panel
+        self._arrays = arrays
+        self.metrics = [str(m) for m in arrays['metrics']]
+        self.metric_pos = {m: i for i, m in enumerate(self.metrics)}
+        self.row_group = arrays['row_group']
+        self.rank = arrays['rank']
+        self.count = arrays['count']
+        self.quantiles = arrays['quantiles']
+        self.group_pos = {
+            (int(s), int(y)): i for i, (s, y) in enumerate(zip(arrays['group.sector'], arrays['group.year']))
+        }
+        sym = panel.codes['symbol']
+        # mã → dòng (mã, năm) đầu tiên / cuối cùng trong panel (sort theo mã, năm)
+        self._sym_pos = {s.upper(): i for i, s in enumerate(panel.names['symbol'])}
+        self._first = np.searchsorted(sym, np.arange(len(panel.names['symbol'])))
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        return self._arrays
+
+    def _row(self, symbol: str, year: int | None) -> Optional[int]:
+        s = self._sym_pos.get(symbol.upper().strip())
+        if s is None:
+            return None
+        a, b = int(self._first[s]), int(self.panel.latest[s]) + 1
+        if year is None:
+            return b - 1
+        i = a + int(np.searchsorted(self.panel.year[a:b], year))
+        return i if i < b and int(self.panel.year[i]) == year else None
+
+    def resolve(self, fields: list[str] | None) -> list[str]:
+        names = fields or self.metrics
+        bad = [f for f in names if f not in self.metric_pos]
+        if bad:
+            raise ValueError(f"Không có chỉ số: {', '.join(bad)} (có: {', '.join(self.metrics)})")
+        return names
+
+    def _distribution(self, g: int, names: list[str]) -> dict:
+        out = {}
+        for m in names:
+            j = self.metric_pos[m]
+            out[m] = {'n': int(self.count[g, j]),
+                      **{f'p{int(q * 100)}': _clean(v) for q, v in zip(QUANTILES, self.quantiles[g, j])}}
+        return out
+
+    def peers(self, symbol: str, year: int | None = None, fields: list[str] | None = None) -> Optional[dict]:
+        """Vị trí của 1 mã trong ngành cùng năm: giá trị, hạng % (0-100, cao = lớn hơn), phân phối, TB ngành."""
+        names = self.resolve(fields)
+        i = self._row(symbol, year)
+        if i is None:
+            return None
+        p, g = self.panel, int(self.row_group[i])
+        out = {
+            'symbol': p.labels('symbol', np.array([i]))[0],
+            'year': int(p.year[i]),
+            'sector': p.labels('sector', np.array([i]))[0],
+            'value': {m: _clean(p.metrics[m][i], 6) for m in names},
+            'percentile': {m: (_clean(self.rank[i, self.metric_pos[m]], 2) if g >= 0 else None) for m in names},
+            'sector_average': {m: _clean(p.metrics[f'sector_{m}'][i], 6) for m in names if f'sector_{m}' in p.metrics},
+        }
+        out['distribution'] = self._distribution(g, names) if g >= 0 else {}
+        return out
+
+    def sector(self, name: str, year: int | None = None, fields: list[str] | None = None) -> Optional[dict]:
+        """Phân phối các chỉ số của 1 ngành trong 1 năm (mặc định năm mới nhất có dữ liệu)."""
+        names = self.resolve(fields)
+        code = self.panel._label_pos['sector'].get(name.strip().lower())
+        if code is None:
+            return None
+        years = sorted(y for s, y in self.group_pos if s == code)
+        if not years or (year is not None and year not in years):
+            return None
+        y = years[-1] if year is None else year
+        return {
+            'sector': str(self.panel.names['sector'][code]),
+            'year': y,
+            'years': years,
+            'distribution': self._distribution(self.group_pos[(code, y)], names),
+        }
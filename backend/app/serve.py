@@ -0,0 +1,194 @@
+# app/serve.py
+
+from __future__ import annotations
+import argparse
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from . import snapshot
+from .risk_store import file_signature
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Chạy server nhiều worker với 1 bản dữ liệu dùng chung
+#   python -m app.serve --workers 4 --port 8000
+#   1) loader (process riêng, `python -m app.serve --publish`) nạp / chấm risk
+#      engine + dựng bảng của StockAnalyzer đúng 1 lần, ghi thế hệ snapshot
+#      (app/snapshot.py) rồi thoát → không worker nào giữ bản dựng riêng
+#   2) supervisor bind socket rồi fork N worker uvicorn; worker gắn snapshot
+#      bằng mmap chỉ đọc → RAM gần như không đổi khi tăng số worker
+#   3) dữ liệu nguồn đổi (size/mtime CSV), SIGHUP hoặc POST /api/risk/reload
+#      → chạy lại loader; worker thấy CURRENT đổi thì chuyển thế hệ (atomic)
+# =========================================================
+
+
+def _data_dir() -> Path:
+    from .risk_engine import resolve_data_dir
+
+    return resolve_data_dir(None)
+
+
+def input_signature(data_dir: Path) -> list[dict]:
+    """Chữ ký các CSV nguồn (đổi → cần publish thế hệ mới)."""
+    return [file_signature(p) for p in sorted(data_dir.glob("*.csv"))]
+
+
+def build_and_publish(root: Path) -> str:
+    """Loader: dựng engine + analyzer từ DATA_DIR (qua artifact / data cache) và publish."""
+    from .analyzer import StockAnalyzer
+    from .risk_engine import ManipulationWatchV1
+
+    t = time.perf_counter()
+    eng = ManipulationWatchV1(data_dir=os.getenv("DATA_DIR"))
+    analyzer = StockAnalyzer(data_path=os.getenv("DATA_DIR"))
+    gen = snapshot.publish(root, {"risk": eng, "analyzer": analyzer})
+    logger.info("Publish snapshot %s (%d dòng scores) trong %.1fs", gen, len(eng.scores), time.perf_counter() - t)
+    return gen
+
+
+def _loader(root: Path) -> subprocess.Popen:
+    # process mới (không fork): supervisor không giữ bảng nào và không có thread
+    env = {k: v for k, v in os.environ.items() if k != snapshot.ROOT_ENV}
+    return subprocess.Popen(
+        [sys.executable, "-m", "app.serve", "--publish", "--snapshot-dir", str(root)],
+        cwd=Path(__file__).resolve().parents[1],
+        env=env,
+    )
+
+
+class Supervisor:
+    """Fork / giám sát worker uvicorn trên 1 socket chung và chạy loader khi cần publish lại."""
+
+    def __init__(self, app: str, host: str, port: int, workers: int, root: Path, refresh: float):
+        self.app, self.host, self.port = app, host, port
+        self.n_workers = workers
+        self.root = root
+        self.refresh = refresh
+        self.workers: set[int] = set()
+        self.loader: subprocess.Popen | None = None
+        self._stop = False
+        self._hup = False
+
+    def _fork_worker(self, sock) -> int:
+        import uvicorn
+
+        pid = os.fork()
+        if pid:
+            return pid
+        code = 0
+        try:
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+                signal.signal(sig, signal.SIG_DFL)
+            uvicorn.Server(uvicorn.Config(self.app, log_level="info")).run(sockets=[sock])
+        except BaseException:
+            logger.exception("Worker %d dừng do lỗi", os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _start_loader(self, reason: str) -> None:
+        if self.loader is None:
+            logger.info("Dựng snapshot mới (%s)", reason)
+            self.loader = _loader(self.root)
+
+    def run(self) -> int:
+        import uvicorn
+
+        os.environ[snapshot.ROOT_ENV] = str(self.root)
+        if _loader(self.root).wait() != 0 or snapshot.current(self.root) is None:
+            logger.error("Loader không publish được snapshot trong %s", self.root)
+            return 1
+        data_dir = _data_dir()
+        sig = input_signature(data_dir)
+        checked = time.monotonic()
+
+        sock = uvicorn.Config(self.app, host=self.host, port=self.port).bind_socket()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_hup)
+        for _ in range(self.n_workers):
+            self.workers.add(self._fork_worker(sock))
+        logger.info("%d worker trên http://%s:%d (snapshot %s)", self.n_workers, self.host, self.port, self.root)
+
+        while not self._stop:
+            time.sleep(0.5)
+            for pid in list(self.workers):
+                if os.waitpid(pid, os.WNOHANG)[0]:
+                    self.workers.discard(pid)
+                    if not self._stop:
+                        logger.warning("Worker %d đã dừng, khởi động lại", pid)
+                        self.workers.add(self._fork_worker(sock))
+
+            if self.loader is not None and self.loader.poll() is not None:
+                if self.loader.returncode:
+                    logger.error("Loader lỗi (exit %d), giữ snapshot hiện tại", self.loader.returncode)
+                self.loader = None
+            if self._hup:
+                self._hup = False
+                self._start_loader("SIGHUP")
+            if snapshot.take_reload(self.root):
+                self._start_loader("POST /api/risk/reload")
+            if self.refresh > 0 and time.monotonic() - checked >= self.refresh:
+                checked = time.monotonic()
+                new_sig = input_signature(data_dir)
+                if new_sig != sig:
+                    sig = new_sig
+                    self._start_loader("dữ liệu nguồn đổi")
+
+        for pid in self.workers:
+            os.kill(pid, signal.SIGTERM)
+        if self.loader is not None:
+            self.loader.terminate()
+        for pid in self.workers:
+            os.waitpid(pid, 0)
+        sock.close()
+        return 0
+
+    def _on_stop(self, *_) -> None:
+        self._stop = True
+
+    def _on_hup(self, *_) -> None:
+        self._hup = True
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        prog="python -m app.serve",
+        description="Chạy FastAPI nhiều worker dùng chung 1 snapshot engine + analyzer (mmap chỉ đọc).",
+    )
+    ap.add_argument("--app", default="app.main:app")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--snapshot-dir", help="thư mục snapshot (mặc định SNAPSHOT_DIR / backend/.cache/snapshot)")
+    ap.add_argument("--refresh", type=float, default=float(os.getenv("SNAPSHOT_REFRESH", "60")),
+                    help="chu kỳ (giây) kiểm tra CSV nguồn đổi để publish lại (0 = tắt)")
+    ap.add_argument("--publish", action="store_true", help="chỉ dựng + publish 1 thế hệ snapshot rồi thoát")
+    args = ap.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    root = Path(args.snapshot_dir).resolve() if args.snapshot_dir else snapshot.default_root()
+
+    if args.publish:
+        build_and_publish(root)
+        return 0
+    if not hasattr(os, "fork"):
+        import uvicorn
+
+        logger.warning("Nền tảng không có fork: chạy 1 process như `uvicorn %s`", args.app)
+        uvicorn.run(args.app, host=args.host, port=args.port)
+        return 0
+    return Supervisor(args.app, args.host, args.port, args.workers, root, args.refresh).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
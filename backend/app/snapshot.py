@@ -0,0 +1,101 @@
+# app/snapshot.py
+
+from __future__ import annotations
+import logging
+import os
+import re
+import shutil
+from pathlib import Path
+from typing import Protocol
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Snapshot dùng chung cho chế độ nhiều worker (python -m app.serve):
+#   <root>/gen-000001/risk/      – bảng scores, chỉ mục, bảng tổng hợp, model
+#   <root>/gen-000001/analyzer/  – bảng chỉ số của StockAnalyzer
+#   <root>/CURRENT               – tên thế hệ đang phục vụ (đổi bằng os.replace)
+#   <root>/RELOAD                – worker yêu cầu loader dựng thế hệ mới
+# Loader ghi xong cả thư mục thế hệ rồi mới đổi CURRENT → worker đọc CURRENT
+# luôn thấy 1 thế hệ đầy đủ; mọi bảng được mmap chỉ đọc nên RAM của N worker
+# dùng chung page cache thay vì mỗi worker 1 bản.
+# =========================================================
+ROOT_ENV = "SNAPSHOT_ROOT"       # đặt cho worker → gắn snapshot thay vì tự dựng
+CURRENT_FILE = "CURRENT"
+RELOAD_FILE = "RELOAD"
+KEEP_GENERATIONS = 2
+
+_GEN_RE = re.compile(r"^gen-(\d{6})$")
+
+
+class Publisher(Protocol):
+    def save_snapshot(self, path: Path) -> None: ...
+
+
+def default_root() -> Path:
+    """SNAPSHOT_DIR nếu có, mặc định backend/.cache/snapshot."""
+    env_dir = (os.getenv("SNAPSHOT_DIR") or "").strip()
+    if env_dir:
+        return Path(env_dir)
+    return Path(__file__).resolve().parents[1] / ".cache" / "snapshot"
+
+
+def attached_root() -> Path | None:
+    """Thư mục snapshot mà process này gắn vào (None = tự dựng engine / analyzer)."""
+    root = (os.getenv(ROOT_ENV) or "").strip()
+    return Path(root) if root else None
+
+
+def generations(root: Path) -> list[str]:
+    if not root.is_dir():
+        return []
+    return sorted(d.name for d in root.iterdir() if _GEN_RE.match(d.name) and d.is_dir())
+
+
+def current(root: Path) -> str | None:
+    """Thế hệ đang phục vụ (None nếu loader chưa publish lần nào)."""
+    try:
+        name = (root / CURRENT_FILE).read_text(encoding="utf-8").strip()
+    except FileNotFoundError:
+        return None
+    return name or None
+
+
+def publish(root: Path, parts: dict[str, Publisher]) -> str:
+    """
+    Ghi 1 thế hệ mới (mỗi phần vào <gen>/<tên phần>) rồi trỏ CURRENT sang nó.
+    Các thế hệ cũ hơn KEEP_GENERATIONS bị xoá: worker còn mmap file của chúng
+    vẫn đọc được (Linux giữ inode tới khi unmap) cho tới khi chuyển thế hệ.
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    gens = generations(root)
+    last = int(_GEN_RE.match(gens[-1]).group(1)) if gens else 0
+    name = f"gen-{last + 1:06d}"
+    tmp = root / f".{name}.tmp-{os.getpid()}"
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    for part, obj in parts.items():
+        obj.save_snapshot(tmp / part)
+    os.replace(tmp, root / name)
+
+    ptr = root / f".{CURRENT_FILE}.tmp-{os.getpid()}"
+    ptr.write_text(name, encoding="utf-8")
+    os.replace(ptr, root / CURRENT_FILE)
+
+    for old in generations(root)[:-KEEP_GENERATIONS]:
+        shutil.rmtree(root / old, ignore_errors=True)
+    return name
+
+
+def request_reload(root: Path) -> None:
+    """Worker (chỉ đọc) nhờ loader dựng lại từ dữ liệu nguồn."""
+    (root / RELOAD_FILE).touch()
+
+
+def take_reload(root: Path) -> bool:
+    """Loader: có yêu cầu dựng lại đang chờ không (xoá cờ nếu có)."""
+    try:
+        (root / RELOAD_FILE).unlink()
+        return True
+    except FileNotFoundError:
+        return False
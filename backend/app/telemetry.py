@@ -0,0 +1,199 @@
+# app/telemetry.py
+
+from __future__ import annotations
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# =========================================================
+# Đo thời gian / đếm nhẹ, không phụ thuộc thư viện ngoài
+#   - stage("risk.features"): context manager đo 1 bước xử lý → histogram
+#     gulliver_stage_seconds{stage=...} + thời gian lần chạy gần nhất
+#   - Histogram / Counter có label, an toàn đa luồng
+#   - collector: hàm trả gauge tính lúc scrape (RAM engine, tỉ lệ cache hit...)
+#   - render(): xuất toàn bộ theo định dạng text của Prometheus (/metrics)
+# =========================================================
+PREFIX = "gulliver_"
+
+# giây: 0.5ms → 5 phút (bước stage dài như train/feature nằm ở các bucket cuối)
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0,
+)
+
+
+def _esc(v) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_esc(v)}"' for k, v in labels.items()) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v))
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # khoá label (tuple đã sort) → [đếm theo bucket..., tổng, số lần]
+        self._series: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            s = self._series.get(key)
+            if s is None:
+                s = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[0][i] += 1
+                    break
+            s[1] += value
+            s[2] += 1
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = [(k, list(v[0]), v[1], v[2]) for k, v in self._series.items()]
+        for key, counts, total, n in sorted(series):
+            labels = dict(key)
+            acc = 0
+            for b, c in zip(self.buckets, counts):
+                acc += c
+                lines.append(f"{self.name}_bucket{_fmt_labels({**labels, 'le': _fmt_value(b)})} {acc}")
+            lines.append(f"{self.name}_bucket{_fmt_labels({**labels, 'le': '+Inf'})} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(labels)} {n}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._lock = threading.Lock()
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines += [f"{self.name}{_fmt_labels(dict(k))} {_fmt_value(v)}" for k, v in items]
+        return lines
+
+
+# Gauge tính lúc scrape: (tên, help, [(labels, giá trị), ...])
+Gauge = tuple[str, str, list[tuple[dict, float]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, Histogram | Counter] = {}
+        self._collectors: list[Callable[[], list[Gauge]]] = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, help: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(PREFIX + name, lambda n: Histogram(n, help, buckets))
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(PREFIX + name, lambda n: Counter(n, help))
+
+    def _get(self, name: str, make):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = make(name)
+            return m
+
+    def collector(self, fn: Callable[[], list[Gauge]]) -> Callable[[], list[Gauge]]:
+        """Đăng ký hàm trả gauge (dùng được như decorator)."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for m in list(self._metrics.values()):
+            lines += m.render()
+        for fn in self._collectors:
+            try:
+                gauges = fn()
+            except Exception as e:  # 1 collector lỗi không làm hỏng cả /metrics
+                logger.warning("Collector %s lỗi: %s", getattr(fn, "__name__", fn), e)
+                continue
+            for name, help, samples in gauges:
+                full = PREFIX + name
+                lines += [f"# HELP {full} {help}", f"# TYPE {full} gauge"]
+                lines += [
+                    f"{full}{_fmt_labels(labels)} {_fmt_value(v)}"
+                    for labels, v in samples
+                    if v is not None
+                ]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram("stage_seconds", "Thời gian từng bước xử lý (load CSV, feature, fit, predict...)")
+LAST_STAGES: dict[str, float] = {}  # thời gian lần chạy gần nhất của từng stage
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Đo 1 bước xử lý: ghi vào histogram + LAST_STAGES, log ở mức DEBUG."""
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t
+        STAGE_SECONDS.observe(dt, stage=name)
+        LAST_STAGES[name] = dt
+        logger.debug("stage %s: %.3fs", name, dt)
+
+
+def rss_bytes() -> int | None:
+    """RSS hiện tại của process (Linux: /proc; nơi khác: None)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@REGISTRY.collector
+def _process_gauges() -> list[Gauge]:
+    return [
+        ("process_resident_bytes", "RSS của process backend", [({}, rss_bytes())]),
+        ("stage_last_seconds", "Thời gian lần chạy gần nhất của từng stage",
+         [({"stage": k}, v) for k, v in sorted(LAST_STAGES.items())]),
+    ]
@@ -0,0 +1,308 @@
+# benchmarks/run.py
+
+from __future__ import annotations
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# =========================================================
+# Benchmark risk engine + StockAnalyzer trên bộ dữ liệu giả lập (benchmarks.synth)
+#   python -m benchmarks.run --tickers 400 --years 5 --out bench.json
+#   python -m benchmarks.run ... --compare baseline.json [--fail-over 0.2]
+# Mỗi phase chạy trong 1 process riêng (spawn) → peak RSS đo riêng từng phase:
+#   train          CSV → feature → fit → chấm → ghi artifact (cache CSV lạnh)
+#   engine_warm    khởi động server: nạp artifact (mmap) + dựng index
+#   engine_rescore chấm lại toàn bộ bằng model có sẵn (cache CSV ấm)
+#   requests       độ trễ score / history / top / score_many / history_many
+#   analyzer       nạp StockAnalyzer (lạnh / ấm) + get_stock_metrics(_many)
+# Thời gian từng bước lấy từ app.telemetry (stage timers).
+# =========================================================
+PHASES = ["train", "engine_warm", "engine_rescore", "requests", "analyzer"]
+BATCH_SIZE = 100
+UNITS = ("_s", "_ms", "_mb")  # chỉ so sánh các chỉ số thời gian / bộ nhớ
+
+
+def _peak_rss_mb() -> float | None:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def _env(cache_dir: str, art_dir: str | None = None, cold: bool = False) -> None:
+    if cold:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    os.environ["DATA_CACHE_DIR"] = cache_dir
+    os.environ["RISK_WARMUP"] = "0"
+    if art_dir:
+        os.environ["RISK_ARTIFACT_DIR"] = art_dir
+
+
+def _latency(fn, calls: list[tuple]) -> dict:
+    """Chạy fn(*args) cho từng args, trả thống kê độ trễ (ms)."""
+    t = np.empty(len(calls))
+    for i, args in enumerate(calls):
+        t0 = time.perf_counter()
+        fn(*args)
+        t[i] = time.perf_counter() - t0
+    t *= 1e3
+    return {
+        "n": len(calls),
+        "mean_ms": float(t.mean()),
+        "p50_ms": float(np.percentile(t, 50)),
+        "p95_ms": float(np.percentile(t, 95)),
+        "p99_ms": float(np.percentile(t, 99)),
+        "max_ms": float(t.max()),
+    }
+
+
+def _stages() -> dict:
+    from app.telemetry import LAST_STAGES
+    return {k: round(v, 4) for k, v in sorted(LAST_STAGES.items())}
+
+
+# ---------------- phases (chạy trong process con) ----------------
+def phase_train(data_dir: str, art_dir: str, cache_dir: str, n_estimators: int | None) -> dict:
+    _env(cache_dir, art_dir, cold=True)
+    from app.risk_engine import default_train_config
+    from app.risk_train import train_artifact
+
+    cfg = default_train_config()
+    if n_estimators:
+        cfg["rf_params"]["n_estimators"] = n_estimators
+    t = time.perf_counter()
+    report = train_artifact(data_dir, art_dir, cfg, n_folds=0)
+    return {
+        "total_s": time.perf_counter() - t,
+        "stages_s": _stages(),
+        "n_train": report["n_train"],
+        "n_estimators": report["rf_params"]["n_estimators"],
+        "model_mb": report["model_bytes"] / 2**20,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _engine_phase(data_dir: str, art_dir: str, cache_dir: str, use_cache: bool) -> dict:
+    _env(cache_dir, art_dir)
+    from app.risk_engine import ManipulationWatchV1
+    from app.telemetry import rss_bytes
+
+    base = rss_bytes()
+    t = time.perf_counter()
+    eng = ManipulationWatchV1(data_dir, artifact_dir=art_dir, use_cache=use_cache)
+    total = time.perf_counter() - t
+    rss = rss_bytes()
+    return {
+        "total_s": total,
+        "stages_s": _stages(),
+        "n_scores": int(len(eng.scores)),
+        "engine_mb": {k: v / 2**20 for k, v in eng.memory_usage().items()},
+        "rss_delta_mb": (rss - base) / 2**20 if rss and base else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def phase_engine_warm(data_dir: str, art_dir: str, cache_dir: str) -> dict:
+    return _engine_phase(data_dir, art_dir, cache_dir, use_cache=True)
+
+
+def phase_engine_rescore(data_dir: str, art_dir: str, cache_dir: str) -> dict:
+    return _engine_phase(data_dir, art_dir, cache_dir, use_cache=False)
+
+
+def phase_requests(data_dir: str, art_dir: str, cache_dir: str, iterations: int, seed: int) -> dict:
+    _env(cache_dir, art_dir)
+    from app.risk_engine import ManipulationWatchV1
+    from app.score_index import ns_to_str
+
+    eng = ManipulationWatchV1(data_dir, artifact_dir=art_dir)
+    rng = random.Random(seed)
+    tickers = sorted(eng.index.t_span)
+    dates = [str(d) for d in ns_to_str(eng.index.dates)]
+    pick_t = lambda: rng.choice(tickers)  # noqa: E731
+    pick_d = lambda: rng.choice(dates)  # noqa: E731
+    batch = lambda: rng.sample(tickers, min(BATCH_SIZE, len(tickers)))  # noqa: E731
+    n = iterations
+    return {
+        "score": _latency(eng.score, [(pick_t(), pick_d()) for _ in range(n)]),
+        "score_latest": _latency(eng.score, [(pick_t(), None) for _ in range(n)]),
+        "history_180": _latency(eng.history, [(pick_t(), 180) for _ in range(n)]),
+        "top_50": _latency(eng.top, [(pick_d(), 50) for _ in range(n)]),
+        f"score_many_{BATCH_SIZE}": _latency(eng.score_many, [(batch(), pick_d()) for _ in range(n)]),
+        f"history_many_{BATCH_SIZE}": _latency(eng.history_many, [(batch(),) for _ in range(n)]),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def phase_analyzer(data_dir: str, cache_dir: str, iterations: int, seed: int) -> dict:
+    _env(cache_dir, cold=True)
+    from app.analyzer import StockAnalyzer
+    from app.telemetry import LAST_STAGES
+
+    t = time.perf_counter()
+    StockAnalyzer(data_path=data_dir)  # cache CSV lạnh
+    cold = time.perf_counter() - t
+    cold_stages = _stages()
+    LAST_STAGES.clear()
+    t = time.perf_counter()
+    an = StockAnalyzer(data_path=data_dir)  # đọc lại từ cache dạng cột
+    warm = time.perf_counter() - t
+
+    rng = random.Random(seed)
+    symbols = sorted(an._metrics)
+    n = iterations
+    return {
+        "load_cold_s": cold,
+        "load_warm_s": warm,
+        "stages_cold_s": cold_stages,
+        "stages_warm_s": _stages(),
+        "n_symbols": len(symbols),
+        "get_stock_metrics": _latency(an.get_stock_metrics, [(rng.choice(symbols),) for _ in range(n)]),
+        f"get_stock_metrics_many_{BATCH_SIZE}": _latency(
+            an.get_stock_metrics_many,
+            [(rng.sample(symbols, min(BATCH_SIZE, len(symbols))),) for _ in range(n)],
+        ),
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def _run_isolated(fn, *args) -> dict:
+    # worker của ProcessPoolExecutor không phải daemon → RF vẫn chạy n_jobs=-1 / pool chấm điểm như production
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(fn, *args).result()
+
+
+# ---------------- so sánh giữa các commit ----------------
+def _flatten(d: dict, prefix: str = "") -> dict[str, float]:
+    out = {}
+    for k, v in d.items():
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            out.update(_flatten(v, key))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            out[key] = float(v)
+    return out
+
+
+def compare(old: dict, new: dict, fail_over: float | None = None) -> bool:
+    """In chênh lệch các chỉ số thời gian / bộ nhớ; False nếu có chỉ số chậm hơn quá fail_over."""
+    a, b = _flatten(old["phases"]), _flatten(new["phases"])
+    ok = True
+    print(f"{'metric':<58} {'old':>10} {'new':>10} {'ratio':>7}")
+    for k in sorted(a.keys() & b.keys()):
+        if not any(part.endswith(UNITS) for part in k.split(".")) or a[k] <= 0:
+            continue
+        ratio = b[k] / a[k]
+        bad = fail_over is not None and ratio > 1 + fail_over
+        ok &= not bad
+        print(f"{k:<58} {a[k]:10.3f} {b[k]:10.3f} {ratio:7.2f}{'  !!' if bad else ''}")
+    return ok
+
+
+def _dataset(data_dir: Path, tickers: int, years: int, seed: int) -> tuple[float | None, dict[str, Path]]:
+    """
+    Sinh bộ dữ liệu giả lập; dùng lại nếu --work-dir đã có bộ cùng tham số
+    (ghi lại CSV sẽ đổi mtime → đổi fingerprint → artifact phải chấm lại).
+    """
+    from .synth import write_dataset
+
+    params = {"tickers": tickers, "years": years, "seed": seed}
+    stamp = data_dir / "synth.json"
+    if stamp.exists() and json.loads(stamp.read_text()) == params:
+        return None, {p.stem: p for p in sorted(data_dir.glob("*.csv"))}
+    t = time.perf_counter()
+    paths = write_dataset(data_dir, tickers, years, seed=seed)
+    stamp.write_text(json.dumps(params))
+    return time.perf_counter() - t, paths
+
+
+def _git_rev() -> str | None:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, check=True,
+        )
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.run", description="Benchmark risk engine + analyzer.")
+    ap.add_argument("--tickers", type=int, default=200)
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--data-dir", help="dùng bộ CSV có sẵn thay vì sinh dữ liệu giả lập")
+    ap.add_argument("--work-dir", help="thư mục chứa dữ liệu sinh ra + cache + artifact (mặc định: thư mục tạm)")
+    ap.add_argument("--iterations", type=int, default=200, help="số lần gọi mỗi loại request")
+    ap.add_argument("--n-estimators", type=int, help="ghi đè số cây RF khi train (mặc định như production)")
+    ap.add_argument("--phases", default=",".join(PHASES))
+    ap.add_argument("--out", help="ghi kết quả JSON")
+    ap.add_argument("--compare", help="file JSON kết quả cũ để so sánh")
+    ap.add_argument("--fail-over", type=float, help="exit 1 nếu chỉ số nào chậm/tốn hơn quá tỉ lệ này (vd. 0.2)")
+    args = ap.parse_args(argv)
+
+    phases = [p for p in args.phases.split(",") if p]
+    work = Path(args.work_dir or tempfile.mkdtemp(prefix="gulliver-bench-"))
+    art_dir, cache_dir = str(work / "artifacts"), str(work / "data-cache")
+
+    meta = {
+        "git_rev": _git_rev(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": vars(args),
+    }
+    import pandas as pd
+    import sklearn
+    meta["versions"] = {"numpy": np.__version__, "pandas": pd.__version__, "sklearn": sklearn.__version__}
+
+    if args.data_dir:
+        data_dir = args.data_dir
+    else:
+        data_dir = str(work / "data")
+        meta["generate_s"], paths = _dataset(Path(data_dir), args.tickers, args.years, args.seed)
+        meta["dataset_mb"] = {k: p.stat().st_size / 2**20 for k, p in paths.items()}
+    meta["data_dir"] = data_dir
+
+    runs = {
+        "train": (phase_train, data_dir, art_dir, cache_dir, args.n_estimators),
+        "engine_warm": (phase_engine_warm, data_dir, art_dir, cache_dir),
+        "engine_rescore": (phase_engine_rescore, data_dir, art_dir, cache_dir),
+        "requests": (phase_requests, data_dir, art_dir, cache_dir, args.iterations, args.seed),
+        "analyzer": (phase_analyzer, data_dir, str(work / "analyzer-cache"), args.iterations, args.seed),
+    }
+    results = {"meta": meta, "phases": {}}
+    for name in phases:
+        fn, *fargs = runs[name]
+        print(f"[bench] {name} ...", flush=True)
+        results["phases"][name] = _run_isolated(fn, *fargs)
+        print(json.dumps(results["phases"][name], indent=2, default=str), flush=True)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, default=str)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            ok = compare(json.load(f), results, args.fail_over)
+        if not ok:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+# benchmarks/synth.py
+
+from __future__ import annotations
+import argparse
+import csv
+import itertools
+import string
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# =========================================================
+# Bộ dữ liệu thị trường giả lập, tất định theo seed, kích thước tickers × years:
+#   OHLCV_Merge.csv        ticker, date, open, high, low, close, volume, exchange
+#                          (tên cột _standardize_cols nhận được)
+#   Share_outstanding.csv  + các CSV báo cáo tài chính / Stock_info /
+#                          Average_indicators: đúng header của frontend/public,
+#                          giá trị số lấy độ lớn + tỉ lệ âm / 0 theo từng cột
+#                          của file thật (chỉ đọc file public để lấy schema).
+# Volume tỉ lệ với số cổ phiếu lưu hành → có nhóm blue-chip (turnover + vốn hoá
+# cao) để train; thỉnh thoảng có phiên KL đột biến biên độ hẹp → có nhãn dương.
+# =========================================================
+SCHEMA_DIR = Path(__file__).resolve().parents[2] / "frontend" / "public"
+
+STATEMENTS = ["Balance_sheet", "Income_statement", "Cash_flow", "Indicators"]
+EXCHANGES = ["HOSE", "HNX", "UPCOM"]
+EXCHANGE_P = [0.5, 0.35, 0.15]
+RIC_SUFFIX = {"HOSE": "HM", "HNX": "HN", "UPCOM": "HNO"}
+
+
+def symbols(n: int) -> list[str]:
+    """AAA, AAB, ... — mã 3 chữ cái (dài hơn nếu cần) theo thứ tự cố định."""
+    out: list[str] = []
+    for length in itertools.count(3):
+        for combo in itertools.product(string.ascii_uppercase, repeat=length):
+            out.append("".join(combo))
+            if len(out) == n:
+                return out
+
+
+def _read_schema(name: str, schema_dir: Path) -> tuple[list[str], pd.DataFrame]:
+    """Header gốc (kể cả cột index trống) + dữ liệu thật theo vị trí cột."""
+    path = schema_dir / f"{name}.csv"
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        header = next(csv.reader(f))
+    data = pd.read_csv(path, encoding="utf-8-sig", header=None, skiprows=1)
+    return header, data
+
+
+def _numeric_like(rng: np.random.Generator, real: pd.Series, n: int) -> np.ndarray:
+    """n giá trị cùng độ lớn (median |x|), tỉ lệ âm và tỉ lệ 0 với cột thật."""
+    x = pd.to_numeric(real, errors="coerce").replace([np.inf, -np.inf], np.nan).dropna()
+    if x.empty:
+        return np.zeros(n)
+    nz = x[x != 0]
+    scale = float(nz.abs().median()) if len(nz) else 0.0
+    p_zero = 1 - len(nz) / len(x)
+    p_neg = float((nz < 0).mean()) if len(nz) else 0.0
+    v = scale * rng.lognormal(0.0, 0.8, n)
+    v[rng.random(n) < p_neg] *= -1
+    v[rng.random(n) < p_zero] = 0.0
+    if pd.api.types.is_integer_dtype(real.dtype):
+        return np.round(v).astype(np.int64)
+    return np.round(v, 2)
+
+
+def universe(n_tickers: int, seed: int = 0, schema_dir: Path = SCHEMA_DIR) -> pd.DataFrame:
+    """Danh sách mã: sàn, ngành (lấy từ Average_indicators thật), số CP lưu hành gốc."""
+    rng = np.random.default_rng(seed)
+    _, avg = _read_schema("Average_indicators", schema_dir)
+    sectors = sorted(avg[1].dropna().astype(str).unique())
+    return pd.DataFrame({
+        "ticker": symbols(n_tickers),
+        "exchange": rng.choice(EXCHANGES, n_tickers, p=EXCHANGE_P),
+        "sector": rng.choice(sectors, n_tickers),
+        # 10 triệu → vài tỉ CP, phân phối lệch như thị trường thật
+        "shares0": np.round(10 ** rng.uniform(7, 9.5, n_tickers)),
+        # 10% mã niêm yết muộn (bắt đầu giữa kỳ)
+        "listed_frac": np.where(rng.random(n_tickers) < 0.1, rng.uniform(0.1, 0.6, n_tickers), 0.0),
+    })
+
+
+def ohlcv(uni: pd.DataFrame, start: str, end: str, seed: int = 0) -> pd.DataFrame:
+    """Panel OHLCV ngày giao dịch (T2–T6) cho mọi mã của universe."""
+    rng = np.random.default_rng(seed + 1)
+    dates = pd.bdate_range(start, end)
+    n_t, n_d = len(uni), len(dates)
+
+    ret = rng.normal(0.0003, 0.02, (n_t, n_d))
+    close = 20_000 * rng.lognormal(0, 0.8, (n_t, 1)) * np.exp(np.cumsum(ret, axis=1))
+    spread = np.abs(rng.normal(0, 0.012, (n_t, n_d)))
+    high = close * (1 + spread * rng.uniform(0.2, 1.0, (n_t, n_d)))
+    low = close * (1 - spread * rng.uniform(0.2, 1.0, (n_t, n_d)))
+    open_ = np.clip(close * (1 + rng.normal(0, 0.006, (n_t, n_d))), low, high)
+
+    # KL ~ số CP lưu hành × vòng quay ngẫu nhiên × thanh khoản riêng của mã
+    liquidity = rng.lognormal(0, 0.7, (n_t, 1))
+    volume = uni["shares0"].to_numpy()[:, None] * liquidity * rng.lognormal(-6.5, 0.9, (n_t, n_d))
+    # ~1% phiên KL đột biến nhưng biên độ hẹp (mẫu hình churn)
+    spike = rng.random((n_t, n_d)) < 0.01
+    volume[spike] *= rng.uniform(4, 12, spike.sum())
+    high[spike] = close[spike] * 1.003
+    low[spike] = close[spike] * 0.997
+    open_[spike] = close[spike]
+
+    first = np.floor(uni["listed_frac"].to_numpy() * n_d).astype(int)
+    keep = np.arange(n_d)[None, :] >= first[:, None]
+    ti, di = np.nonzero(keep)
+    return pd.DataFrame({
+        "ticker": uni["ticker"].to_numpy()[ti],
+        "date": dates.strftime("%Y-%m-%d").to_numpy()[di],
+        "open": np.round(open_[ti, di], 1),
+        "high": np.round(high[ti, di], 1),
+        "low": np.round(low[ti, di], 1),
+        "close": np.round(close[ti, di], 1),
+        "volume": np.round(volume[ti, di]),
+        "exchange": uni["exchange"].to_numpy()[ti],
+    })
+
+
+def _panel(uni: pd.DataFrame, years: list[int]) -> pd.DataFrame:
+    return pd.DataFrame(
+        [(t, y) for t in uni["ticker"] for y in years], columns=["ticker", "year"]
+    )
+
+
+def shares_outstanding(uni: pd.DataFrame, years: list[int], schema_dir: Path = SCHEMA_DIR, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed + 2)
+    header, _ = _read_schema("Share_outstanding", schema_dir)
+    p = _panel(uni, years)
+    # phát hành thêm 0–15%/năm
+    growth = rng.uniform(1.0, 1.15, len(p))
+    step = p.groupby("ticker", sort=False).cumcount().to_numpy()
+    base = uni.set_index("ticker")["shares0"].reindex(p["ticker"]).to_numpy()
+    shares = np.round(base * growth ** step).astype(np.int64)
+    cols = {"": np.arange(len(p)), "Unnamed: 0": np.arange(len(p)), "Mã": p["ticker"], "Năm": p["year"],
+            "shares_outstanding": shares}
+    return pd.DataFrame({h: cols[h] for h in header})
+
+
+def _fill_from_schema(
+    name: str, keys: dict[str, np.ndarray], n: int, rng: np.random.Generator, schema_dir: Path
+) -> pd.DataFrame:
+    """Bảng n dòng với đúng header của file public; cột khoá lấy từ `keys`."""
+    header, real = _read_schema(name, schema_dir)
+    out = {}
+    for i, h in enumerate(header):
+        if h in keys:
+            out[h] = keys[h]
+        elif h == "" or h.startswith("Unnamed"):
+            out[h] = np.arange(n)
+        elif pd.api.types.is_numeric_dtype(real[i].dtype):
+            out[h] = _numeric_like(rng, real[i], n)
+        else:
+            vals = real[i].dropna().astype(str).unique()
+            out[h] = rng.choice(vals, n) if len(vals) else np.full(n, "")
+    return pd.DataFrame(out, columns=header)
+
+
+def statements(uni: pd.DataFrame, years: list[int], schema_dir: Path = SCHEMA_DIR, seed: int = 0) -> dict[str, pd.DataFrame]:
+    """Balance_sheet / Income_statement / Cash_flow / Indicators theo (mã, năm)."""
+    p = _panel(uni, years)
+    keys = {"Mã": p["ticker"].to_numpy(), "Năm": p["year"].to_numpy()}
+    return {
+        name: _fill_from_schema(name, keys, len(p), np.random.default_rng(seed + 10 + i), schema_dir)
+        for i, name in enumerate(STATEMENTS)
+    }
+
+
+def stock_info(uni: pd.DataFrame, schema_dir: Path = SCHEMA_DIR, seed: int = 0) -> pd.DataFrame:
+    n = len(uni)
+    t = uni["ticker"].to_numpy()
+    listed = np.random.default_rng(seed + 21).integers(2000, 2020, n)
+    keys = {
+        "Start Date": [f"1/2/{y}" for y in listed],
+        "Hist.": listed,
+        "Symbol": t,
+        "Name": np.char.add("SYNTH ", t.astype(str)),
+        "Full Name": np.char.add("Synthetic Company ", t.astype(str)),
+        "RIC": [f"{s}.{RIC_SUFFIX[e]}" for s, e in zip(t, uni["exchange"])],
+        "Exchange": uni["exchange"].to_numpy(),
+        "Sector": uni["sector"].to_numpy(),
+    }
+    return _fill_from_schema("Stock_info", keys, n, np.random.default_rng(seed + 20), schema_dir)
+
+
+def average_indicators(uni: pd.DataFrame, years: list[int], schema_dir: Path = SCHEMA_DIR, seed: int = 0) -> pd.DataFrame:
+    sectors = sorted(uni["sector"].unique())
+    p = pd.DataFrame([(s, y) for s in sectors for y in years], columns=["Sector", "Năm"])
+    keys = {"Sector": p["Sector"].to_numpy(), "Năm": p["Năm"].to_numpy()}
+    return _fill_from_schema("Average_indicators", keys, len(p), np.random.default_rng(seed + 30), schema_dir)
+
+
+def write_dataset(
+    out_dir: str | Path,
+    n_tickers: int = 200,
+    years: int = 5,
+    end_year: int = 2024,
+    seed: int = 0,
+    schema_dir: str | Path = SCHEMA_DIR,
+) -> dict[str, Path]:
+    """Ghi toàn bộ bộ CSV vào out_dir (dùng làm DATA_DIR). Trả tên → đường dẫn."""
+    out_dir, schema_dir = Path(out_dir), Path(schema_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    ys = list(range(end_year - years + 1, end_year + 1))
+    uni = universe(n_tickers, seed, schema_dir)
+
+    frames = {
+        "OHLCV_Merge": ohlcv(uni, f"{ys[0]}-01-01", f"{end_year}-12-31", seed),
+        "Share_outstanding": shares_outstanding(uni, ys, schema_dir, seed),
+        **statements(uni, ys, schema_dir, seed),
+        "Stock_info": stock_info(uni, schema_dir, seed),
+        "Average_indicators": average_indicators(uni, ys, schema_dir, seed),
+    }
+    paths = {}
+    for name, df in frames.items():
+        paths[name] = out_dir / f"{name}.csv"
+        df.to_csv(paths[name], index=False)
+    return paths
+
+
+def main(argv: list[str] | None = None) -> None:
+    ap = argparse.ArgumentParser(prog="python -m benchmarks.synth", description="Sinh bộ CSV thị trường giả lập.")
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--tickers", type=int, default=200)
+    ap.add_argument("--years", type=int, default=5)
+    ap.add_argument("--end-year", type=int, default=2024)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+    for name, p in write_dataset(args.out, args.tickers, args.years, args.end_year, args.seed).items():
+        print(f"{name:<20} {p.stat().st_size / 2**20:8.1f} MB  {p}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# tests/conftest.py
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from app.risk_engine import RANDOM_SEED
+from app.risk_train import train_artifact
+from benchmarks.synth import write_dataset
+
+# =========================================================
+# Dữ liệu dùng chung cho test: bộ CSV giả lập nhỏ (benchmarks.synth) +
+# artifact risk train nhanh (RF ít cây, không CV). Cache dữ liệu đã chuẩn
+# hoá (DATA_CACHE_DIR) ghi vào thư mục tạm, không đụng backend/.cache.
+# =========================================================
+TEST_TRAIN_CONFIG = {
+    "train_cutoff": "2024-01-01",
+    "blue_chip_quantile": 0.0,     # vũ trụ nhỏ: train trên mọi mã
+    "rf_params": dict(
+        n_estimators=16,
+        min_samples_leaf=3,
+        n_jobs=1,
+        random_state=RANDOM_SEED,
+        class_weight="balanced_subsample",
+    ),
+}
+
+
+def make_dataset(out_dir: Path, seed: int = 0, n_tickers: int = 24) -> Path:
+    write_dataset(out_dir, n_tickers=n_tickers, years=2, end_year=2024, seed=seed)
+    return out_dir
+
+
+def train(data_dir: Path, artifact_dir: Path) -> dict:
+    return train_artifact(data_dir, artifact_dir, train_config=TEST_TRAIN_CONFIG, n_folds=0)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _data_cache_dir(tmp_path_factory):
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("DATA_CACHE_DIR", str(tmp_path_factory.mktemp("data_cache")))
+        yield
+
+
+@pytest.fixture(scope="session")
+def risk_data(tmp_path_factory) -> tuple[Path, Path]:
+    """(data_dir, artifact_dir) với model đã train trên data_dir."""
+    data_dir = make_dataset(tmp_path_factory.mktemp("data"))
+    artifact_dir = tmp_path_factory.mktemp("artifacts")
+    train(data_dir, artifact_dir)
+    return data_dir, artifact_dir
+
+
+@pytest.fixture(scope="session")
+def api(risk_data):
+    """(module app.main, TestClient) trên bộ dữ liệu giả lập; không chạy lifespan (warmup / alert feed)."""
+    from fastapi.testclient import TestClient
+
+    data_dir, artifact_dir = risk_data
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("DATA_DIR", str(data_dir))
+        mp.setenv("RISK_ARTIFACT_DIR", str(artifact_dir))
+        mp.setenv("RISK_WARMUP", "0")
+        from app import main
+
+        yield main, TestClient(main.app)
+
+
+@pytest.fixture(scope="session")
+def engine(risk_data):
+    """Engine chỉ đọc trên risk_data, đã install làm engine phục vụ của /api/risk/*."""
+    from app.risk_engine import ManipulationWatchV1, install_engine
+
+    data_dir, artifact_dir = risk_data
+    eng = ManipulationWatchV1(data_dir=str(data_dir), artifact_dir=str(artifact_dir))
+    install_engine(eng)
+    return eng
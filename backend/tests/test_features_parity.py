@@ -0,0 +1,117 @@
+# tests/test_features_parity.py
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.risk_engine import BEHAVIOR_FEATURES, LABEL_COL, RULE_FEATURES, build_features
+
+# =========================================================
+# Parity của build_features (vectorized) với bản groupby-apply gốc.
+# legacy_features() giữ nguyên pipeline feature trước khi vectorize làm bản
+# tham chiếu: mọi cột BEHAVIOR_FEATURES + RULE_FEATURES + churn_flag phải
+# trùng khớp trên 1 panel giả lập tất định (mã niêm yết muộn, phiên biên độ 0,
+# phiên KL đột biến biên độ hẹp → có nhãn dương).
+# =========================================================
+
+
+def _zscore_rolling(s: pd.Series, win: int) -> pd.Series:
+    m = s.rolling(win, min_periods=max(5, win // 3)).mean()
+    sd = s.rolling(win, min_periods=max(5, win // 3)).std()
+    return (s - m) / sd
+
+
+def legacy_features(df: pd.DataFrame) -> pd.DataFrame:
+    """Pipeline feature gốc (groupby-apply từng ticker), giữ nguyên từng bước."""
+    g = df.groupby("ticker", group_keys=False)
+    df["ret_1d"] = g["close"].pct_change(1)
+    df["ret_3d"] = g["close"].pct_change(3)
+    df["ret_5d"] = g["close"].pct_change(5)
+    df["range_rel"] = (df["high"] - df["low"]) / g["close"].shift(1)
+    df["close_loc"] = (
+        df["close"] - (df["high"] + df["low"]) / 2
+    ) / (df["high"] - df["low"]).replace(0, np.nan)
+    df["gap_open"] = (df["open"] - g["close"].shift(1)) / g["close"].shift(1)
+    df["vol_z20"] = g["volume"].apply(lambda s_: _zscore_rolling(s_, 20))
+    df["turnover"] = df["volume"] / df["shares_outstanding"]
+    df["mkt_cap"] = df["close"] * df["shares_outstanding"]
+
+    for w in (3, 5, 10):
+        df[f"turnover_{w}d"] = g["turnover"].apply(lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean())
+        df[f"volz_{w}d"] = g["vol_z20"].apply(lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean())
+        df[f"range_{w}d"] = g["range_rel"].apply(lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean())
+        df[f"close_loc_{w}d"] = g["close_loc"].apply(lambda s_: s_.rolling(w, min_periods=max(2, w // 2)).mean())
+
+    df = df.sort_values(["ticker", "date"]).reset_index(drop=True)
+    g2 = df.groupby("ticker", group_keys=False)
+    df["vol_change_5d"] = g2["volume"].transform(lambda x: (x / x.shift(5)) - 1)
+    df["turnover_vol_ratio"] = df["turnover"] / (df["vol_z20"].abs() + 1e-6)
+    df["abs_ret_5d"] = df["ret_5d"].abs()
+    df["volatility_10d"] = g2["ret_1d"].transform(lambda x: x.rolling(10, min_periods=5).std())
+    df["price_slope_5d"] = g2["close"].transform(lambda x: (x - x.shift(5)) / 5)
+    return df
+
+
+def label_and_rank(df: pd.DataFrame) -> pd.DataFrame:
+    """Nhãn churn_flag + xếp hạng chéo theo ngày (như sau bước feature của engine)."""
+    df[LABEL_COL] = ((df["vol_z20"] > 2.0) & (df["range_rel"].abs() < 0.01)).astype(int)
+    df["turnover_pct"] = df.groupby("date")["turnover"].rank(pct=True)
+    df["mkt_cap_pct"] = df.groupby("date")["mkt_cap"].rank(pct=True)
+    return df
+
+
+def raw_panel(n_tickers: int = 30, n_days: int = 160, seed: int = 7) -> pd.DataFrame:
+    """OHLCV + shares giả lập, đã sort theo (ticker, date) với RangeIndex."""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("2023-01-02", periods=n_days)
+    close = 20_000 * rng.lognormal(0, 0.5, (n_tickers, 1)) * np.exp(np.cumsum(rng.normal(0, 0.02, (n_tickers, n_days)), axis=1))
+    spread = np.abs(rng.normal(0, 0.012, (n_tickers, n_days)))
+    high, low = close * (1 + spread), close * (1 - spread)
+    open_ = close * (1 + rng.normal(0, 0.005, (n_tickers, n_days)))
+    volume = np.round(rng.lognormal(12, 0.8, (n_tickers, n_days)))
+    spike = rng.random((n_tickers, n_days)) < 0.02
+    volume[spike] *= 10
+    high[spike], low[spike] = close[spike] * 1.002, close[spike] * 0.998
+    flat = rng.random((n_tickers, n_days)) < 0.01
+    high[flat] = low[flat] = close[flat]           # biên độ 0 → close_loc NaN
+    first = np.where(rng.random(n_tickers) < 0.2, rng.integers(0, n_days - 10, n_tickers), 0)
+    ti, di = np.nonzero(np.arange(n_days)[None, :] >= first[:, None])
+    return pd.DataFrame({
+        "ticker": np.array([f"T{i:03d}" for i in range(n_tickers)])[ti],
+        "date": dates[di],
+        "open": open_[ti, di], "high": high[ti, di], "low": low[ti, di],
+        "close": close[ti, di], "volume": volume[ti, di],
+        "shares_outstanding": np.round(rng.lognormal(17, 1, n_tickers))[ti],
+    })
+
+
+@pytest.fixture(scope="module")
+def panels():
+    df = raw_panel()
+    return label_and_rank(build_features(df.copy())), label_and_rank(legacy_features(df.copy()))
+
+
+def test_same_rows(panels):
+    new, old = panels
+    pd.testing.assert_frame_equal(
+        new[["ticker", "date"]].reset_index(drop=True), old[["ticker", "date"]].reset_index(drop=True)
+    )
+
+
+@pytest.mark.parametrize("col", BEHAVIOR_FEATURES + RULE_FEATURES + [LABEL_COL])
+def test_feature_parity(panels, col):
+    new, old = panels
+    a = new[col].to_numpy(dtype=np.float64)
+    b = old[col].to_numpy(dtype=np.float64)
+    if new[col].dtype == np.float32:
+        # build_features lưu feature hành vi ở float32 → so ở độ chính xác lưu trữ
+        b = b.astype(np.float32).astype(np.float64)
+    np.testing.assert_array_equal(np.isnan(a), np.isnan(b), err_msg=col)
+    np.testing.assert_array_equal(a[~np.isnan(a)], b[~np.isnan(b)], err_msg=col)
+
+
+def test_has_positive_labels(panels):
+    new, _ = panels
+    assert new[LABEL_COL].sum() > 0
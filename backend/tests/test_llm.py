@@ -0,0 +1,194 @@
+# tests/test_llm.py
+
+from __future__ import annotations
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app import llm
+from app.llm import LLMClient
+
+# =========================================================
+# LLMClient với model giả chạy local: đếm lời gọi upstream, số lời gọi
+# đồng thời tối đa; `gate` giữ lời gọi lại để các request kịp chồng lên nhau.
+# =========================================================
+
+
+class FakeModel:
+    model_name = "fake"
+
+    def __init__(self, chunks: tuple[str, ...] = ("a", "b", "c"), delay: float = 0.0):
+        self.chunks = chunks
+        self.delay = delay
+        self.gate = threading.Event()
+        self.gate.set()
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self) -> None:
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _leave(self) -> None:
+        with self._lock:
+            self.active -= 1
+
+    def generate_content(self, prompt: str, stream: bool = False):
+        self._enter()
+        if not stream:
+            try:
+                self.gate.wait(5)
+                time.sleep(self.delay)
+                return SimpleNamespace(text=f"{prompt}:" + "".join(self.chunks))
+            finally:
+                self._leave()
+        return self._stream(prompt)
+
+    def _stream(self, prompt: str):
+        try:
+            yield SimpleNamespace(text=f"{prompt}:")
+            self.gate.wait(5)
+            for c in self.chunks:
+                time.sleep(self.delay)
+                yield SimpleNamespace(text=c)
+        finally:
+            self._leave()
+
+
+async def _collect(client: LLMClient, prompt: str) -> str:
+    return "".join([piece async for piece in client.stream(prompt)])
+
+
+async def _release_when_waiting(model: FakeModel, client: LLMClient, n_waiters: int) -> None:
+    """Mở gate khi đã có lời gọi upstream và `n_waiters` request khác đã được gộp vào."""
+    for _ in range(500):
+        if model.calls and client.stats["coalesced"] >= n_waiters:
+            break
+        await asyncio.sleep(0.01)
+    model.gate.set()
+
+
+def test_concurrent_generate_single_upstream_call():
+    model = FakeModel()
+    model.gate.clear()
+
+    async def main():
+        client = LLMClient(model, ttl=60, max_concurrency=4)
+        results = await asyncio.gather(
+            *[client.generate("p") for _ in range(10)], _release_when_waiting(model, client, 9)
+        )
+        return client, results[:-1]
+
+    client, results = asyncio.run(main())
+    assert model.calls == 1
+    assert results == ["p:abc"] * 10
+    assert client.stats["misses"] == 1 and client.stats["coalesced"] == 9
+
+
+def test_concurrent_streams_share_one_upstream():
+    model = FakeModel()
+    model.gate.clear()
+
+    async def main():
+        client = LLMClient(model, ttl=60, max_concurrency=4)
+        results = await asyncio.gather(
+            *[_collect(client, "p") for _ in range(5)], _release_when_waiting(model, client, 4)
+        )
+        # stream xong → toàn văn đã vào cache, generate() không gọi lại model
+        cached = await client.generate("p")
+        return client, results[:-1], cached
+
+    client, results, cached = asyncio.run(main())
+    assert model.calls == 1
+    assert results == ["p:abc"] * 5
+    assert cached == "p:abc"
+    assert client.stats["coalesced"] == 4 and client.stats["hits"] == 1
+
+
+def test_generate_joins_running_stream():
+    model = FakeModel()
+    model.gate.clear()
+
+    async def main():
+        client = LLMClient(model, ttl=60)
+        return await asyncio.gather(_collect(client, "p"), client.generate("p"), _release_when_waiting(model, client, 1))
+
+    streamed, generated, _ = asyncio.run(main())
+    assert model.calls == 1
+    assert streamed == generated == "p:abc"
+
+
+def test_ttl_expiry_refetches(monkeypatch):
+    model = FakeModel()
+    now = [1_000.0]
+    monkeypatch.setattr(llm.time, "time", lambda: now[0])
+
+    async def main():
+        client = LLMClient(model, ttl=10)
+        await client.generate("p")
+        now[0] += 5
+        await client.generate("p")      # còn hạn → cache
+        assert model.calls == 1
+        now[0] += 6
+        await client.generate("p")      # hết hạn → gọi lại
+        return client
+
+    client = asyncio.run(main())
+    assert model.calls == 2
+    assert client.stats["hits"] == 1 and client.stats["misses"] == 2
+
+
+def test_disk_cache_survives_new_client(tmp_path):
+    model = FakeModel()
+
+    async def main():
+        await LLMClient(model, ttl=60, disk_dir=tmp_path).generate("p")
+        client = LLMClient(model, ttl=60, disk_dir=tmp_path)
+        return client, await client.generate("p")
+
+    client, text = asyncio.run(main())
+    assert model.calls == 1 and text == "p:abc"
+    assert client.stats["disk_hits"] == 1
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_inflight_calls_never_exceed_limit(streaming):
+    model = FakeModel(delay=0.01)
+
+    async def main():
+        client = LLMClient(model, ttl=60, max_concurrency=2)
+        if streaming:
+            return await asyncio.gather(*[_collect(client, f"p{i}") for i in range(8)])
+        return await asyncio.gather(*[client.generate(f"p{i}") for i in range(8)])
+
+    results = asyncio.run(main())
+    assert results == [f"p{i}:abc" for i in range(8)]
+    assert model.calls == 8
+    assert model.peak == 2
+
+
+def test_abandoned_stream_still_holds_permit():
+    model = FakeModel(delay=0.01)
+    model.gate.clear()
+
+    async def main():
+        client = LLMClient(model, ttl=60, max_concurrency=1)
+        agen = client.stream("p0")
+        assert await agen.__anext__() == "p0:"
+        await agen.aclose()             # client rời đi, thread sinh chunk vẫn chạy
+        other = asyncio.ensure_future(client.generate("p1"))
+        await asyncio.sleep(0.05)
+        assert not other.done()         # chờ permit của stream cũ
+        model.gate.set()
+        return await other, await client.generate("p0")
+
+    assert asyncio.run(main()) == ("p1:abc", "p0:abc")
+    assert model.peak == 1 and model.calls == 2
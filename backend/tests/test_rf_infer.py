@@ -0,0 +1,57 @@
+# tests/test_rf_infer.py
+
+from __future__ import annotations
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from app.rf_infer import predict_positive, score_workers
+
+# =========================================================
+# Chấm theo chunk trên process pool phải trùng khớp chấm tuần tự
+# (cùng model, cùng thứ tự dòng, kể cả chunk cuối lẻ). Model n_jobs > 1 cộng
+# xác suất các cây theo thứ tự thread → chỉ lệch ở mức ULP.
+# =========================================================
+
+
+@pytest.fixture(scope="module", params=[1, 2], ids=["n_jobs=1", "n_jobs=2"])
+def model_and_x(request):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2_500, 6))
+    y = (X[:, 0] + 0.5 * X[:, 1] + rng.normal(scale=0.5, size=len(X)) > 0).astype(int)
+    model = RandomForestClassifier(n_estimators=12, min_samples_leaf=3, random_state=0, n_jobs=request.param).fit(X, y)
+    return model, rng.normal(size=(1_037, 6))
+
+
+def test_default_is_sequential(monkeypatch):
+    monkeypatch.delenv("RISK_SCORE_WORKERS", raising=False)
+    assert score_workers() == 1
+    monkeypatch.setenv("RISK_SCORE_WORKERS", "3")
+    assert score_workers() == 3
+
+
+def _assert_same(model, a, b):
+    if model.n_jobs == 1:
+        np.testing.assert_array_equal(a, b)
+    else:
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=0)
+
+
+def test_pool_matches_sequential(model_and_x):
+    model, X = model_and_x
+    n_jobs = model.n_jobs
+    ref = model.predict_proba(X.astype(np.float32))[:, 1]
+    seq = predict_positive(model, X, chunk=100, workers=1)
+    pool = predict_positive(model, X, chunk=100, workers=3)
+    _assert_same(model, seq, ref)
+    _assert_same(model, pool, seq)
+    assert model.n_jobs == n_jobs    # worker không đổi n_jobs của model ở process cha
+
+
+def test_single_chunk_and_empty(model_and_x):
+    model, X = model_and_x
+    _assert_same(
+        model, predict_positive(model, X, chunk=len(X), workers=4), predict_positive(model, X, chunk=64, workers=1)
+    )
+    assert predict_positive(model, X[:0], workers=4).shape == (0,)
@@ -0,0 +1,128 @@
+# tests/test_risk_alerts.py
+
+from __future__ import annotations
+
+import asyncio
+
+import pandas as pd
+import pytest
+
+from app.risk_alerts import AlertFeed, Watch
+from app.risk_engine import EngineWarming, _SCORE_LISTENERS, _notify_scores
+from app.score_index import ScoreIndex
+
+# =========================================================
+# AlertFeed nhận 2 thế hệ bảng scores qua hook on_scores_changed (như
+# _set_scores của engine, gọi từ thread khác) → mỗi subscriber chỉ nhận
+# delta so với thế hệ trước, đã lọc theo watchlist của mình.
+# =========================================================
+GEN1 = {
+    "2024-06-03": {"AAA": 7.0, "BBB": 8.4, "CCC": 2.0, "DDD": 8.0},
+    "2024-06-04": {"AAA": 9.0, "BBB": 8.5, "CCC": 3.0, "DDD": 8.1},
+}
+# phiên mới: AAA hạ nhiệt, CCC + EEE vào tập alert, DDD không có dòng (ngừng giao dịch)
+GEN2 = {**GEN1, "2024-06-05": {"AAA": 2.0, "BBB": 9.1, "CCC": 8.2, "EEE": 9.5}}
+
+
+def _scores(days: dict[str, dict[str, float]]) -> pd.DataFrame:
+    df = pd.DataFrame(
+        [(pd.Timestamp(d), t, r, 10.0, 1e5) for d, rows in days.items() for t, r in rows.items()],
+        columns=["date", "ticker", "risk_0_10", "close", "volume"],
+    )
+    return df.sort_values(["date", "risk_0_10"], ascending=[True, False]).reset_index(drop=True)
+
+
+class FakeEngine:
+    """Phần engine mà AlertFeed dùng: index + generation, báo đổi qua hook như _set_scores."""
+
+    def __init__(self):
+        self.index: ScoreIndex | None = None
+        self.generation = 0
+
+    def set_scores(self, days: dict[str, dict[str, float]]) -> None:
+        self.index = ScoreIndex(_scores(days))
+        self.generation += 1
+        _notify_scores(self)
+
+
+async def _next(q: asyncio.Queue) -> dict:
+    return await asyncio.wait_for(q.get(), timeout=2)
+
+
+def _run_feed(max_age: int, steps) -> list[dict]:
+    """Chạy feed, áp lần lượt các thế hệ scores (từ thread khác) → các message đã publish."""
+    holder: dict[str, FakeEngine] = {}
+
+    def engine() -> FakeEngine:
+        if "eng" not in holder:
+            raise EngineWarming("warming")
+        return holder["eng"]
+
+    async def main() -> list[dict]:
+        feed = AlertFeed(engine, None, max_age=max_age)
+        q = feed.hub.subscribe()
+        task = asyncio.create_task(feed.run())
+        await asyncio.sleep(0.05)          # feed chạy khi engine chưa có → không publish gì
+        assert q.empty()
+        eng = holder["eng"] = FakeEngine()
+        out = []
+        for days in steps:
+            await asyncio.to_thread(eng.set_scores, days)
+            out.append(await _next(q))
+        await asyncio.to_thread(_notify_scores, eng)   # báo lại cùng thế hệ → không có delta mới
+        await asyncio.sleep(0.05)
+        assert q.empty()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return out
+
+    n_listeners = len(_SCORE_LISTENERS)
+    msgs = asyncio.run(main())
+    assert len(_SCORE_LISTENERS) == n_listeners    # feed dừng thì huỷ đăng ký listener
+    return msgs
+
+
+def _tickers(msg: dict | None) -> tuple[list[str], list[str]] | None:
+    if msg is None:
+        return None
+    return [a["ticker"] for a in msg["added"]], msg["cleared"]
+
+
+def test_generations_publish_deltas():
+    first, second = _run_feed(0, [GEN1, GEN2])
+    assert first["type"] == "delta" and first["source"] == "eod" and first["as_of"] == "2024-06-04"
+    assert _tickers(first) == (["AAA", "BBB", "DDD"], [])
+    assert second["as_of"] == "2024-06-05"
+    assert _tickers(second) == (["CCC", "EEE"], ["AAA", "DDD"])
+    assert {a["ticker"]: a["risk_0_10"] for a in second["added"]} == {"CCC": 8.2, "EEE": 9.5}
+
+
+def test_subscriber_gets_only_its_watchlist():
+    first, second = _run_feed(0, [GEN1, GEN2])
+    watch = Watch(["AAA", "CCC"])
+    assert _tickers(watch.select(first)) == (["AAA"], [])
+    assert _tickers(watch.select(second)) == (["CCC"], ["AAA"])
+
+    only_ddd = Watch(["DDD"])
+    assert _tickers(only_ddd.select(first)) == (["DDD"], [])
+    assert _tickers(only_ddd.select(second)) == ([], ["DDD"])
+
+    assert Watch(["ZZZ"]).select(first) is None and Watch(["ZZZ"]).select(second) is None
+    assert Watch(["AAA"], sources=("live",)).select(second) is None
+    assert Watch().select(second) is second
+
+
+def test_watch_update_from_client():
+    _, second = _run_feed(0, [GEN1, GEN2])
+    watch = Watch()
+    watch.update('{"watch": ["eee", " bbb "]}')
+    assert _tickers(watch.select(second)) == (["EEE"], [])
+    watch.update('{"watch": null}')
+    assert _tickers(watch.select(second)) == (["CCC", "EEE"], ["AAA", "DDD"])
+
+
+def test_max_age_keeps_lagging_ticker():
+    _, second = _run_feed(1, [GEN1, GEN2])
+    # DDD chỉ trễ 1 phiên → vẫn trong tập alert
+    assert _tickers(second) == (["CCC", "EEE"], ["AAA"])
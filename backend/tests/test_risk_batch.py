@@ -0,0 +1,99 @@
+# tests/test_risk_batch.py
+
+from __future__ import annotations
+
+import pytest
+
+# =========================================================
+# /api/risk/score:batch và /api/risk/history:batch (payload dạng cột) phải
+# khớp từng dòng với /api/risk/score và /api/risk/history gọi theo từng mã.
+# =========================================================
+
+
+@pytest.fixture(scope="module")
+def client(api, engine):
+    return api[1]
+
+
+@pytest.fixture(scope="module")
+def tickers(engine) -> list[str]:
+    return sorted(str(t) for t in engine.index.ticker_names)[:6]
+
+
+def _rows(payload: dict, keys: list[str]) -> dict[str, dict]:
+    return {t: {k: payload[k][j] for k in keys} for j, t in enumerate(payload["ticker"])}
+
+
+@pytest.mark.parametrize("when", ["latest", "mid", "before"])
+def test_score_batch_matches_single(client, engine, tickers, when):
+    mid = str(engine.scores["date"].iloc[len(engine.scores) // 2].date())
+    date = {"latest": None, "mid": mid, "before": "2000-01-01"}[when]
+    req = [tickers[0].lower(), *tickers, " " + tickers[1], "ZZZZ"]
+    r = client.post("/api/risk/score:batch", json={"tickers": req, "date": date})
+    assert r.status_code == 200
+    batch = r.json()
+    assert batch["date"] == date
+    # chuẩn hoá (hoa, bỏ khoảng trắng) + bỏ trùng, giữ thứ tự lần đầu
+    if when == "before":
+        assert batch["ticker"] == [] and batch["missing"] == [*tickers, "ZZZZ"]
+    else:
+        assert batch["ticker"] == tickers and batch["missing"] == ["ZZZZ"]
+
+    got = _rows(batch, ["as_of", "risk_0_10", "alert", "close", "volume", "turnover", "mkt_cap"])
+    for t in [*tickers, "ZZZZ"]:
+        params = {"ticker": t} if date is None else {"ticker": t, "date": date}
+        one = client.get("/api/risk/score", params=params).json()
+        if t not in got:
+            assert one["message"] in ("No data", "No data at selected date")
+            continue
+        assert got[t] == {
+            "as_of": one["date"], "risk_0_10": one["risk_0_10"], "alert": one["alert"], **one["context"],
+        }
+
+
+@pytest.mark.parametrize("days", [1, 30, 1000])
+def test_history_batch_matches_single(client, tickers, days):
+    req = [*tickers, "ZZZZ", tickers[0]]
+    r = client.post("/api/risk/history:batch", json={"tickers": req, "days": days})
+    assert r.status_code == 200
+    batch = r.json()
+    assert batch["ticker"] == [*tickers, "ZZZZ"]
+    off = batch["offsets"]
+    assert len(off) == len(batch["ticker"]) + 1 and off[0] == 0 and off[-1] == len(batch["date"])
+    for j, t in enumerate(batch["ticker"]):
+        one = client.get("/api/risk/history", params={"ticker": t, "days": days}).json()["history"]
+        sl = slice(off[j], off[j + 1])
+        assert [{"date": d, "risk_0_10": x} for d, x in zip(batch["date"][sl], batch["risk_0_10"][sl])] == one
+        if t == "ZZZZ":
+            assert one == []
+
+
+def test_history_batch_date_range(client, tickers):
+    full = {t: client.get("/api/risk/history", params={"ticker": t, "days": 1000}).json()["history"] for t in tickers}
+    start, end = "2024-03-01", "2024-06-30"
+    batch = client.post("/api/risk/history:batch", json={"tickers": tickers, "start": start, "end": end}).json()
+    off = batch["offsets"]
+    for j, t in enumerate(tickers):
+        want = [h for h in full[t] if start <= h["date"] <= end]
+        assert want
+        assert batch["date"][off[j]:off[j + 1]] == [h["date"] for h in want]
+        assert batch["risk_0_10"][off[j]:off[j + 1]] == [h["risk_0_10"] for h in want]
+
+
+def test_history_batch_defaults_to_180_days(client, tickers):
+    batch = client.post("/api/risk/history:batch", json={"tickers": tickers[:1]}).json()
+    one = client.get("/api/risk/history", params={"ticker": tickers[0]}).json()["history"]
+    assert batch["date"] == [h["date"] for h in one] and len(one) == 180
+
+
+def test_unknown_only(client):
+    s = client.post("/api/risk/score:batch", json={"tickers": ["ZZZZ", "yyyy"]}).json()
+    assert s["ticker"] == [] and s["risk_0_10"] == [] and s["missing"] == ["ZZZZ", "YYYY"]
+    h = client.post("/api/risk/history:batch", json={"tickers": ["ZZZZ"]}).json()
+    assert h == {"ticker": ["ZZZZ"], "offsets": [0, 0], "date": [], "risk_0_10": []}
+
+
+@pytest.mark.parametrize("path", ["/api/risk/score:batch", "/api/risk/history:batch"])
+def test_empty_list_rejected(client, path):
+    assert client.post(path, json={"tickers": []}).status_code == 422
+    assert client.post(path, json={}).status_code == 422
@@ -0,0 +1,93 @@
+# tests/test_risk_live.py
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.risk_engine import BEHAVIOR_FEATURES, build_features
+from app.risk_live import LiveRiskState
+
+from test_features_parity import raw_panel
+
+# =========================================================
+# Trạng thái live cập nhật O(1) / bar phải cho cùng feature với
+# build_features trên panel đầy đủ (kể cả xếp hạng chéo của phiên):
+# seed bằng các phiên đã chốt, phát lại 2 phiên cuối dưới dạng nhiều bar
+# intraday (phiên D-1 tự chốt khi bar đầu của phiên D tới). 1 mã chỉ có
+# bar phiên D-1 → không được xếp hạng / chấm cùng phiên D.
+# =========================================================
+N_BARS = 4
+RTOL = 2e-6
+
+
+def _bars(row, n: int = N_BARS) -> list[tuple]:
+    """Tách 1 phiên OHLCV thành n bar: gộp lại (open đầu, high/low cực trị, close cuối, volume cộng) = phiên."""
+    day = pd.Timestamp(row.date).value
+    closes = np.linspace(row.open, row.close, n + 1)[1:]
+    vols = np.full(n, row.volume / n)
+    vols[-1] = row.volume - vols[:-1].sum()
+    out = []
+    for i, (c, v) in enumerate(zip(closes, vols)):
+        o = row.open if i == 0 else closes[i - 1]
+        # cực trị của phiên nằm ở bar 1 / bar 2, các bar khác không vượt ra ngoài
+        h = row.high if i == 1 else min(max(o, c), row.high)
+        lo = row.low if i == 2 else max(min(o, c), row.low)
+        out.append((row.ticker, day + (9 + i) * 3_600 * 10**9, o, h, lo, c, v, None))
+    return out
+
+
+@pytest.fixture(scope="module")
+def replay():
+    panel = raw_panel(n_tickers=40, n_days=60, seed=11)
+    dates = np.sort(panel["date"].unique())
+    d1, d = dates[-2], dates[-1]
+    lagging = panel.loc[panel["date"] == d, "ticker"].iloc[0]        # không có bar phiên D
+
+    state = LiveRiskState(panel[panel["date"] < d1].reset_index(drop=True), pd.Timestamp(dates[-3]).value)
+    for day in (d1, d):
+        rows = panel[panel["date"] == day]
+        if day == d:
+            rows = rows[rows["ticker"] != lagging]
+        for row in rows.itertuples(index=False):
+            for bar in _bars(row):
+                assert state.apply(bar) == "applied"
+
+    full = panel[~((panel["date"] == d) & (panel["ticker"] == lagging))].reset_index(drop=True)
+    feats = build_features(full.copy())
+    last = feats[feats["date"] == d].copy()
+    last["turnover_pct"] = last["turnover"].rank(pct=True)
+    last["mkt_cap_pct"] = last["mkt_cap"].rank(pct=True)
+    return state, last.set_index("ticker"), lagging
+
+
+def test_live_excludes_older_session(replay):
+    state, expected, lagging = replay
+    assert sorted(state.live()) == sorted(expected.index)
+    assert lagging not in state.live()
+
+
+def test_pending_matches_build_features(replay):
+    state, expected, lagging = replay
+    state.dirty.add(lagging)
+    names, X = state.pending()
+    assert lagging not in names
+    want = expected.loc[names, BEHAVIOR_FEATURES].to_numpy(dtype=np.float64)
+    finite = np.isfinite(want).all(axis=1)
+    assert finite.sum() == len(names) and len(names) > 30
+    assert set(expected.index[np.isfinite(expected[BEHAVIOR_FEATURES].to_numpy(dtype=np.float64)).all(axis=1)]) == set(names)
+
+    got = X.astype(np.float64)
+    rel = np.abs(got - want) / np.maximum(np.abs(want), 1e-3)
+    worst = np.unravel_index(np.argmax(rel), rel.shape)
+    assert rel.max() <= RTOL, (BEHAVIOR_FEATURES[worst[1]], names[worst[0]], got[worst], want[worst])
+
+
+def test_scores_ranked_within_newest_session(replay):
+    state, expected, lagging = replay
+    names = list(expected.index)
+    state.scores = {lagging: (0.99, 10.0)}          # điểm cũ của mã còn ở phiên D-1
+    state.set_scores(names, np.linspace(0.1, 0.9, len(names)))
+    assert set(state.scores) == set(names)
+    assert max(x for _, x in state.scores.values()) == 10.0
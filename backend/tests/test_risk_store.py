@@ -0,0 +1,75 @@
+# tests/test_risk_store.py
+
+from __future__ import annotations
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from app.risk_engine import OHLCV_FILE, ManipulationWatchV1, _config_signature, input_paths
+from app.risk_store import RiskArtifactStore, fingerprint
+
+from conftest import make_dataset, train
+
+# =========================================================
+# Artifact của thư mục dữ liệu này không bao giờ được dùng cho thư mục khác:
+# 2 bộ dữ liệu train chung 1 kho artifact, bộ B đổi đầu vào → engine phải
+# chấm tiếp từ artifact của B dù artifact của A ghi sau.
+# =========================================================
+
+
+@pytest.fixture(scope="module")
+def two_dirs(tmp_path_factory):
+    a = make_dataset(tmp_path_factory.mktemp("data_a"), seed=1)
+    b = make_dataset(tmp_path_factory.mktemp("data_b"), seed=2)
+    root = tmp_path_factory.mktemp("artifacts")
+    train(b, root)
+    train(a, root)       # A ghi sau → là artifact "mới nhất" theo mtime
+    keys = {d: fingerprint(input_paths(d), _config_signature()) for d in (a, b)}
+    return a, b, root, keys
+
+
+def _touch(path):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def test_latest_filters_on_data_dir(two_dirs):
+    a, b, root, keys = two_dirs
+    store = RiskArtifactStore(root)
+    assert store.latest(_config_signature()) == keys[a]
+    assert store.latest(_config_signature(), a) == keys[a]
+    assert store.latest(_config_signature(), b) == keys[b]
+    assert store.latest(_config_signature(), root / "other") is None
+
+
+@pytest.mark.parametrize("incremental", [True, False])
+def test_engine_never_reuses_other_data_dir(two_dirs, tmp_path, incremental):
+    a, b, shared, keys = two_dirs
+    root = shutil.copytree(shared, tmp_path / "artifacts")    # copy2 giữ mtime manifest
+    store = RiskArtifactStore(root)
+    _touch(b / OHLCV_FILE)     # fingerprint B đổi → đi nhánh chấm lại từ artifact gần nhất
+    # kho chung: chấm tiếp từ artifact của B, không phải của A (dù A mới hơn)
+    eng = ManipulationWatchV1(data_dir=str(b), artifact_dir=str(root), incremental=incremental)
+    _, _, manifest = store.load(eng.fingerprint)
+    assert manifest["scored_from"] == keys[b]
+    assert manifest["data_dir"] == str(b)
+
+    _, frames_b, _ = store.load(keys[b])
+    ref = frames_b["scores"]
+    got = eng.scores
+    assert len(got) == len(ref)
+    assert (got["ticker"].astype(str).to_numpy() == ref["ticker"].astype(str).to_numpy()).all()
+    np.testing.assert_allclose(got["risk_0_10"].to_numpy(), ref["risk_0_10"].to_numpy())
+
+    _, frames_a, _ = store.load(keys[a])
+    assert not np.array_equal(frames_a["scores"]["risk_0_10"].to_numpy(), got["risk_0_10"].to_numpy())
+
+
+def test_untrained_data_dir_raises(two_dirs, tmp_path):
+    _, _, root, _ = two_dirs
+    c = make_dataset(tmp_path / "data_c", seed=3)
+    with pytest.raises(FileNotFoundError):
+        ManipulationWatchV1(data_dir=str(c), artifact_dir=str(root))
@@ -0,0 +1,116 @@
+# tests/test_screener.py
+
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.screener import MetricPanel, Screener, build_panel, compile_filter
+
+# =========================================================
+# Bộ lọc trên 1 bảng nhỏ biết trước kết quả; biểu thức ngoài tập nút cho
+# phép (gọi hàm, thuộc tính, so sánh chuỗi, tên lạ...) → 422 ở /api/screener.
+# =========================================================
+INDICATORS = pd.DataFrame({
+    "Mã": ["AAA", "AAA", "BBB", "CCC", "DDD"],
+    "Năm": [2023, 2024, 2024, 2024, 2024],
+    "P/E": [10.0, 8.0, np.nan, 15.0, 5.0],
+    "ROE": [12.0, 20.0, 25.0, np.nan, 18.0],
+})
+STOCK_INFO = pd.DataFrame({
+    "ticker": ["AAA", "BBB", "CCC", "DDD"],
+    "sector": ["Banks", "Banks", "Real Estate", "Real Estate"],
+    "exchange": ["HOSE", "HNX", "HOSE", "UPCOM"],
+})
+
+
+@pytest.fixture(scope="module")
+def screener() -> Screener:
+    return Screener(MetricPanel(build_panel({"indicators": INDICATORS}, STOCK_INFO)))
+
+
+@pytest.fixture
+def client(api, screener, monkeypatch):
+    main, client = api
+    monkeypatch.setattr(main.analyzer, "screener", screener)
+    return client
+
+
+def test_known_result(screener):
+    out = screener.screen("pe < 12 and roe > 15", "-roe")
+    assert out["total"] == 2
+    assert out["symbol"] == ["AAA", "DDD"]
+    assert out["pe"] == [8.0, 5.0] and out["roe"] == [20.0, 18.0]
+    assert out["year"] == [2024, 2024]
+
+
+def test_year_and_labels(screener):
+    assert screener.screen("pe > 0", year=2023)["symbol"] == ["AAA"]
+    assert screener.screen('sector == "banks"', "pe")["symbol"] == ["AAA", "BBB"]
+    assert screener.screen('exchange in ("HNX", "UPCOM") and not roe < 20')["symbol"] == ["BBB"]
+    assert screener.screen("pe / roe < 0.5 or -pe < -14")["symbol"] == ["AAA", "CCC", "DDD"]
+
+
+@pytest.mark.parametrize("sort, expected", [
+    ("pe", ["DDD", "AAA", "CCC", "BBB"]),
+    ("-pe", ["CCC", "AAA", "DDD", "BBB"]),
+    ("roe desc", ["BBB", "AAA", "DDD", "CCC"]),
+    ("roe asc", ["DDD", "AAA", "BBB", "CCC"]),
+])
+def test_nan_sorts_last(screener, sort, expected):
+    out = screener.screen(sort=sort)
+    assert out["symbol"] == expected
+
+
+def test_nan_never_matches(screener):
+    assert screener.screen("pe > 0")["symbol"] == ["AAA", "CCC", "DDD"]
+    assert screener.screen("roe == roe")["symbol"] == ["AAA", "BBB", "DDD"]
+
+
+def test_long_filter_within_limit(screener):
+    assert screener.screen(" + ".join(["pe"] * 100) + " < 1000")["symbol"] == ["AAA", "DDD"]
+
+
+def test_compile_cached():
+    assert compile_filter("pe < 10") is compile_filter("pe < 10")
+
+
+def test_endpoint_ok(client):
+    r = client.get("/api/screener", params={"filter": "pe < 12 and roe > 15", "sort": "-roe", "fields": "pe,roe"})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["symbol"] == ["AAA", "DDD"] and body["roe"] == [20.0, 18.0]
+
+
+@pytest.mark.parametrize("expr", [
+    "__import__('os').system('true')",
+    "__import__",
+    "pe.real > 1",
+    "pe.__class__ > 1",
+    "abs(pe) > 1",
+    "(lambda: 1)() > 0",
+    "pe[0] > 1",
+    'pe > "10"',
+    '"a" < "b"',
+    'sector > "Banks"',
+    "sector == 1",
+    "pe in (1, 2)",
+    "pe is None",
+    "pe ** 2 > 1",
+    "True",
+    "pe <",
+    "foo > 1",
+    "pe < sector_foo",
+    " + ".join(["pe"] * 1000) + " > 1",
+    "-" * 5000 + "pe > 1",
+], ids=lambda e: e if len(e) < 40 else f"long{len(e)}")
+def test_rejected_filters(client, expr):
+    r = client.get("/api/screener", params={"filter": expr})
+    assert r.status_code == 422, r.text
+    assert r.json()["detail"]
+
+
+def test_unknown_sort_key(client):
+    assert client.get("/api/screener", params={"sort": "-foo"}).status_code == 422
+    assert client.get("/api/screener", params={"sort": "pe sideways"}).status_code == 422
@@ -1,5 +1,5 @@
 // components/pages/analysis/AiTab.tsx
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from "@/components/ui/card";
 import { Button } from "@/components/ui/button";
 import { Alert, AlertDescription } from "@/components/ui/alert";
@@ -83,6 +83,20 @@ const renderTextWithBold = (text: string) => {
     return <span key={idx}>{part}</span>;
   });
 };
+// Nhãn cho event "metrics" (dict chỉ số gửi trước câu trả lời của AI)
+const METRIC_GROUPS: Record<string, string> = {
+  valuation: 'Định giá',
+  growth: 'Tăng trưởng',
+  performance: 'Hiệu quả',
+  financial_health: 'Sức khỏe tài chính',
+  dividend: 'Cổ tức'
+};
+
+const formatMetric = (value: unknown) =>
+  typeof value === 'number' && Number.isFinite(value)
+    ? value.toLocaleString('vi-VN', { maximumFractionDigits: 2 })
+    : '—';
+
 interface AiTabProps {
   selectedSymbol?: string;
   cachedAnalysis?: {
@@ -97,50 +111,95 @@ export default function AiTab({ selectedSymbol }: { selectedSymbol?: string }) {
   const [answer, setAnswer] = useState<string>("");
   const [loading, setLoading] = useState(false);
   const [err, setErr] = useState<string>("");
+  const [metrics, setMetrics] = useState<Record<string, Record<string, unknown>> | null>(null);
+  // stream đang đọc: đổi mã thì huỷ để câu trả lời cũ không ghi đè câu trả lời mới
+  const runRef = useRef<{ symbol: string; controller: AbortController } | null>(null);
 
   useEffect(() => {
     if (selectedSymbol) {
-      setSymbol(selectedSymbol.toUpperCase().trim());
+      const next = selectedSymbol.toUpperCase().trim();
+      setSymbol(next);
       // Auto-run analysis when symbol is provided
-      if (selectedSymbol && !answer) {
-        runDiagnosis();
-      }
+      runDiagnosis(next);
     }
   }, [selectedSymbol]);
 
-  async function runDiagnosis() {
+  useEffect(() => {
+    const run = runRef.current;
+    if (run && run.symbol !== symbol) run.controller.abort();
+  }, [symbol]);
+
+  useEffect(() => () => runRef.current?.controller.abort(), []);
+
+  async function runDiagnosis(target: string = symbol) {
+    runRef.current?.controller.abort();
+    const controller = new AbortController();
+    runRef.current = { symbol: target, controller };
     try {
       setErr("");
       setAnswer("");
-      if (!symbol) { 
+      setMetrics(null);
+      if (!target) { 
         setErr("Vui lòng nhập mã cổ phiếu."); 
         return; 
       }
 
       setLoading(true);
-      const res = await fetch("http://localhost:8000/api/ai/diagnose", {
+      // Bản streaming (SSE): hiển thị câu trả lời ngay khi Gemini sinh ra từng đoạn
+      const res = await fetch("http://localhost:8000/api/ai/diagnose/stream", {
         method: "POST",
         headers: { 
           "Content-Type": "application/json",
-          "Accept": "application/json"
+          "Accept": "text/event-stream"
         },
-        body: JSON.stringify({ symbol }),
+        body: JSON.stringify({ symbol: target }),
         mode: "cors",
+        signal: controller.signal,
       }).catch(error => {
+        if (controller.signal.aborted) throw error;
         throw new Error("Không thể kết nối đến server. Vui lòng kiểm tra backend có đang chạy không.");
       });
       
-      if (!res.ok) {
+      if (!res.ok || !res.body) {
         const errorText = await res.text().catch(() => `API Error ${res.status}`);
         throw new Error(errorText);
       }
       
-      const json = await res.json();
-      setAnswer(json?.answer || "Không nhận được câu trả lời từ AI.");
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let full = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop() || "";
+        for (const raw of events) {
+          const event = raw.match(/^event: (.*)$/m)?.[1];
+          const data = raw.match(/^data: (.*)$/m)?.[1];
+          if (!event || !data) continue;
+          const payload = JSON.parse(data);
+          if (event === "metrics") {
+            // chỉ số có ngay, trước khi Gemini trả đoạn đầu tiên
+            setMetrics(payload);
+          } else if (event === "chunk") {
+            full += payload.text;
+            setAnswer(full);
+          } else if (event === "error") {
+            throw new Error(payload.detail || "Lỗi khi gọi AI.");
+          }
+        }
+      }
+      if (!full) setAnswer("Không nhận được câu trả lời từ AI.");
     } catch (e: any) {
+      if (controller.signal.aborted) return;
       setErr(e?.message || "Lỗi khi gọi AI.");
     } finally {
-      setLoading(false);
+      if (runRef.current?.controller === controller) {
+        runRef.current = null;
+        setLoading(false);
+      }
     }
   }
 
@@ -218,7 +277,7 @@ export default function AiTab({ selectedSymbol }: { selectedSymbol?: string }) {
             
             <Button
               type="button"
-              onClick={runDiagnosis}
+              onClick={() => runDiagnosis()}
               disabled={!symbol || loading}
               className="h-11 px-6 bg-gradient-to-r from-purple-500 to-pink-500 hover:from-purple-600 hover:to-pink-600 text-white font-medium transition-all shadow-lg shadow-purple-500/25"
             >
@@ -248,8 +307,37 @@ export default function AiTab({ selectedSymbol }: { selectedSymbol?: string }) {
         </CardContent>
       </Card>
 
+      {/* Metrics (event "metrics" của stream, hiển thị trước phần phân tích) */}
+      {metrics && (
+        <Card className="border border-slate-700 bg-slate-900/50">
+          <CardHeader className="pb-3">
+            <CardTitle className="text-sm font-semibold text-slate-400 uppercase tracking-wider flex items-center gap-2">
+              <TrendingUp className="h-4 w-4" />
+              Chỉ số đầu vào - {symbol}
+            </CardTitle>
+          </CardHeader>
+          <CardContent>
+            <div className="grid grid-cols-1 md:grid-cols-3 lg:grid-cols-5 gap-3">
+              {Object.entries(metrics).map(([group, values]) => (
+                <div key={group} className="p-3 rounded-lg bg-slate-800/40 border border-slate-700/50">
+                  <p className="text-xs text-purple-400 font-semibold mb-2">{METRIC_GROUPS[group] || group}</p>
+                  <div className="space-y-1">
+                    {Object.entries(values).map(([name, value]) => (
+                      <div key={name} className="flex justify-between gap-2 text-xs">
+                        <span className="text-slate-400">{name}</span>
+                        <span className="font-semibold text-slate-200">{formatMetric(value)}</span>
+                      </div>
+                    ))}
+                  </div>
+                </div>
+              ))}
+            </div>
+          </CardContent>
+        </Card>
+      )}
+
       {/* Loading State */}
-      {loading && (
+      {loading && !answer && (
         <Card className="border border-slate-700 bg-slate-900/50">
           <CardContent className="py-12">
             <div className="flex flex-col items-center justify-center space-y-4">
@@ -272,7 +360,7 @@ export default function AiTab({ selectedSymbol }: { selectedSymbol?: string }) {
       
       {/* Empty State */}
       {/* Results - Professional Markdown Layout */}
-      {!loading && answer && (
+      {answer && (
         <div className="space-y-6">
           {/* Summary Card */}
           <Card className="border border-emerald-700/50 bg-gradient-to-br from-slate-800/90 to-slate-900/90">